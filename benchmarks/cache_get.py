@@ -0,0 +1,73 @@
+"""Latency of cache hits.
+
+Usage::
+
+    python benchmarks/cache_get.py [--repeat N]
+
+Measures :meth:`Cache.get` hits on a memory store, and encoding and decoding
+of entries for remote stores.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+from json import dumps, loads
+from timeit import repeat
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stormpath.cache.cache import Cache  # noqa
+from stormpath.cache.entry import CacheEntry  # noqa
+
+
+ACCOUNT = {
+    'href': 'https://api.stormpath.com/v1/accounts/3apenYvL0Z9v9spdzpFfey',
+    'username': 'randall',
+    'email': 'randall@example.com',
+    'givenName': 'Randall',
+    'surname': 'Degges',
+    'status': 'ENABLED',
+    'createdAt': '2015-12-01T00:00:00.000Z',
+    'modifiedAt': '2015-12-01T00:00:00.000Z',
+    'customData': {'href': 'https://api.stormpath.com/v1/accounts/3apenYvL0Z9v9spdzpFfey/customData'},
+    'directory': {'href': 'https://api.stormpath.com/v1/directories/2SKhstu8PlaekcaEXampLE'},
+}
+
+
+def measure(stmt, number, times):
+    return min(repeat(stmt, number=number, repeat=times)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cache = Cache()
+    cache.put(ACCOUNT['href'], ACCOUNT)
+    entry = CacheEntry(ACCOUNT)
+
+    if hasattr(entry, 'encode'):
+        encode = entry.encode
+        decode = CacheEntry.decode
+    else:
+        encode = lambda: dumps(entry.to_dict()).encode('utf-8')
+        decode = lambda data: CacheEntry.parse(loads(data.decode('utf-8')))
+
+    data = encode()
+
+    results = [
+        ('Cache.get (hit)', lambda: cache.get(ACCOUNT['href']), 100000),
+        ('CacheEntry.is_expired', lambda: entry.is_expired(300, 300), 100000),
+        ('encode', encode, 20000),
+        ('decode', lambda: decode(data), 20000),
+    ]
+
+    for name, stmt, number in results:
+        print('%-24s %8.2f us' % (name, measure(stmt, number, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
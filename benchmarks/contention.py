@@ -0,0 +1,68 @@
+"""Throughput of the memory stores under concurrent use.
+
+Usage::
+
+    python benchmarks/contention.py [--threads N] [--operations N]
+
+Each thread reads and writes keys from a shared key space (90% reads), the
+way request threads share one ``Client``, against a :class:`Cache` backed
+by a :class:`MemoryStore` and by :class:`ShardedMemoryStore` with several
+shard counts.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+from random import Random
+from threading import Thread
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stormpath.cache.cache import Cache  # noqa
+from stormpath.cache.memory_store import MemoryStore, ShardedMemoryStore  # noqa
+
+
+def worker(cache, keys, operations, seed):
+    rand = Random(seed)
+
+    for _ in range(operations):
+        key = keys[rand.randrange(len(keys))]
+        if rand.random() < 0.9:
+            cache.get(key)
+        else:
+            cache.put(key, {'href': key})
+
+
+def run(cache, threads, operations):
+    keys = ['https://api.stormpath.com/v1/accounts/%d' % i for i in range(5000)]
+    workers = [Thread(target=worker, args=(cache, keys, operations, i)) for i in range(threads)]
+
+    started_at = time()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    return threads * operations / (time() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--operations', type=int, default=20000)
+    args = parser.parse_args()
+
+    stores = [('MemoryStore', MemoryStore, {})] + [
+        ('ShardedMemoryStore(%d)' % n, ShardedMemoryStore, {'shards': n}) for n in (4, 16, 64)]
+
+    for name, store, opts in stores:
+        cache = Cache(store=store, store_opts=dict(opts, max_entries=2000))
+        ops = run(cache, args.threads, args.operations)
+        print('%-24s %10.0f ops/s  %s' % (name, ops, cache.stats.summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Hit ratios of the memory store eviction policies on synthetic traces.
+
+Usage::
+
+    python benchmarks/eviction.py [--requests N] [--keys N] [--seed N]
+
+Two traces are simulated for each cache size:
+
+- ``zipf``: keys drawn from a Zipfian distribution (s = 0.9), like lookups
+  of a population of accounts where a few are very active,
+- ``zipf+scan``: the same, interleaved with long scans of keys that are
+  never read again, like paging through all accounts of a directory.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+from bisect import bisect
+from random import Random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stormpath.cache.memory_store import MemoryStore  # noqa
+
+
+def zipf_trace(requests, keys, s, rand):
+    weights = [1.0 / (i ** s) for i in range(1, keys + 1)]
+    total = sum(weights)
+
+    cumulative = []
+    acc = 0
+    for w in weights:
+        acc += w / total
+        cumulative.append(acc)
+
+    return [min(bisect(cumulative, rand.random()), keys - 1) for _ in range(requests)]
+
+
+def scan_trace(requests, keys, s, rand, scan_every=5000, scan_length=2000):
+    trace = zipf_trace(requests, keys, s, rand)
+    result = []
+    next_scan_key = keys
+
+    for i, key in enumerate(trace):
+        result.append(key)
+
+        if i and i % scan_every == 0:
+            result.extend(range(next_scan_key, next_scan_key + scan_length))
+            next_scan_key += scan_length
+
+    return result
+
+
+def hit_ratio(eviction, max_entries, trace):
+    store = MemoryStore(max_entries=max_entries, eviction=eviction)
+    hits = 0
+
+    for key in trace:
+        if store[key] is None:
+            store[key] = key
+        else:
+            hits += 1
+
+    return float(hits) / len(trace)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--keys', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    traces = [
+        ('zipf', zipf_trace(args.requests, args.keys, 0.9, Random(args.seed))),
+        ('zipf+scan', scan_trace(args.requests, args.keys, 0.9, Random(args.seed))),
+    ]
+    policies = sorted(MemoryStore.EVICTION_POLICIES)
+
+    print('%-10s %8s  %s' % ('trace', 'entries', '  '.join('%8s' % p for p in policies)))
+
+    for name, trace in traces:
+        for max_entries in (500, 1000, 5000):
+            ratios = [hit_ratio(eviction, max_entries, trace) for eviction in policies]
+            print('%-10s %8d  %s' % (name, max_entries, '  '.join('%7.2f%%' % (r * 100) for r in ratios)))
+
+
+if __name__ == '__main__':
+    main()
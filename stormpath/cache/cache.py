@@ -1,9 +1,25 @@
 """Cache abstractions."""
 
 
+from random import random
+from time import time
+
 from .entry import CacheEntry
-from .memory_store import MemoryStore
+from .memcached_store import MemcachedStore
+from .memory_store import MemoryStore, ShardedMemoryStore
+from .redis_store import RedisStore
+from .revalidator import Revalidator
 from .stats import CacheStats
+from .sweeper import ExpirySweeper
+
+
+def _contains(store, key):
+    """Whether `store` has an entry for `key`, without reading it if the
+    store supports checking for it (custom stores may not)."""
+    if hasattr(store, '__contains__'):
+        return key in store
+
+    return store[key] is not None
 
 
 class Cache(object):
@@ -13,31 +29,96 @@ class Cache(object):
     :class:`stormpath.cache.memory_store.MemoryStore`.
     It also provides usage statistics with
     :class:`stormpath.cache.stats.CacheStats`.
+
+    Expired entries can be served for a while longer (stale-while-revalidate):
+    if ``stale_while_revalidate`` is set, an entry that expired less than that
+    many seconds ago is still returned, while a background thread refreshes
+    it. ``max_stale`` is a hard limit on how long after expiring an entry may
+    be served; it defaults to ``stale_while_revalidate``.
+
+    To keep entries that were put into the cache at the same time from
+    expiring at the same time, ``ttl_jitter`` shortens the TTL of each entry
+    by a random fraction of up to that much (e.g. 0.1 for up to 10%), and
+    ``early_expiration`` makes entries expire a bit early with a probability
+    that grows as they approach expiration and with how long they took to
+    fetch (1 is a good starting point, 0 disables it).
+
+    Redis and Memcached stores keep track of when entries were last read
+    themselves (see their ``tti`` option), since the cache only gets a copy
+    of the entries. They keep entries for ``max_stale`` seconds past their
+    TTL and TTI, like memory stores.
+
+    Memory stores don't expire entries on their own, so every :meth:`put`
+    also removes up to ``SWEEP_BATCH`` entries that can no longer be served
+    (see :meth:`sweep`), unless ``sweep`` is False. Otherwise, entries that
+    aren't read again would only go once they're evicted.
     """
     DEFAULT_STORE = MemoryStore
+    MEMORY_STORES = (MemoryStore, ShardedMemoryStore)
     DEFAULT_TTL = 5 * 60  # seconds
     DEFAULT_TTI = 5 * 60  # seconds
+    DEFAULT_STALE_WHILE_REVALIDATE = 0  # seconds
+    SWEEP_BATCH = 10
 
     def __init__(self, store=DEFAULT_STORE, ttl=DEFAULT_TTL, tti=DEFAULT_TTI,
-            **kwargs):
+            stale_while_revalidate=DEFAULT_STALE_WHILE_REVALIDATE,
+            max_stale=None, ttl_jitter=0, early_expiration=0, sweep=True, **kwargs):
         self.ttl = ttl
         self.tti = tti
+        self.ttl_jitter = ttl_jitter
+        self.early_expiration = early_expiration
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_stale = stale_while_revalidate if max_stale is None else max_stale
         store_opts = kwargs.get('store_opts', {})
 
-        # Pass along max entries only to memory store instances.
-        if store != MemoryStore:
-            store_opts.pop('max_entries', None)
+        # Pass along max entries, eviction policy and memory limits only to
+        # memory store instances.
+        if store not in self.MEMORY_STORES:
+            for option in ('max_entries', 'eviction', 'max_bytes', 'budget', 'shards'):
+                store_opts.pop(option, None)
+
+        # Remote stores expire entries on their own, so they need to keep
+        # them around for long enough to be served stale.
+        if store in (RedisStore, MemcachedStore) and self.max_stale and \
+                'ttl' not in store_opts:
+            store_opts['ttl'] = ttl + self.max_stale
+
+        if store in (RedisStore, MemcachedStore) and tti:
+            store_opts.setdefault('tti', tti + self.max_stale)
 
         self.store = store(**store_opts)
+
+        self.sweeper = None
+        if sweep and isinstance(self.store, self.MEMORY_STORES):
+            self.sweeper = ExpirySweeper()
+            self.store.on_evict = self.sweeper.unschedule
         self.stats = CacheStats()
+        self.revalidator = Revalidator()
+
+    def get(self, key, revalidate=None):
+        """Return the cached value of `key`, or None.
 
-    def get(self, key):
+        :param revalidate: (optional) A function that refreshes `key`. If
+            given, an expired entry within the stale-while-revalidate window
+            is returned and `revalidate` is called on a background thread.
+        """
         entry = self.store[key]
 
         if entry:
-            if entry.is_expired(self.ttl, self.tti):
+            if entry.is_expired(self.ttl, self.tti, self.early_expiration):
+                stale_for = entry.stale_for(self.ttl, self.tti) if self.max_stale else None
+
+                if revalidate is not None and stale_for is not None and \
+                        stale_for <= min(self.stale_while_revalidate, self.max_stale):
+                    self.stats.stale_hit(revalidating=self.revalidator.submit(key, revalidate))
+                    return entry.value
+
                 self.stats.miss(expired=True)
-                del self.store[key]
+
+                # Keep stale entries around until they're past max stale.
+                if stale_for is None or stale_for > self.max_stale:
+                    del self.store[key]
+                    self._unschedule(key)
 
                 return None
 
@@ -49,18 +130,200 @@ class Cache(object):
         self.stats.miss()
         return None
 
-    def put(self, key, value, new=True):
-        self.store[key] = CacheEntry(value)
+    def get_stale(self, key):
+        """Return the cached value of `key` even if it has expired, as long
+        as it expired less than ``max_stale`` seconds ago, or None.
+
+        This is used to keep serving reads while the Stormpath API is
+        unavailable.
+        """
+        entry = self.store[key]
+
+        if entry is None or not self.is_servable(entry):
+            return None
+
+        self.stats.stale_hit(revalidating=False)
+        return entry.value
+
+    def put(self, key, value, new=True, cost=None):
+        """Put `value` into the cache.
+
+        :param cost: (optional) Number of seconds it took to fetch `value`.
+        """
+        entry = CacheEntry(value)
+
+        if self.ttl_jitter:
+            entry.ttl = self.ttl * (1 - random() * self.ttl_jitter)
+
+        if cost is not None:
+            entry.cost = cost
+
+        self._put(key, entry, new)
+
+    def restore(self, key, entry):
+        """Put `entry` (e.g. loaded from a snapshot) into the cache as it
+        is, unless it can't be served anymore.
+
+        :returns: Whether the entry was put into the cache.
+        """
+        if not self.is_servable(entry):
+            return False
+
+        self._put(key, entry, True)
+        return True
+
+    def _put(self, key, entry, new):
+        # Scheduled first, so it's unscheduled if the store doesn't keep it.
+        if self.sweeper is not None:
+            self._schedule(key, entry)
+
+        self.store[key] = entry
         self.stats.put(new=new)
 
+        if self.sweeper is not None:
+            self.sweep()
+
+    def _schedule(self, key, entry):
+        self.sweeper.schedule(key, entry.expires_at(self.ttl, self.tti) + self.max_stale)
+
+    def _unschedule(self, key):
+        if self.sweeper is not None:
+            self.sweeper.unschedule(key)
+
+    def sweep(self, limit=SWEEP_BATCH):
+        """Remove up to `limit` entries that can no longer be served, not
+        even stale, and return how many were removed.
+
+        Entries which were read or replaced since they were scheduled are
+        scheduled again instead.
+        """
+        if self.sweeper is None:
+            return 0
+
+        reclaimed = 0
+
+        for key in self.sweeper.due(time(), limit):
+            entry = self.store.peek(key)
+
+            if entry is None:
+                continue
+
+            if self.is_servable(entry):
+                self._schedule(key, entry)
+            else:
+                del self.store[key]
+                reclaimed += 1
+
+        if reclaimed:
+            self.stats.reclaim(reclaimed)
+
+        return reclaimed
+
+    def __contains__(self, key):
+        """Whether `key` is cached. Unlike :meth:`get`, this doesn't count as
+        a read of the entry, if the store can tell without reading it."""
+        return _contains(self.store, key)
+
+    def items(self):
+        """Return the (key, entry) pairs of all entries in the cache, if
+        the store supports listing them, or an empty list."""
+        if not hasattr(self.store, 'items'):
+            return []
+
+        return self.store.items()
+
+    def is_servable(self, entry):
+        """Whether `entry` can still be served, if only stale."""
+        return entry.stale_for(self.ttl, self.tti) <= self.max_stale
+
     def delete(self, key):
         del self.store[key]
+        self._unschedule(key)
         self.stats.delete()
 
+    def delete_local(self, key):
+        """Delete `key` only if it's kept in this process, leaving shared
+        stores like Redis alone."""
+        if isinstance(self.store, self.MEMORY_STORES):
+            self.delete(key)
+
     def clear(self):
         self.store.clear()
         self.stats.clear()
 
+        if self.sweeper is not None:
+            self.sweeper.clear()
+
     @property
     def size(self):
         return len(self.store)
+
+    @property
+    def bytes(self):
+        """Estimated memory taken by the cached entries, or None if the
+        store doesn't keep track of it."""
+        return getattr(self.store, 'bytes', None)
+
+
+class TieredCache(Cache):
+    """A cache with a small in-process tier (L1) in front of its store (L2),
+    usually a shared one like :class:`stormpath.cache.redis_store.RedisStore`.
+
+    Values are read from L1 as long as they were put there less than
+    ``l1['ttl']`` seconds ago, and from L2 otherwise, in which case they're
+    promoted into L1. Writes and deletes go to both tiers. Since other
+    processes only update L2, L1 values can be up to ``l1['ttl']`` seconds
+    out of date, unless an invalidation bus is used.
+
+    :param l1: L1 options: ``ttl`` (5 seconds by default), ``store`` (a
+        :class:`stormpath.cache.memory_store.MemoryStore` by default) and
+        ``store_opts``.
+    """
+    DEFAULT_L1_TTL = 5  # seconds
+    DEFAULT_L1_STORE_OPTS = {'max_entries': 1000}
+
+    def __init__(self, l1=None, **kwargs):
+        super(TieredCache, self).__init__(**kwargs)
+
+        l1 = dict(l1 or {})
+        self.l1_ttl = l1.get('ttl', self.DEFAULT_L1_TTL)
+        self.l1 = l1.get('store', MemoryStore)(**dict(l1.get('store_opts') or self.DEFAULT_L1_STORE_OPTS))
+
+    def _promote(self, key, value):
+        self.l1[key] = (time(), value)
+
+    def get(self, key, revalidate=None):
+        item = self.l1[key]
+
+        if item is not None:
+            stored_at, value = item
+            if time() - stored_at < self.l1_ttl:
+                self.stats.hit(l1=True)
+                return value
+
+            del self.l1[key]
+
+        value = super(TieredCache, self).get(key, revalidate=revalidate)
+        if value is not None:
+            self._promote(key, value)
+
+        return value
+
+    def put(self, key, value, new=True, cost=None):
+        super(TieredCache, self).put(key, value, new=new, cost=cost)
+        self._promote(key, value)
+
+    def __contains__(self, key):
+        return _contains(self.l1, key) or super(TieredCache, self).__contains__(key)
+
+    def delete(self, key):
+        del self.l1[key]
+        super(TieredCache, self).delete(key)
+
+    def delete_local(self, key):
+        del self.l1[key]
+        super(TieredCache, self).delete_local(key)
+
+    def clear(self):
+        self.l1.clear()
+        super(TieredCache, self).clear()
@@ -2,42 +2,151 @@
 
 
 from datetime import datetime, timedelta
+from json import dumps, loads
+from math import isnan, log
+from random import random
+from struct import Struct
+from time import time
+
+
+EPOCH = datetime(1970, 1, 1)
+
+# Format of the timestamps of entries stored by earlier versions.
+LEGACY_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def to_timestamp(value):
+    """Convert a (naive, UTC) datetime to seconds since the epoch. Numbers
+    are returned as they are."""
+    if isinstance(value, datetime):
+        return (value - EPOCH).total_seconds()
+
+    return value
 
 
 class CacheEntry(object):
     """A single entry inside a cache.
 
     It contains the data as originally returned by Stormpath along with
-    additional metadata like timestamps.
+    additional metadata like timestamps, in seconds since the epoch (entries
+    are shared between processes through remote stores, so they can't use
+    a monotonic clock).
+
+    :param created_at: (optional) Creation time, in seconds since the epoch
+        or as a UTC datetime. Defaults to now.
+
+    :param last_accessed_at: (optional) Last access time, like `created_at`.
+        Defaults to the creation time.
+
+    :param ttl: (optional) TTL of this entry, overriding the one of the cache
+        it's stored in, e.g. to spread out expirations.
+
+    :param cost: (optional) Number of seconds it took to fetch the value,
+        used to weigh probabilistic early expiration.
     """
+    __slots__ = ('value', 'created_at', 'last_accessed_at', 'ttl', 'cost')
 
-    def __init__(self, value, created_at=None, last_accessed_at=None):
+    # Binary encoding: a version byte, then the timestamps, TTL and cost (NaN
+    # if unset), followed by the JSON encoded value.
+    ENCODING_VERSION = 1
+    HEADER = Struct('!Bdddd')
+
+    def __init__(self, value, created_at=None, last_accessed_at=None, ttl=None, cost=None):
         self.value = value
-        self.created_at = created_at or datetime.utcnow()
-        self.last_accessed_at = last_accessed_at or self.created_at
+        self.created_at = to_timestamp(created_at) or time()
+        self.last_accessed_at = to_timestamp(last_accessed_at) or self.created_at
+        self.ttl = ttl
+        self.cost = cost
 
     def touch(self):
-        self.last_accessed_at = datetime.utcnow()
+        self.last_accessed_at = time()
+
+    def expires_at(self, ttl, tti):
+        if self.ttl is not None:
+            ttl = self.ttl
+
+        return min(self.created_at + ttl, self.last_accessed_at + tti)
+
+    def is_expired(self, ttl, tti, early_expiration=0):
+        """Check whether this entry has expired.
+
+        :param early_expiration: (optional) If set, the entry may expire
+            early, with a probability that grows as it gets closer to its
+            expiration and with the cost of fetching it (XFetch). Higher
+            values make early expiration more likely.
+        """
+        expires_at = self.expires_at(ttl, tti)
+
+        if early_expiration and self.cost:
+            expires_at += self.cost * early_expiration * log(1 - random())
 
-    def is_expired(self, ttl, tti):
-        now = datetime.utcnow()
-        return (now >= self.created_at + timedelta(seconds=ttl) or now >= self.last_accessed_at + timedelta(seconds=tti))
+        return time() >= expires_at
+
+    def stale_for(self, ttl, tti):
+        """Return the number of seconds since this entry expired (negative if
+        it hasn't expired yet)."""
+        return time() - self.expires_at(ttl, tti)
 
     @classmethod
     def parse(cls, data):
         def parse_date(val):
+            if isinstance(val, (int, float)):
+                return val
+
+            # Entries stored by earlier versions have formatted dates.
             try:
-                return datetime.strptime(val, '%Y-%m-%d %H:%M:%S.%f')
+                return datetime.strptime(val, LEGACY_DATE_FORMAT)
             except Exception:
                 return None
 
-        return cls(data.get('value'), created_at=parse_date(data.get('created_at')), last_accessed_at=parse_date(data.get('last_accessed_at')))
+        return cls(data.get('value'), created_at=parse_date(data.get('created_at')), last_accessed_at=parse_date(data.get('last_accessed_at')), ttl=data.get('ttl'), cost=data.get('cost'))
 
     def to_dict(self):
-        format_date = lambda d: d.strftime('%Y-%m-%d %H:%M:%S.%f')
-
-        return {
-            'created_at': format_date(self.created_at),
-            'last_accessed_at': format_date(self.last_accessed_at),
+        data = {
+            'created_at': self.created_at,
+            'last_accessed_at': self.last_accessed_at,
             'value': self.value,
         }
+
+        if self.ttl is not None:
+            data['ttl'] = self.ttl
+
+        if self.cost is not None:
+            data['cost'] = self.cost
+
+        return data
+
+    def to_legacy_dict(self):
+        """Like :meth:`to_dict`, but with the formatted timestamps of
+        earlier versions, which can't read any other format."""
+        format_date = lambda ts: (EPOCH + timedelta(seconds=ts)).strftime(LEGACY_DATE_FORMAT)
+
+        data = self.to_dict()
+        data['created_at'] = format_date(self.created_at)
+        data['last_accessed_at'] = format_date(self.last_accessed_at)
+
+        return data
+
+    def encode(self):
+        """Encode this entry as bytes, see :meth:`decode`."""
+        nan = float('nan')
+        header = self.HEADER.pack(self.ENCODING_VERSION, self.created_at,
+            self.last_accessed_at, nan if self.ttl is None else self.ttl,
+            nan if self.cost is None else self.cost)
+
+        return header + dumps(self.value, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def decode(cls, data):
+        """Decode an entry encoded with :meth:`encode`.
+
+        :raises ValueError: If `data` isn't an encoded entry.
+        """
+        if len(data) < cls.HEADER.size or bytearray(data[:1])[0] != cls.ENCODING_VERSION:
+            raise ValueError('Not an encoded cache entry.')
+
+        _, created_at, last_accessed_at, ttl, cost = cls.HEADER.unpack(data[:cls.HEADER.size])
+        value = loads(data[cls.HEADER.size:].decode('utf-8'))
+
+        return cls(value, created_at=created_at, last_accessed_at=last_accessed_at,
+            ttl=None if isnan(ttl) else ttl, cost=None if isnan(cost) else cost)
@@ -0,0 +1,83 @@
+"""Secondary indexes of cached resources."""
+
+
+from threading import Lock
+
+from .memory_store import LimitedSizeDict
+
+
+class ResourceIndex(object):
+    """Maps attributes that resources are commonly looked up by to their
+    hrefs, so the lookups don't need an API search:
+
+    - account emails and usernames (per directory),
+    - group names (per directory),
+    - API key ids.
+
+    The index is maintained by :class:`stormpath.data_store.DataStore` from
+    the resources it caches, creates and updates. It's never authoritative:
+    resources found through the index must be checked to still match, since
+    e.g. an account's email may have changed in the meantime.
+
+    :param max_entries: Maximum number of entries, the least recently added
+        ones are evicted first.
+    """
+    MAX_ENTRIES = 10000
+
+    # Indexed attributes by href segment, and whether they're unique per
+    # directory or globally.
+    INDEXED_ATTRS = {
+        'accounts': (('email', 'username'), True),
+        'groups': (('name',), True),
+        'apiKeys': (('id',), False),
+    }
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.entries = LimitedSizeDict(max_entries=max_entries)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, href, data):
+        """Index the resource `href`, with the given data."""
+        parts = href.rsplit('/', 2)
+        if len(parts) < 3 or parts[-2] not in self.INDEXED_ATTRS:
+            return
+
+        kind = parts[-2]
+        attrs, per_directory = self.INDEXED_ATTRS[kind]
+
+        scope = None
+        if per_directory:
+            scope = (data.get('directory') or {}).get('href')
+            if scope is None:
+                return
+
+        with self.lock:
+            for attr in attrs:
+                if data.get(attr):
+                    self.entries[(kind, scope, attr, data[attr])] = href
+
+    def get(self, kind, attr, value, directory=None):
+        """Return the href of the resource of kind `kind` (e.g. 'accounts')
+        whose `attr` was last seen to be `value`, or None.
+
+        :param directory: The directory href, for attributes that are unique
+            per directory.
+        """
+        with self.lock:
+            href = self.entries.get((kind, directory, attr, value))
+
+        if href is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return href
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
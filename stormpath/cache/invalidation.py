@@ -0,0 +1,120 @@
+"""Cache invalidation buses.
+
+An invalidation bus keeps the caches of several
+:class:`stormpath.data_store.DataStore` instances -- usually one per process
+-- in sync: whenever a data store updates, deletes or uncaches a resource, it
+publishes the resource href on the bus, and every other data store
+subscribed to the bus evicts it from its own caches.
+"""
+
+
+from json import dumps, loads
+from threading import Lock
+from uuid import uuid4
+
+
+class InvalidationBus(object):
+    """Base class of invalidation buses.
+
+    Subclasses implement :meth:`_send` and call :meth:`_receive` for every
+    message received.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = Lock()
+
+    def subscribe(self, callback):
+        """Call `callback` with the href of every resource invalidated by
+        other subscribers.
+
+        :returns: A subscriber id, to be passed to :meth:`publish`.
+        """
+        sid = uuid4().hex
+
+        with self.lock:
+            self.subscribers[sid] = callback
+
+        return sid
+
+    def unsubscribe(self, sid):
+        with self.lock:
+            self.subscribers.pop(sid, None)
+
+    def publish(self, sid, href):
+        """Tell all other subscribers that `href` was invalidated by `sid`."""
+        self._send(dumps({'source': sid, 'href': href}))
+
+    def _send(self, message):
+        raise NotImplementedError
+
+    def _receive(self, message):
+        message = loads(message)
+
+        with self.lock:
+            callbacks = [c for sid, c in self.subscribers.items() if sid != message['source']]
+
+        for callback in callbacks:
+            callback(message['href'])
+
+    def close(self):
+        pass
+
+
+class LocalInvalidationBus(InvalidationBus):
+    """Invalidation bus for data stores within a single process, e.g. to
+    share it between several clients, or in tests."""
+
+    def _send(self, message):
+        self._receive(message)
+
+
+class RedisInvalidationBus(InvalidationBus):
+    """Invalidation bus that uses Redis pub/sub.
+
+    Messages are received on a background thread.
+
+    :param channel: Name of the Redis channel to use.
+
+    :param poll_interval: Number of seconds the background thread sleeps
+        between checks for new messages.
+
+    All other arguments are passed to the Redis client, see
+    :class:`stormpath.cache.redis_store.RedisStore` for their descriptions.
+    """
+    DEFAULT_CHANNEL = 'stormpath:invalidations'
+    DEFAULT_POLL_INTERVAL = 0.01  # seconds
+
+    def __init__(self, channel=DEFAULT_CHANNEL, poll_interval=DEFAULT_POLL_INTERVAL, host='localhost',
+            port=6379, db=0, password=None, socket_timeout=None, connection_pool=None,
+            unix_socket_path=None):
+        super(RedisInvalidationBus, self).__init__()
+
+        try:
+            from redis import Redis
+        except ImportError:
+            raise RuntimeError('Redis support is not available. Run "pip install redis".')
+
+        self.channel = channel
+        self.redis = Redis(host=host, port=port, db=db,
+                password=password, socket_timeout=socket_timeout,
+                connection_pool=connection_pool,
+                unix_socket_path=unix_socket_path)
+
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(**{channel: self._handle})
+        self.thread = self.pubsub.run_in_thread(sleep_time=poll_interval, daemon=True)
+
+    def _handle(self, message):
+        data = message['data']
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+
+        self._receive(data)
+
+    def _send(self, message):
+        self.redis.publish(self.channel, message)
+
+    def close(self):
+        self.thread.stop()
+        self.pubsub.close()
@@ -1,7 +1,9 @@
 """Cache manager abstraction."""
 
 
-from .cache import Cache
+from .cache import Cache, TieredCache
+from .memcached_store import MemcachedStore
+from .redis_store import RedisStore
 
 
 class CacheManager(object):
@@ -20,7 +22,18 @@ class CacheManager(object):
         self.caches = {}
 
     def create_cache(self, region, **options):
-        self.caches[region] = Cache(**options)
+        # Keep the entries of each region apart on shared stores, so they
+        # can be cleared separately.
+        if options.get('store') in (RedisStore, MemcachedStore):
+            options['store_opts'] = dict(options.get('store_opts') or {})
+            options['store_opts'].setdefault('namespace', region)
+
+        # Regions with L1 options get an in-process tier in front of their
+        # store.
+        if options.get('l1'):
+            self.caches[region] = TieredCache(**options)
+        else:
+            self.caches[region] = Cache(**options)
 
     def get_cache(self, region):
         return self.caches.get(region)
@@ -28,3 +41,10 @@ class CacheManager(object):
     @property
     def stats(self):
         return {region: cache.stats for region, cache in self.caches.items()}
+
+    @property
+    def memory_usage(self):
+        """Estimated bytes taken by each region, for the regions whose store
+        keeps track of it."""
+        return {region: cache.bytes for region, cache in self.caches.items()
+            if cache.bytes is not None}
@@ -1,14 +1,18 @@
 """A memcached cache backend."""
 
 import socket
-from functools import wraps
+from functools import partial, wraps
 from json import dumps, loads
+from math import ceil
+from time import time
 
 from .entry import CacheEntry
+from .serializers import Serializer, hash_key
 
 
 STR_VALUE = 1
 JSON_VALUE = 2
+BINARY_VALUE = 3
 
 
 def json_serializer(key, value):
@@ -26,6 +30,24 @@ def json_deserializer(key, value, flags):
     raise Exception("Unknown serialization format")
 
 
+def binary_serializer(key, value, entry_serializer=None):
+    if isinstance(value, str):
+        return value, STR_VALUE
+
+    data = (entry_serializer or Serializer()).dumps(value)
+
+    # Flag JSON entries as such, so earlier versions can read them.
+    return data, JSON_VALUE if data[:1] == b'{' else BINARY_VALUE
+
+
+def binary_deserializer(key, value, flags, entry_serializer=None):
+    if flags == BINARY_VALUE:
+        return (entry_serializer or Serializer()).loads(value)
+
+    # Entries stored by earlier versions are JSON encoded.
+    return json_deserializer(key, value, flags)
+
+
 def memcache_error_handling(f):
     @wraps(f)
     def wrapper(self, *args, **kwargs):
@@ -66,15 +88,55 @@ class MemcachedStore(object):
     :param key_prefix: Prefix of key. You can use this as namespace. Defaults
         to b''.
 
+    :param serializer: (optional) A
+        :class:`stormpath.cache.serializers.Serializer`, to change how
+        entries are encoded (e.g. to compress them).
+
+    :param namespace: Namespace of the keys of this store, the cache region
+        by default (see :class:`stormpath.cache.manager.CacheManager`). Keys
+        include a generation number of the namespace, which :meth:`clear`
+        increments, so clearing a namespace doesn't affect the others (the
+        old entries expire on their own). Without a namespace, :meth:`clear`
+        flushes the whole server.
+
+    :param hash_keys: Whether to store entries under a hash of their key
+        instead, which is shorter than most hrefs (memcached keys are limited
+        to 250 characters).
+
+    :param tti: (optional) TTI, in seconds. Memcached expires entries that
+        weren't read for that long. Reads update the last access time of
+        entries, which also resets their expiration, once it's
+        ``ACCESS_TIME_PRECISION`` of the TTI old: entries may expire that
+        much early. Updates are made with CAS, so they never overwrite a new
+        value, and don't wait for a reply. They never keep an entry for
+        longer than its TTL, though.
+
+    .. note::
+        Memcached can't count the keys of a namespace, ``len()`` is the
+        number of items of the whole server.
     """
 
     DEFAULT_TTL = 5 * 60  # seconds
 
+    # How often the generation of the namespace is checked, in seconds. Other
+    # processes see a namespace was cleared within that time.
+    GENERATION_CHECK_INTERVAL = 1
+
+    # Fraction of the TTI after which reads update the last access time.
+    ACCESS_TIME_PRECISION = 0.1
+
     def __init__(self, host='localhost', port=11211,
             connect_timeout=None, timeout=None,
             no_delay=False, ignore_exc=True,
-            key_prefix=b'', socket_module=socket, ttl=DEFAULT_TTL):
+            key_prefix=b'', socket_module=socket, ttl=DEFAULT_TTL,
+            serializer=None, namespace=None, hash_keys=False, tti=None):
         self.ttl = ttl
+        self.tti = tti
+        self.serializer = serializer or Serializer()
+        self.namespace = namespace
+        self.hash_keys = hash_keys
+        self.generation = None
+        self.generation_checked_at = None
 
         try:
             from pymemcache.client import Client as Memcache
@@ -83,8 +145,8 @@ class MemcachedStore(object):
 
         self.memcache = Memcache(
                 (host, port),
-                serializer=json_serializer,
-                deserializer=json_deserializer,
+                serializer=partial(binary_serializer, entry_serializer=self.serializer),
+                deserializer=partial(binary_deserializer, entry_serializer=self.serializer),
                 connect_timeout=connect_timeout,
                 timeout=timeout,
                 socket_module=socket_module,
@@ -92,26 +154,92 @@ class MemcachedStore(object):
                 ignore_exc=ignore_exc,
                 key_prefix=key_prefix)
 
+    def _get_generation(self):
+        now = time()
+        if self.generation is not None and now - self.generation_checked_at < self.GENERATION_CHECK_INTERVAL:
+            return self.generation
+
+        key = '%s:generation' % self.namespace
+        generation = self.memcache.get(key)
+        if generation is None:
+            self.memcache.add(key, '1', expire=0, noreply=False)
+            generation = self.memcache.get(key) or 1
+
+        self.generation = int(generation)
+        self.generation_checked_at = now
+
+        return self.generation
+
+    def _key(self, key):
+        if self.hash_keys:
+            key = hash_key(key)
+
+        if self.namespace:
+            key = '%s:%d:%s' % (self.namespace, self._get_generation(), key)
+
+        return key
+
+    def _touch(self, key, entry, cas):
+        now = time()
+        if now - entry.last_accessed_at < self.tti * self.ACCESS_TIME_PRECISION:
+            return
+
+        # However often they're read, entries expire by their TTL (unless
+        # it's 0, for entries which never expire).
+        expire = self.tti
+        if self.ttl:
+            expire = min(expire, int(ceil(entry.created_at + self.ttl - now)))
+            if expire <= 0:
+                return
+
+        entry.last_accessed_at = now
+        self.memcache.cas(key, entry, cas, expire=expire, noreply=True)
+
     @memcache_error_handling
     def __getitem__(self, key):
-        entry = self.memcache.get(key)
+        key = self._key(key)
+        if self.tti:
+            entry, cas = self.memcache.gets(key)
+        else:
+            entry = self.memcache.get(key)
 
         if entry is None:
             return None
 
-        return CacheEntry.parse(entry)
+        if not isinstance(entry, CacheEntry):
+            entry = CacheEntry.parse(entry)
+
+        if self.tti:
+            self._touch(key, entry, cas)
+
+        return entry
+
+    @memcache_error_handling
+    def __contains__(self, key):
+        # A plain get, which unlike reads doesn't reset the expiration.
+        return self.memcache.get(self._key(key)) is not None
 
     @memcache_error_handling
     def __setitem__(self, key, entry):
-        self.memcache.set(key, entry, expire=self.ttl)
+        # A TTL of 0 means entries never expire.
+        ttl = min(self.ttl or self.tti, self.tti) if self.tti else self.ttl
+        self.memcache.set(self._key(key), entry, expire=ttl)
 
     @memcache_error_handling
     def __delitem__(self, key):
-        self.memcache.delete(key)
+        self.memcache.delete(self._key(key))
 
     @memcache_error_handling
     def clear(self):
-        self.memcache.flush_all()
+        if not self.namespace:
+            self.memcache.flush_all()
+            return
+
+        generation = self.memcache.incr('%s:generation' % self.namespace, 1, noreply=False)
+        if generation is None:
+            self.memcache.add('%s:generation' % self.namespace, '2', expire=0, noreply=False)
+
+        self.generation = None
 
     @memcache_error_handling
     def __len__(self):
@@ -1,14 +1,42 @@
 """A memory store cache backend."""
 
 from collections import OrderedDict
+from sys import getsizeof
+from threading import Lock
+
+from .entry import CacheEntry
+
+
+def _check_size_limit(size_limit):
+    if size_limit < 1:
+        raise ValueError('Memory store: max entries needs to be a positive number.')
+
+
+def estimate_size(value):
+    """Estimate the number of bytes `value` takes in memory, including the
+    dicts, lists and tuples it contains."""
+    size = getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+
+    return size
 
 
 class LimitedSizeDict(OrderedDict):
+    """An OrderedDict of a limited size, which evicts its oldest entries
+    first.
+
+    Like the other eviction policies, it calls `on_evict` (if set) with the
+    key of every entry it evicts.
+    """
+    on_evict = None
 
     def __init__(self, *args, **kwargs):
         self.size_limit = kwargs.pop("max_entries")
-        if self.size_limit < 1:
-            raise ValueError('Memory store: max entries needs to be a positive number.')
+        _check_size_limit(self.size_limit)
         OrderedDict.__init__(self, *args, **kwargs)
         self._check_size_limit()
 
@@ -16,32 +44,551 @@ class LimitedSizeDict(OrderedDict):
         OrderedDict.__setitem__(self, key, value)
         self._check_size_limit()
 
+    def peek(self, key, default=None):
+        """Like `get`, without counting as a use of `key`."""
+        return OrderedDict.get(self, key, default)
+
     def _check_size_limit(self):
         while len(self) > self.size_limit:
-            self.popitem(last=False)
+            self.evict()
+
+    def evict(self):
+        """Evict the next entry, and return its key."""
+        key, _ = self.popitem(last=False)
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+        return key
+
+
+class LRUDict(LimitedSizeDict):
+    """A LimitedSizeDict which evicts its least recently used entries first.
+
+    Entries are moved to the end on every read and write, so the first entry
+    is always the least recently used one.
+    """
+
+    def get(self, key, default=None):
+        try:
+            value = OrderedDict.pop(self, key)
+        except KeyError:
+            return default
+
+        OrderedDict.__setitem__(self, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self:
+            OrderedDict.__delitem__(self, key)
+
+        LimitedSizeDict.__setitem__(self, key, value)
+
+
+class LFUDict(object):
+    """A dict of a limited size, which evicts its least frequently used
+    entries first (and among those, the least recently used one).
+
+    Keys are kept in buckets by their use count, so reads, writes and
+    evictions are all O(1).
+    """
+    on_evict = None
+
+    def __init__(self, max_entries):
+        _check_size_limit(max_entries)
+        self.size_limit = max_entries
+        self.values = {}
+        self.counts = {}
+        self.buckets = {}
+        self.min_count = 0
+
+    def _remove(self, key):
+        count = self.counts.pop(key)
+        bucket = self.buckets[count]
+        del bucket[key]
+
+        if not bucket:
+            del self.buckets[count]
+
+        return count
+
+    def _add(self, key, count):
+        self.counts[key] = count
+        self.buckets.setdefault(count, OrderedDict())[key] = None
+
+    def _use(self, key):
+        count = self._remove(key)
+        if count == self.min_count and count not in self.buckets:
+            self.min_count = count + 1
+
+        self._add(key, count + 1)
+
+    def get(self, key, default=None):
+        if key not in self.values:
+            return default
+
+        self._use(key)
+        return self.values[key]
+
+    def peek(self, key, default=None):
+        """Like `get`, without counting as a use of `key`."""
+        return self.values.get(key, default)
+
+    def __setitem__(self, key, value):
+        if key in self.values:
+            self.values[key] = value
+            self._use(key)
+            return
+
+        if len(self.values) >= self.size_limit:
+            self.evict()
+
+        self.values[key] = value
+        self._add(key, 1)
+        self.min_count = 1
+
+    def __delitem__(self, key):
+        del self.values[key]
+        count = self._remove(key)
+
+        if count == self.min_count and count not in self.buckets:
+            self.min_count = min(self.buckets) if self.buckets else 0
+
+    def evict(self):
+        """Evict the next entry, and return its key."""
+        victim = next(iter(self.buckets[self.min_count]))
+        del self[victim]
+
+        if self.on_evict is not None:
+            self.on_evict(victim)
+
+        return victim
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return list(self.values.keys())
+
+    def items(self):
+        return list(self.values.items())
+
+    def clear(self):
+        self.values.clear()
+        self.counts.clear()
+        self.buckets.clear()
+        self.min_count = 0
+
+
+class CountMinSketch(object):
+    """Estimates how often keys were seen, in constant space.
+
+    Counters saturate at 15, and are all halved once `sample_size` keys were
+    counted, so the estimates favour recent history.
+    """
+    DEPTH = 4
+    MAX_COUNT = 15
+    SEEDS = (0x5bd1e995, 0x27d4eb2f, 0x165667b1, 0x61c88647)
+
+    def __init__(self, width, sample_size=None):
+        self.bits = max(4, (width - 1).bit_length())
+        self.width = 1 << self.bits
+        self.sample_size = sample_size or 10 * width
+        self.clear()
+
+    def _indexes(self, key):
+        # Multiplicative hashing, with a different multiplier for each row.
+        h = hash(key) & 0xffffffff
+        h ^= h >> 16
+        return [((h * seed) & 0xffffffff) >> (32 - self.bits) for seed in self.SEEDS]
+
+    def increment(self, key):
+        indexes = self._indexes(key)
+        counts = [row[i] for row, i in zip(self.rows, indexes)]
+        least = min(counts)
+
+        # Conservative update: only the smallest counters are incremented,
+        # which reduces the overestimation due to collisions.
+        if least < self.MAX_COUNT:
+            for row, i, count in zip(self.rows, indexes, counts):
+                if count == least:
+                    row[i] += 1
+
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.rows = [[c >> 1 for c in row] for row in self.rows]
+            self.additions //= 2
+
+    def estimate(self, key):
+        return min(row[i] for row, i in zip(self.rows, self._indexes(key)))
+
+    def clear(self):
+        self.rows = [[0] * self.width for _ in range(self.DEPTH)]
+        self.additions = 0
+
+
+class TinyLFUDict(object):
+    """A dict of a limited size, with the W-TinyLFU eviction policy.
+
+    New entries go into a small LRU window. Entries evicted from the window
+    are only admitted into the main space if they're used more often
+    (according to a :class:`CountMinSketch`) than the entry they would
+    replace, so one-off reads (like scans) don't push out frequently used
+    entries. The main space is a segmented LRU: entries are promoted from
+    probation to a protected segment when they're read again.
+    """
+    WINDOW_RATIO = 0.01
+    PROTECTED_RATIO = 0.8
+    on_evict = None
+
+    def __init__(self, max_entries):
+        _check_size_limit(max_entries)
+        self.size_limit = max_entries
+        self.window_limit = max(1, int(max_entries * self.WINDOW_RATIO))
+        self.main_limit = max_entries - self.window_limit
+        self.protected_limit = int(self.main_limit * self.PROTECTED_RATIO)
+
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.sketch = CountMinSketch(max_entries)
+
+    def _segment(self, key):
+        for segment in (self.window, self.probation, self.protected):
+            if key in segment:
+                return segment
+
+    def get(self, key, default=None):
+        self.sketch.increment(key)
+        segment = self._segment(key)
+
+        if segment is None:
+            return default
+
+        value = segment.pop(key)
+
+        if segment is self.probation:
+            self.protected[key] = value
+            if len(self.protected) > self.protected_limit:
+                demoted, demoted_value = self.protected.popitem(last=False)
+                self.probation[demoted] = demoted_value
+        else:
+            segment[key] = value
+
+        return value
+
+    def peek(self, key, default=None):
+        """Like `get`, without counting as a use of `key`."""
+        segment = self._segment(key)
+        return default if segment is None else segment[key]
+
+    def __setitem__(self, key, value):
+        segment = self._segment(key)
+        if segment is not None:
+            segment[key] = value
+            self.get(key)
+            return
+
+        self.sketch.increment(key)
+        self.window[key] = value
+
+        if len(self.window) > self.window_limit:
+            self._admit(*self.window.popitem(last=False))
+
+    def _admit(self, key, value):
+        if len(self.probation) + len(self.protected) < self.main_limit:
+            self.probation[key] = value
+            return
+
+        # Either the candidate or the victim it would replace is evicted.
+        victims = self.probation or self.protected
+        if victims and self.sketch.estimate(key) > self.sketch.estimate(next(iter(victims))):
+            victim, _ = victims.popitem(last=False)
+            self.probation[key] = value
+            key = victim
+
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def evict(self):
+        """Evict the next entry, and return its key."""
+        for segment in (self.probation, self.window, self.protected):
+            if segment:
+                key, _ = segment.popitem(last=False)
+                if self.on_evict is not None:
+                    self.on_evict(key)
+
+                return key
+
+        raise KeyError('evict(): dictionary is empty')
+
+    def __delitem__(self, key):
+        segment = self._segment(key)
+        if segment is None:
+            raise KeyError(key)
+
+        del segment[key]
+
+    def __contains__(self, key):
+        return self._segment(key) is not None
+
+    def __len__(self):
+        return len(self.window) + len(self.probation) + len(self.protected)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [key for key, _ in self.items()]
+
+    def items(self):
+        return list(self.window.items()) + list(self.probation.items()) + \
+            list(self.protected.items())
+
+    def clear(self):
+        self.window.clear()
+        self.probation.clear()
+        self.protected.clear()
+        self.sketch.clear()
+
+
+class MemoryBudget(object):
+    """A memory cap shared by several memory stores.
+
+    Whenever the stores sharing the budget take more than `max_bytes`
+    altogether, entries are evicted from the largest one.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.stores = []
+        self.lock = Lock()
+
+    def register(self, store):
+        self.stores.append(store)
+
+    @property
+    def bytes(self):
+        return sum(store.bytes for store in self.stores)
+
+    def check(self):
+        with self.lock:
+            while self.bytes > self.max_bytes:
+                store = max(self.stores, key=lambda s: s.bytes)
+                if not store.evict():
+                    break
 
 
 class MemoryStore(object):
-    """Simple caching implementation that uses memory as data storage."""
+    """Simple caching implementation that uses memory as data storage.
+
+    Once ``max_entries`` is reached, entries are evicted according to the
+    ``eviction`` policy:
+
+    - ``'lru'`` (the default): the least recently used entry,
+    - ``'lfu'``: the least frequently used entry,
+    - ``'tinylfu'``: W-TinyLFU, which also keeps rarely used new entries from
+      replacing frequently used ones,
+    - ``'fifo'``: the oldest entry.
+
+    The size of each entry is estimated when it's put into the store (see
+    :func:`estimate_size`), and the total is available as :attr:`bytes`.
+    Entries are also evicted to keep the total under ``max_bytes`` if given,
+    and under the ``budget`` (a :class:`MemoryBudget`) shared with other
+    stores. Entries larger than ``max_bytes`` aren't stored at all.
+
+    ``on_evict``, if set, is called with the key of every entry that is
+    evicted, or that isn't stored at all.
+    """
 
     MAX_ENTRIES = 1000  # Maximum number of entries in cache
+    EVICTION = 'lru'
+
+    EVICTION_POLICIES = {
+        'fifo': LimitedSizeDict,
+        'lru': LRUDict,
+        'lfu': LFUDict,
+        'tinylfu': TinyLFUDict,
+    }
 
     def __init__(self, *args, **kwargs):
         max_entries = kwargs.pop('max_entries', self.MAX_ENTRIES)
-        self.store = LimitedSizeDict(max_entries=max_entries)
+        eviction = kwargs.pop('eviction', self.EVICTION)
+        self.max_bytes = kwargs.pop('max_bytes', None)
+        self.budget = kwargs.pop('budget', None)
+
+        if eviction not in self.EVICTION_POLICIES:
+            raise ValueError('Memory store: unknown eviction policy %r, should be one of %s.' % (
+                eviction, ', '.join(sorted(self.EVICTION_POLICIES))))
+
+        self.store = self.EVICTION_POLICIES[eviction](max_entries=max_entries)
+        self.store.on_evict = self._evicted
+        self.on_evict = None
+
+        self.sizes = {}
+        self.bytes = 0
+
+        # Reads change the eviction order too, so they need the lock.
+        self.lock = Lock()
+
+        if self.budget is not None:
+            self.budget.register(self)
+
+    def _forget(self, key):
+        self.bytes -= self.sizes.pop(key, 0)
+
+    def _evicted(self, key):
+        self._forget(key)
+        if self.on_evict is not None:
+            self.on_evict(key)
 
     def __getitem__(self, key):
-        return self.store.get(key)
+        with self.lock:
+            return self.store.get(key)
+
+    def peek(self, key):
+        """Return the entry of `key` (or None) without changing the eviction
+        order."""
+        with self.lock:
+            return self.store.peek(key)
+
+    def __contains__(self, key):
+        return self.peek(key) is not None
 
     def __setitem__(self, key, entry):
-        self.store[key] = entry
+        size = estimate_size(key) + estimate_size(entry)
+        if isinstance(entry, CacheEntry):
+            size += estimate_size(entry.value)
+
+        with self.lock:
+            self._forget(key)
+
+            if self.max_bytes is not None and size > self.max_bytes:
+                if key in self.store:
+                    del self.store[key]
+                if self.on_evict is not None:
+                    self.on_evict(key)
+                return
+
+            self.store[key] = entry
+            if key in self.store:
+                self.sizes[key] = size
+                self.bytes += size
+
+            while self.max_bytes is not None and self.bytes > self.max_bytes:
+                self.store.evict()
+
+        if self.budget is not None:
+            self.budget.check()
 
     def __delitem__(self, key):
-        if key in self.store:
-            del self.store[key]
+        with self.lock:
+            if key in self.store:
+                del self.store[key]
+                self._forget(key)
+
+    def evict(self):
+        """Evict an entry according to the eviction policy.
+
+        :returns: False if the store was empty, True otherwise.
+        """
+        with self.lock:
+            if not len(self.store):
+                return False
+
+            self.store.evict()
+            return True
 
     def clear(self):
-        self.store.clear()
+        with self.lock:
+            self.store.clear()
+            self.sizes.clear()
+            self.bytes = 0
+
+    def items(self):
+        with self.lock:
+            return list(self.store.items())
 
     def __len__(self):
         return len(self.store)
+
+
+class ShardedMemoryStore(object):
+    """A memory store split into shards, each a :class:`MemoryStore` with a
+    lock of its own, so threads using different keys rarely wait for each
+    other.
+
+    Keys are assigned to shards by their hash, and ``max_entries`` and
+    ``max_bytes`` are divided evenly between the shards. Eviction is per
+    shard, so it's only approximately the one of the ``eviction`` policy
+    across the whole store.
+
+    :param shards: The number of shards.
+    """
+    SHARDS = 16
+
+    def __init__(self, *args, **kwargs):
+        shards = kwargs.pop('shards', self.SHARDS)
+        max_entries = kwargs.pop('max_entries', MemoryStore.MAX_ENTRIES)
+        max_bytes = kwargs.pop('max_bytes', None)
+
+        if shards < 1:
+            raise ValueError('Memory store: shards needs to be a positive number.')
+
+        _check_size_limit(max_entries)
+        shards = min(shards, max_entries)
+
+        self.shards = [
+            MemoryStore(max_entries=max(1, max_entries // shards),
+                max_bytes=None if max_bytes is None else max_bytes // shards, **kwargs)
+            for _ in range(shards)
+        ]
+
+    def _shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    @property
+    def on_evict(self):
+        return self.shards[0].on_evict
+
+    @on_evict.setter
+    def on_evict(self, on_evict):
+        for shard in self.shards:
+            shard.on_evict = on_evict
+
+    def __getitem__(self, key):
+        return self._shard(key)[key]
+
+    def peek(self, key):
+        return self._shard(key).peek(key)
+
+    def __contains__(self, key):
+        return key in self._shard(key)
+
+    def __setitem__(self, key, entry):
+        self._shard(key)[key] = entry
+
+    def __delitem__(self, key):
+        del self._shard(key)[key]
+
+    def evict(self):
+        return max(self.shards, key=lambda s: s.bytes).evict()
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+
+    def items(self):
+        return [item for shard in self.shards for item in shard.items()]
+
+    @property
+    def bytes(self):
+        return sum(shard.bytes for shard in self.shards)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
@@ -7,6 +7,9 @@ class NullCacheStore(object):
     def __getitem__(self, key):
         return None
 
+    def __contains__(self, key):
+        return False
+
     def __setitem__(self, key, entry):
         pass
 
@@ -16,5 +19,8 @@ class NullCacheStore(object):
     def clear(self):
         pass
 
+    def items(self):
+        return []
+
     def __len__(self):
         return 0
@@ -1,12 +1,11 @@
 """A redis cache backend."""
 
 
-from json import (
-    dumps,
-    loads,
-)
+import re
+from math import ceil
+from time import time
 
-from .entry import CacheEntry
+from .serializers import Serializer, hash_key
 
 
 class RedisStore(object):
@@ -35,17 +34,48 @@ class RedisStore(object):
         (see redis-py docs for more details)
 
     :param ttl: Default TTL
+
+    :param serializer: (optional) A
+        :class:`stormpath.cache.serializers.Serializer`, to change how
+        entries are encoded (e.g. to compress them).
+
+    :param key_prefix: Prefix of all keys, to share a database with other
+        applications.
+
+    :param namespace: Namespace of the keys of this store, the cache region
+        by default (see :class:`stormpath.cache.manager.CacheManager`).
+        :meth:`clear` and ``len()`` only apply to the keys of the namespace
+        (and prefix), which are found with SCAN. Without a namespace or
+        prefix, they apply to the whole database.
+
+    :param hash_keys: Whether to store entries under a hash of their key
+        instead, which is shorter than most hrefs.
+
+    :param tti: (optional) TTI, in seconds. Redis expires entries that
+        weren't read for that long: each read resets their expiration, with
+        GETEX (Redis 6.2 and later) or with GET and EXPIRE on earlier
+        versions. The time left until then, read in the same round trip,
+        tells when an entry was last read, which is set as its
+        ``last_accessed_at``. Reads never keep an entry for longer than its
+        TTL, though: within the TTI of the end of it, the expiration is set
+        back to it with EXPIRE.
     """
 
     DEFAULT_TTL = 5 * 60  # seconds
+    SCAN_BATCH_SIZE = 500
 
     def __init__(self, host='localhost', port=6379, db=0, password=None,
             socket_timeout=None, connection_pool=None, charset='utf-8',
             errors='strict', decode_responses=False, unix_socket_path=None,
-            ttl=DEFAULT_TTL):
+            ttl=DEFAULT_TTL, serializer=None, key_prefix='', namespace=None,
+            hash_keys=False, tti=None):
         self.ttl = ttl
+        self.tti = tti
+        self.serializer = serializer or Serializer()
+        self.prefix = key_prefix + ('%s:' % namespace if namespace else '')
+        self.hash_keys = hash_keys
         try:
-            from redis import Redis
+            from redis import Redis, ResponseError
         except ImportError:
             raise RuntimeError('Redis support is not available. Run "pip install redis".')
 
@@ -54,24 +84,102 @@ class RedisStore(object):
                 connection_pool=connection_pool, charset=charset,
                 errors=errors, decode_responses=decode_responses,
                 unix_socket_path=unix_socket_path)
+        self.ResponseError = ResponseError
+
+        # GETEX needs redis-py 4 and Redis 6.2.
+        self.getex = hasattr(self.redis, 'getex')
+
+    def _key(self, key):
+        if self.hash_keys:
+            key = hash_key(key)
+
+        return self.prefix + key
+
+    def _scan(self):
+        """Iterate over the keys of this store's namespace."""
+        match = re.sub(r'([*?\[\]\\])', r'\\\1', self.prefix) + '*'
+        return self.redis.scan_iter(match=match, count=self.SCAN_BATCH_SIZE)
+
+    def _get_and_touch(self, key):
+        """Get `key` and reset its expiration, returning its value and the
+        number of milliseconds it had left."""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.pttl(key)
+
+        if self.getex:
+            pipe.getex(key, ex=self.tti)
+        else:
+            pipe.get(key)
+            pipe.expire(key, self.tti)
+
+        try:
+            results = pipe.execute()
+        except self.ResponseError:
+            if not self.getex:
+                raise
+
+            # GETEX needs Redis 6.2.
+            self.getex = False
+            return self._get_and_touch(key)
+
+        return results[1], results[0]
 
     def __getitem__(self, key):
-        entry = self.redis.get(key)
-        if entry is None:
+        key = self._key(key)
+        if not self.tti:
+            data = self.redis.get(key)
+            return None if data is None else self.serializer.loads(data)
+
+        data, pttl = self._get_and_touch(key)
+        if data is None:
             return None
 
-        entry = loads(entry.decode('utf-8'))
-        return CacheEntry.parse(entry)
+        entry = self.serializer.loads(data)
+
+        # However often they're read, entries expire by their TTL.
+        left = int(ceil(entry.created_at + self.ttl - time()))
+        if left < self.tti:
+            self.redis.expire(key, left)
+
+        # Reads reset the expiration to the TTI, so the entry was last read
+        # when it had the whole TTI left. Entries which weren't read yet had
+        # less to begin with, if their TTL was shorter.
+        if pttl is not None and pttl >= 0:
+            entry.last_accessed_at = max(entry.created_at, time() - self.tti + pttl / 1000.0)
+
+        return entry
+
+    def __contains__(self, key):
+        # Unlike reads, EXISTS doesn't reset the expiration.
+        return bool(self.redis.exists(self._key(key)))
 
     def __setitem__(self, key, entry):
-        data = dumps(entry.to_dict()).encode('utf-8')
-        self.redis.setex(key, data, self.ttl)
+        ttl = min(self.ttl, self.tti) if self.tti else self.ttl
+        self.redis.setex(self._key(key), self.serializer.dumps(entry), ttl)
 
     def __delitem__(self, key):
-        self.redis.delete(key)
+        self.redis.delete(self._key(key))
 
     def clear(self):
-        self.redis.flushdb()
+        if not self.prefix:
+            self.redis.flushdb()
+            return
+
+        # UNLINK frees memory in the background, but needs Redis 4.
+        unlink = getattr(self.redis, 'unlink', self.redis.delete)
+        batch = []
+
+        for key in self._scan():
+            batch.append(key)
+            if len(batch) >= self.SCAN_BATCH_SIZE:
+                unlink(*batch)
+                batch = []
+
+        if batch:
+            unlink(*batch)
 
     def __len__(self):
-        return self.redis.dbsize()
+        if not self.prefix:
+            return self.redis.dbsize()
+
+        return sum(1 for _ in self._scan())
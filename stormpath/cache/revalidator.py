@@ -0,0 +1,60 @@
+"""Background cache revalidation."""
+
+
+from threading import Lock, Thread
+
+from six.moves.queue import Queue
+
+
+class Revalidator(object):
+    """Refreshes stale cache entries on a background thread.
+
+    Refreshes are single-flight: while a refresh of a key is pending, further
+    requests to refresh the same key are ignored.
+    """
+
+    def __init__(self):
+        self.queue = Queue()
+        self.pending = set()
+        self.lock = Lock()
+        self.thread = None
+
+    def submit(self, key, refresh):
+        """Schedule `refresh` to be called for `key`.
+
+        :returns: True if a refresh was scheduled, False if one was already
+            pending.
+        """
+        with self.lock:
+            if key in self.pending:
+                return False
+
+            self.pending.add(key)
+
+            if self.thread is None:
+                self.thread = Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+
+        self.queue.put((key, refresh))
+        return True
+
+    def _run(self):
+        while True:
+            key, refresh = self.queue.get()
+
+            try:
+                refresh()
+            except Exception:
+                # The stale entry stays in place and will be refreshed on a
+                # later hit, or expire for good once it's past max stale.
+                pass
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+
+                self.queue.task_done()
+
+    def join(self):
+        """Block until all scheduled refreshes are done."""
+        self.queue.join()
@@ -0,0 +1,170 @@
+"""Encoding of cache entries and keys for remote cache stores."""
+
+
+import zlib
+from hashlib import sha1
+from json import dumps, loads
+from math import isnan
+from struct import Struct
+
+from .entry import CacheEntry
+
+
+def hash_key(key):
+    """Shorten `key` (e.g. a long href) to a fixed length hash."""
+    return sha1(key.encode('utf-8')).hexdigest()
+
+
+def _import_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise RuntimeError('msgpack support is not available. Run "pip install msgpack".')
+
+    return msgpack
+
+
+def _import_lz4():
+    try:
+        import lz4.frame
+    except ImportError:
+        raise RuntimeError('lz4 support is not available. Run "pip install lz4".')
+
+    return lz4.frame
+
+
+class Serializer(object):
+    """Encodes cache entries as bytes, for
+    :class:`stormpath.cache.redis_store.RedisStore` and
+    :class:`stormpath.cache.memcached_store.MemcachedStore`.
+
+    By default, entries are encoded as JSON, in the same format as earlier
+    versions of the SDK, so processes running any version can share a
+    store. The binary formats (see `binary`, `codec` and `compression`)
+    start with a version byte, and entries in any format, including the
+    JSON one, can always be read back.
+
+    .. note::
+        Processes running earlier versions of the SDK can only read JSON
+        entries. During a rolling deploy, keep the default settings until
+        all processes have been updated, then switch to a binary format.
+
+    :param codec: How values are encoded, ``'json'`` (the default) or
+        ``'msgpack'`` (which needs the msgpack package).
+
+    :param compression: ``None`` (the default), ``'zlib'`` or ``'lz4'``
+        (which needs the lz4 package).
+
+    :param compress_threshold: Values smaller than this many bytes once
+        encoded aren't compressed.
+
+    :param level: zlib compression level.
+
+    :param binary: Whether to use a compact binary encoding, with JSON
+        values. Other codecs and compression always use a binary encoding.
+    """
+    VERSION = 2
+    HEADER = Struct('!BBBdddd')
+
+    CODECS = {'json': 1, 'msgpack': 2}
+    COMPRESSIONS = {None: 0, 'zlib': 1, 'lz4': 2}
+
+    DEFAULT_COMPRESS_THRESHOLD = 1024  # bytes
+    DEFAULT_LEVEL = 6
+
+    def __init__(self, codec='json', compression=None,
+            compress_threshold=DEFAULT_COMPRESS_THRESHOLD, level=DEFAULT_LEVEL,
+            binary=False):
+        if codec not in self.CODECS:
+            raise ValueError('Unknown codec %r, should be one of %s.' % (
+                codec, ', '.join(sorted(self.CODECS))))
+
+        if compression not in self.COMPRESSIONS:
+            raise ValueError('Unknown compression %r, should be one of zlib, lz4.' % compression)
+
+        # Fail early if the codec or compression isn't available.
+        if codec == 'msgpack':
+            _import_msgpack()
+        if compression == 'lz4':
+            _import_lz4()
+
+        self.codec = codec
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        self.level = level
+        self.binary = binary
+
+    def _pack(self, value):
+        if self.codec == 'msgpack':
+            return _import_msgpack().packb(value, use_bin_type=True)
+
+        return dumps(value, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def _unpack(codec, data):
+        if codec == Serializer.CODECS['msgpack']:
+            return _import_msgpack().unpackb(data, raw=False)
+
+        return loads(data.decode('utf-8'))
+
+    def _compress(self, data):
+        if self.compression == 'lz4':
+            return _import_lz4().compress(data)
+
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def _decompress(compression, data):
+        if compression == Serializer.COMPRESSIONS['lz4']:
+            return _import_lz4().decompress(data)
+        elif compression == Serializer.COMPRESSIONS['zlib']:
+            return zlib.decompress(data)
+
+        return data
+
+    def dumps(self, entry):
+        """Encode `entry` as bytes."""
+        if self.codec == 'json' and self.compression is None:
+            if self.binary:
+                return entry.encode()
+
+            # Readable by all earlier versions.
+            return dumps(entry.to_legacy_dict(), separators=(',', ':')).encode('utf-8')
+
+        payload = self._pack(entry.value)
+        compression = None
+
+        if self.compression is not None and len(payload) >= self.compress_threshold:
+            compressed = self._compress(payload)
+            if len(compressed) < len(payload):
+                payload = compressed
+                compression = self.compression
+
+        nan = float('nan')
+        header = self.HEADER.pack(self.VERSION, self.CODECS[self.codec],
+            self.COMPRESSIONS[compression], entry.created_at, entry.last_accessed_at,
+            nan if entry.ttl is None else entry.ttl,
+            nan if entry.cost is None else entry.cost)
+
+        return header + payload
+
+    def loads(self, data):
+        """Decode an entry encoded by any version of the SDK.
+
+        :raises ValueError: If `data` isn't an encoded entry.
+        """
+        version = bytearray(data[:1])[0] if data else None
+
+        if version == ord('{'):
+            return CacheEntry.parse(loads(data.decode('utf-8')))
+        elif version == CacheEntry.ENCODING_VERSION:
+            return CacheEntry.decode(data)
+        elif version != self.VERSION or len(data) < self.HEADER.size:
+            raise ValueError('Not an encoded cache entry.')
+
+        _, codec, compression, created_at, last_accessed_at, ttl, cost = \
+            self.HEADER.unpack(data[:self.HEADER.size])
+        value = self._unpack(codec, self._decompress(compression, data[self.HEADER.size:]))
+
+        return CacheEntry(value, created_at=created_at, last_accessed_at=last_accessed_at,
+            ttl=None if isnan(ttl) else ttl, cost=None if isnan(cost) else cost)
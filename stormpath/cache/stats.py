@@ -2,38 +2,103 @@
 
 
 from collections import namedtuple
+from threading import Lock
+
+from six.moves._thread import get_ident
+
+
+def _counter(index):
+    return property(lambda self: self._count(index))
 
 
 class CacheStats(object):
-    """Represents cache statistics."""
+    """Represents cache statistics.
+
+    The statistics are safe to update from several threads. Each thread
+    increments counters of its own, which are added up when read, so threads
+    hitting the cache don't contend on a lock.
+
+    For a :class:`stormpath.cache.cache.TieredCache`, ``l1_hits`` are the
+    hits served by the in-process tier, and the other hits were served by
+    the shared store.
+
+    ``reclaimed`` is the number of expired entries removed by the expiry
+    sweeper (see :class:`stormpath.cache.sweeper.ExpirySweeper`).
+    """
     Summary = namedtuple('CacheStats', 'puts hits misses expirations size')
 
+    PUTS, HITS, MISSES, EXPIRATIONS, STALE_HITS, REVALIDATIONS, L1_HITS, RECLAIMED = range(8)
+
     def __init__(self):
-        self.puts = 0
-        self.hits = 0
-        self.misses = 0
-        self.expirations = 0
-        self.size = 0
+        # Counters by thread id. Ids are only reused once a thread is done,
+        # so each set of counters is only ever updated by one thread.
+        self.cells = {}
+        self.lock = Lock()
+        self._size = 0
+
+    def _cell(self):
+        ident = get_ident()
+        cell = self.cells.get(ident)
+
+        if cell is None:
+            with self.lock:
+                cell = self.cells.setdefault(ident, [0] * 8)
+
+        return cell
+
+    def _count(self, index):
+        return sum(cell[index] for cell in list(self.cells.values()))
+
+    puts = _counter(PUTS)
+    hits = _counter(HITS)
+    misses = _counter(MISSES)
+    expirations = _counter(EXPIRATIONS)
+    stale_hits = _counter(STALE_HITS)
+    revalidations = _counter(REVALIDATIONS)
+    l1_hits = _counter(L1_HITS)
+    reclaimed = _counter(RECLAIMED)
+
+    @property
+    def size(self):
+        return self._size
 
     def put(self, new=True):
-        self.puts += 1
+        self._cell()[self.PUTS] += 1
         if new:
-            self.size += 1
+            with self.lock:
+                self._size += 1
 
-    def hit(self):
-        self.hits += 1
+    def hit(self, l1=False):
+        cell = self._cell()
+        cell[self.HITS] += 1
+        if l1:
+            cell[self.L1_HITS] += 1
+
+    def stale_hit(self, revalidating=True):
+        cell = self._cell()
+        cell[self.STALE_HITS] += 1
+        if revalidating:
+            cell[self.REVALIDATIONS] += 1
 
     def miss(self, expired=False):
-        self.misses += 1
+        cell = self._cell()
+        cell[self.MISSES] += 1
         if expired:
-            self.expirations += 1
+            cell[self.EXPIRATIONS] += 1
 
     def delete(self):
-        if self.size > 0:
-            self.size -= 1
+        with self.lock:
+            if self._size > 0:
+                self._size -= 1
+
+    def reclaim(self, count=1):
+        self._cell()[self.RECLAIMED] += count
+        with self.lock:
+            self._size = max(0, self._size - count)
 
     def clear(self):
-        self.size = 0
+        with self.lock:
+            self._size = 0
 
     @property
     def summary(self):
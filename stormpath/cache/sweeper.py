@@ -0,0 +1,86 @@
+"""Removal of expired cache entries."""
+
+
+from heapq import heappop, heappush
+from math import ceil
+from threading import Lock
+
+
+class ExpirySweeper(object):
+    """Keeps track of when cache entries expire, so a
+    :class:`stormpath.cache.cache.Cache` can remove expired entries a few at
+    a time, instead of keeping them in memory until they're read again.
+
+    Keys are kept in buckets by their expiration time, rounded up to
+    ``resolution`` seconds, with a heap of the bucket times. Each key is in
+    at most one bucket: once it's due, the cache checks the entry and
+    schedules it again if it was used or replaced in the meantime. Keys of
+    entries that are evicted or deleted are unscheduled, so there are never
+    more keys than entries in the cache.
+
+    :param resolution: Size of the buckets, in seconds.
+    """
+    RESOLUTION = 1  # seconds
+
+    def __init__(self, resolution=RESOLUTION):
+        self.resolution = resolution
+        self.buckets = {}
+        self.times = []
+        self.scheduled = {}
+        self.lock = Lock()
+
+    def schedule(self, key, expires_at):
+        """Make `key` due at `expires_at` (in seconds since the epoch),
+        unless it's already scheduled."""
+        slot = int(ceil(expires_at / float(self.resolution)))
+
+        with self.lock:
+            if key in self.scheduled:
+                return
+
+            self.scheduled[key] = slot
+            bucket = self.buckets.get(slot)
+
+            if bucket is None:
+                bucket = self.buckets[slot] = set()
+                heappush(self.times, slot)
+
+            bucket.add(key)
+
+    def unschedule(self, key):
+        """Forget about `key`, if it's scheduled."""
+        with self.lock:
+            slot = self.scheduled.pop(key, None)
+
+            # Empty buckets are dropped once they're due.
+            if slot is not None:
+                self.buckets[slot].discard(key)
+
+    def due(self, now, limit):
+        """Remove and return up to `limit` keys that were due by `now`."""
+        keys = []
+        slot = now / float(self.resolution)
+
+        with self.lock:
+            while self.times and self.times[0] <= slot and len(keys) < limit:
+                bucket = self.buckets[self.times[0]]
+
+                while bucket and len(keys) < limit:
+                    keys.append(bucket.pop())
+
+                if not bucket:
+                    del self.buckets[heappop(self.times)]
+
+            for key in keys:
+                del self.scheduled[key]
+
+        return keys
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+            self.scheduled.clear()
+            self.times = []
+
+    def __len__(self):
+        return len(self.scheduled)
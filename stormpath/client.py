@@ -1,14 +1,20 @@
 """Stormpath API client."""
 
 
+from contextlib import contextmanager
+from threading import local
+
 from .auth import Auth
 from .data_store import DataStore
 from .http import HttpExecutor
+from .profiler import Profiler
 from .resources.account_store_mapping import AccountStoreMappingList
 from .resources.api_key import ApiKeyList
+from .resources.base import ExpansionPlanner, IdentityMap
 from .resources.group_membership import GroupMembershipList
 from .resources.organization_account_store_mapping import OrganizationAccountStoreMappingList
 from .resources.tenant import Tenant
+from .unit_of_work import UnitOfWork
 
 
 class Client(object):
@@ -29,7 +35,7 @@ class Client(object):
     """
     BASE_URL = 'https://api.stormpath.com/v1'
 
-    def __init__(self, base_url=None, cache_options=None, expand=None, proxies=None, user_agent=None, backoff_strategy=None, **auth_kwargs):
+    def __init__(self, base_url=None, cache_options=None, expand=None, proxies=None, user_agent=None, backoff_strategy=None, expansion_planner=None, identity_map=None, **auth_kwargs):
         """
         Initialize the client by setting the
         :class:`stormpath.data_store.DataStore` and
@@ -45,14 +51,138 @@ class Client(object):
             to wait before retrying the request. The function must take one parameter
             which is the number of retries already done. If no function is supplied
             the default backoff strategy is used (see the :meth:`stormpath.http.HttpExecutor.pause_exponentially` method).
+
+        :param expansion_planner: (optional) Either True, or an instance of
+            :class:`stormpath.resources.base.ExpansionPlanner`.  If set, linked
+            resources that are lazily loaded while iterating over collections
+            will automatically be expanded on subsequent page fetches.  The
+            learned expansions are available via
+            ``client.expansion_planner.report()``.
+
+        :param identity_map: (optional) Either True, or an instance of
+            :class:`stormpath.resources.base.IdentityMap`.  If set, all
+            references to a resource (e.g. the same account fetched through
+            several collections or linked from several groups) share a single
+            object, which only loads its data once.  The objects are shared
+            by all threads for as long as they're in use, and aren't
+            reloaded when they expire from the cache, so this is mostly meant
+            for scripts -- see :meth:`identity_scope` otherwise.
         """
         self.BASE_URL = base_url or self.BASE_URL
 
         self.auth = Auth(**auth_kwargs)
         executor = HttpExecutor(self.BASE_URL, self.auth.scheme, proxies, user_agent=user_agent, get_delay=backoff_strategy)
         self.data_store = DataStore(executor, cache_options)
+
+        if expansion_planner is True:
+            expansion_planner = ExpansionPlanner()
+        self.expansion_planner = expansion_planner or None
+
+        if identity_map is True:
+            identity_map = IdentityMap()
+        self._identity_map = identity_map if isinstance(identity_map, IdentityMap) else None
+        self._local = local()
+        self.profiler = None
+
         self.tenant = Tenant(client=self, href='/tenants/current', expand=expand)
 
+    def profile(self, max_api_calls=None, **kwargs):
+        """
+        Profile lazy resource loads and API calls made through this Client.
+
+        :param int max_api_calls: (optional) If set, an AssertionError is
+            raised when leaving the context if more API calls were made.
+
+        All other arguments are passed to :class:`stormpath.profiler.Profiler`.
+
+        Examples::
+
+            with client.profile() as profiler:
+                for account in application.accounts:
+                    print(account.directory.name)
+
+            print(profiler.report())
+
+        Asserting the number of API calls in tests::
+
+            with client.profile(max_api_calls=1):
+                application.accounts.get(href).custom_data['favorite_color']
+        """
+        return Profiler(self, max_api_calls=max_api_calls, **kwargs)
+
+    def unit_of_work(self, **kwargs):
+        """
+        Collect the writes made within a block of code, and send them together
+        when leaving it.
+
+        Arguments are passed to :class:`stormpath.unit_of_work.UnitOfWork`.
+
+        Examples::
+
+            with client.unit_of_work():
+                account.given_name = 'Randall'
+                account.save()
+                account.custom_data['favorite_color'] = 'blue'
+                account.save()
+                account.add_group(group)
+        """
+        return UnitOfWork(self.data_store, **kwargs)
+
+    @property
+    def identity_map(self):
+        """The :class:`stormpath.resources.base.IdentityMap` of the
+        :meth:`identity_scope` in progress in the current thread, or else the
+        one of the client, or None."""
+        identity_map = getattr(self._local, 'identity_map', None)
+        if identity_map is not None:
+            return identity_map
+
+        return self._identity_map
+
+    @identity_map.setter
+    def identity_map(self, identity_map):
+        self._identity_map = identity_map
+
+    @contextmanager
+    def identity_scope(self):
+        """
+        Share a single object per resource within a block of code (e.g. the
+        handling of a request), see
+        :class:`stormpath.resources.base.IdentityMap`.
+
+        The scope only applies to the current thread, and its resources are
+        no longer shared once it's left, so they can't get out of date or
+        carry unsaved changes over to other scopes.
+
+        Examples::
+
+            with client.identity_scope():
+                for group in account.groups:
+                    for member in group.accounts:
+                        ...
+        """
+        previous = getattr(self._local, 'identity_map', None)
+        self._local.identity_map = IdentityMap()
+        try:
+            yield self._local.identity_map
+        finally:
+            self._local.identity_map = previous
+
+    def cache_policy(self, policy):
+        """
+        Change how the cache is used by reads within a block of code.
+
+        See :meth:`stormpath.data_store.DataStore.cache_policy` for the
+        available policies.
+
+        Examples::
+
+            with client.cache_policy('bypass'):
+                for account in client.accounts:
+                    ...
+        """
+        return self.data_store.cache_policy(policy)
+
     @property
     def account_store_mappings(self):
         """
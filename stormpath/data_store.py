@@ -1,7 +1,93 @@
 """Data store abstractions."""
 
 
+import mmap
+import os
+import re
+from collections import OrderedDict
+from contextlib import contextmanager
+from json import dumps, loads
+from threading import local
+from time import time
+
+from .cache.cache import Cache
+from .cache.entry import CacheEntry
+from .cache.index import ResourceIndex
 from .cache.manager import CacheManager
+from .cache.memory_store import MemoryBudget
+from .error import Error
+from .resources import Resource
+
+
+def parse_expand(expand):
+    """Parse an ``expand`` query parameter into its expanded attributes.
+
+    :param str expand: An expand string as produced by
+        :meth:`stormpath.resources.base.Expansion.get_params`, e.g.
+        ``'directory,groups(offset:0,limit:25)'``.
+    :returns: An ordered mapping of attribute names to their offset and limit
+        options (an empty dict if no options were given).
+    :rtype: OrderedDict
+    """
+    ret = OrderedDict()
+
+    for part in re.findall(r'[^,(]+(?:\([^)]*\))?', expand or ''):
+        name, _, opts = part.strip().partition('(')
+        ret[name] = {}
+
+        for opt in opts.rstrip(')').split(','):
+            if ':' in opt:
+                k, v = opt.split(':', 1)
+                ret[name][k.strip()] = int(v)
+
+    return ret
+
+
+def format_expand(expansions):
+    """Inverse of :func:`parse_expand`."""
+    ret = []
+
+    for name, opts in expansions.items():
+        opts = ','.join('%s:%d' % i for i in sorted(opts.items()))
+        ret.append(name + ('(' + opts + ')' if opts else ''))
+
+    return ','.join(ret)
+
+
+def get_resource_classes(cls=Resource):
+    """Return all subclasses of
+    :class:`stormpath.resources.base.Resource`, recursively."""
+    ret = []
+    for subclass in cls.__subclasses__():
+        ret.append(subclass)
+        ret.extend(get_resource_classes(subclass))
+
+    return ret
+
+
+class NoCache(object):
+    """Stands in for the cache of hrefs which aren't cached."""
+
+    def get(self, *args, **kwargs):
+        return None
+
+    def get_stale(self, *args, **kwargs):
+        return None
+
+    def __contains__(self, key):
+        return False
+
+    def put(self, *args, **kwargs):
+        pass
+
+    def delete(self, *args, **kwargs):
+        pass
+
+    def delete_local(self, *args, **kwargs):
+        pass
+
+
+NO_CACHE = NoCache()
 
 
 class DataStore(object):
@@ -33,24 +119,89 @@ class DataStore(object):
                 'directories': {
                     'ttl': 60,
                     'tti': 60,
+                    'stale_while_revalidate': 30,
                 }
             }
         })
+
+    Regions with ``l1`` options (e.g. ``{'ttl': 5}``) get a small in-process
+    tier in front of their store, which saves a network round trip on most
+    hits to a remote store (see :class:`stormpath.cache.cache.TieredCache`).
+
+    Memory store regions can be limited to an (estimated) number of bytes
+    with the ``max_bytes`` store option, and the ``max_bytes`` cache option
+    caps the memory taken by all of them together. The memory taken by each
+    region is reported by ``data_store.cache_manager.memory_usage``::
+
+        data_store = DataStore(executor, {
+            'max_bytes': 256 * 1024 * 1024,
+            'regions': {
+                'customData': {
+                    'store_opts': {'max_bytes': 64 * 1024 * 1024},
+                },
+            },
+        })
+
+    With the ``index`` cache option set to True (or a
+    :class:`stormpath.cache.index.ResourceIndex`), the data store indexes the
+    resources it caches by email, username, group name and API key id, so
+    e.g. adding an account to a group by its email doesn't need a search.
+
+    To keep the caches of several processes in sync, pass an invalidation bus
+    (see :mod:`stormpath.cache.invalidation`) as the ``invalidation_bus``
+    cache option. Resources updated, deleted or uncached by one process are
+    then evicted from the in-process caches of all others (memory stores and
+    L1 tiers; shared stores like Redis are kept up to date by the process
+    that made the change)::
+
+        from stormpath.cache.invalidation import RedisInvalidationBus
+
+        data_store = DataStore(executor, {
+            'ttl': 60 * 60,
+            'invalidation_bus': RedisInvalidationBus(host='localhost'),
+        })
+
+    If ``outage_retry_after`` is set in the cache options, the data store
+    switches to a degraded read-only mode when the Stormpath API is
+    unreachable or responds with a server error: reads are served from expired
+    cache entries, as long as they expired less than their region's
+    ``max_stale`` seconds ago, and are flagged with ``sp_stale`` (see
+    :meth:`stormpath.resources.base.Resource.is_stale`). Writes are rejected
+    right away. The API is tried again every ``outage_retry_after`` seconds::
+
+        data_store = DataStore(executor, {
+            'outage_retry_after': 30,
+            'max_stale': 15 * 60,
+        })
     """
+    # Resource classes declare their own cache regions (see
+    # Resource.cache_region), these are the cached regions of everything else.
     CACHE_REGIONS = (
-        'accounts',
-        'apiKeys',
-        'accountStoreMappings',
-        'applications',
-        'customData',
-        'directories',
-        'organizations',
-        'groups',
-        'groupMemberships',
-        'tenants',
         'nonces',
     )
 
+    # Maximum number of hrefs whose cache region lookup is memoised.
+    MAX_HREF_CACHE = 10000
+
+    # 404 responses are cached in a region of their own, with a short TTL, so
+    # repeated lookups of hrefs known to be missing don't hit the API.
+    NOT_FOUND_REGION = 'notFound'
+    NOT_FOUND_TTL = 30  # seconds
+
+    # Cache policies, see cache_policy().
+    BYPASS = 'bypass'
+    READ_ONLY = 'read_only'
+    REFRESH = 'refresh'
+    NO_ADMIT = 'no_admit'
+    CACHE_POLICIES = (BYPASS, READ_ONLY, REFRESH, NO_ADMIT)
+
+    # First line of cache snapshot files, see snapshot().
+    SNAPSHOT_HEADER = b'stormpath-cache-snapshot 1\n'
+
+    # Cache options of the data store itself, not passed on to the regions.
+    DATA_STORE_OPTIONS = ('regions', 'outage_retry_after', 'invalidation_bus', 'index',
+        'max_bytes')
+
     def __init__(self, executor, cache_options=None):
         """
         Initialize the DataStore.
@@ -64,70 +215,334 @@ class DataStore(object):
         """
         self.cache_manager = CacheManager()
         self.executor = executor
+        self.profiler = None
+        self._local = local()
 
         if cache_options is None:
             cache_options = {}
 
-        for region in self.CACHE_REGIONS:
-            opts = cache_options.get('regions', {}).get(region, {})
+        self.outage_retry_after = cache_options.get('outage_retry_after')
+        self.outage_since = None
+        self._outage_checked_at = None
+
+        configured = cache_options.get('regions', {})
+        defaults = dict((r, {}) for r in self.CACHE_REGIONS)
+        defaults[self.NOT_FOUND_REGION] = {'ttl': self.NOT_FOUND_TTL, 'tti': self.NOT_FOUND_TTL}
+        segments = dict((r, [r]) for r in list(defaults) + list(configured))
+
+        for resource_class in get_resource_classes():
+            region = resource_class.cache_region
+            if region is None:
+                continue
+
+            segments.setdefault(region, [region]).extend(resource_class.cache_href_segments)
+            if resource_class.cache_options is not None:
+                defaults.setdefault(region, {}).update(resource_class.cache_options)
+
+        self._routes = {}
+        self._href_cache = {}
+
+        # A memory cap shared by all memory store regions.
+        budget = None
+        if cache_options.get('max_bytes') is not None:
+            budget = MemoryBudget(cache_options['max_bytes'])
+
+        for region in segments:
+            if region not in configured and region not in defaults:
+                continue
+
+            opts = dict(defaults.get(region, {}))
+            opts.update(configured.get(region, {}))
+
             for k, v in cache_options.items():
-                if k not in opts and k != 'regions':
+                if k not in opts and k not in self.DATA_STORE_OPTIONS:
                     opts[k] = v
 
+            if budget is not None and opts.get('store', Cache.DEFAULT_STORE) in Cache.MEMORY_STORES:
+                opts['store_opts'] = dict(opts.get('store_opts') or {}, budget=budget)
+
             self.cache_manager.create_cache(region, **opts)
+            if region != self.NOT_FOUND_REGION:
+                for segment in segments[region]:
+                    self._routes[segment] = self.cache_manager.get_cache(region)
+
+        self.not_found_cache = self.cache_manager.get_cache(self.NOT_FOUND_REGION)
+
+        # Secondary indexes, so looking resources up by e.g. email doesn't
+        # need a search (see ResourceIndex).
+        index = cache_options.get('index')
+        if index is True:
+            index = ResourceIndex()
+        elif not isinstance(index, ResourceIndex):
+            index = None
+        self.index = index
+
+        self.invalidation_bus = cache_options.get('invalidation_bus')
+        if self.invalidation_bus is not None:
+            self._subscriber_id = self.invalidation_bus.subscribe(self._invalidated)
+
+    @property
+    def policy(self):
+        """The cache policy in effect for the current thread, or None."""
+        return getattr(self._local, 'policy', None)
+
+    @property
+    def unit_of_work(self):
+        """The :class:`stormpath.unit_of_work.UnitOfWork` in progress in the
+        current thread, or None."""
+        return getattr(self._local, 'unit_of_work', None)
+
+    @unit_of_work.setter
+    def unit_of_work(self, unit_of_work):
+        self._local.unit_of_work = unit_of_work
+
+    @contextmanager
+    def cache_policy(self, policy):
+        """
+        Change how the cache is used by reads within a block of code.
 
-    def _get_cache(self, href):
-        class NoCache(object):
-            def get(self, *args, **kwargs):
+        :param str policy: One of:
+
+            - ``'bypass'``: Don't read from or write to the cache.
+            - ``'read_only'``: Read from the cache, but don't put fetched
+              resources into it.
+            - ``'refresh'``: Always fetch from the Stormpath API service, and
+              update the cache with the result.
+            - ``'no_admit'``: Read from the cache, but only update resources
+              that are already cached -- new ones aren't added.
+
+        Creates, updates and deletes always keep the cache up to date. The
+        policy only applies to the current thread.
+
+        Examples::
+
+            # Scan all accounts without evicting the hot ones.
+            with data_store.cache_policy('no_admit'):
+                for account in client.accounts:
+                    ...
+
+            # Get a guaranteed fresh copy.
+            with data_store.cache_policy('refresh'):
+                account.status
+        """
+        if policy not in self.CACHE_POLICIES:
+            raise ValueError('Invalid cache policy %r, use one of: %s.' % (policy, ', '.join(self.CACHE_POLICIES)))
+
+        previous = self.policy
+        self._local.policy = policy
+        try:
+            yield
+        finally:
+            self._local.policy = previous
+
+    @property
+    def in_outage(self):
+        """Whether the data store is in degraded read-only mode."""
+        return self.outage_since is not None
+
+    @staticmethod
+    def is_outage_error(error):
+        """Whether `error` means the Stormpath API is unavailable: it's either
+        a connection error or a server error. Other errors without an HTTP
+        status, like redirects outside of the API, aren't outages."""
+        return error.connection_error or error.status >= 500
+
+    def _outage_started(self):
+        now = time()
+        if self.outage_since is None:
+            self.outage_since = now
+
+        self._outage_checked_at = now
+
+    def _outage_ended(self):
+        self.outage_since = self._outage_checked_at = None
+
+    def _should_skip_api(self):
+        """While in an outage, only try the API every `outage_retry_after`
+        seconds."""
+        return self.in_outage and time() - self._outage_checked_at < self.outage_retry_after
+
+    def _get_stale(self, href):
+        data = self._get_cache(href).get_stale(href)
+        if data is None:
+            return None
+
+        data = dict(data)
+        data['sp_stale'] = True
+
+        return data
+
+    def _get_stale_resource(self, href, params=None):
+        """Serve a resource, with its expanded attributes (if any), from
+        cache entries that may have expired but are still servable.
+
+        :returns: The resource, or None if it or any of its expansions
+            aren't in the cache.
+        """
+        data = self._get_stale(href)
+        if data is None or not params:
+            return data
+
+        for name, opts in parse_expand(params['expand']).items():
+            value = self._get_cached_expansion(data.get(name), opts, get=self._get_stale)
+            if value is None:
                 return None
 
-            def put(self, *args, **kwargs):
-                pass
+            data[name] = value
+
+        return data
+
+    def _check_outage(self, href):
+        """Reject writes while the Stormpath API is unavailable."""
+        if self._should_skip_api():
+            raise Error({
+                'developerMessage': 'The Stormpath API is unavailable, %s was not modified. '
+                    'Retrying in %d seconds.' % (href, self.outage_retry_after),
+                'message': 'The service is temporarily unavailable.',
+            }, http_status=503)
+
+    def _get_cache(self, href):
+        cache = self._href_cache.get(href)
+
+        if cache is None:
+            if len(self._href_cache) >= self.MAX_HREF_CACHE:
+                self._href_cache.clear()
 
-            def delete(self, *args, **kwargs):
-                pass
+            cache = self._href_cache[href] = self._route(href)
 
+        return cache
+
+    def _route(self, href):
         if '/' not in href:
-            return NoCache()
+            return NO_CACHE
 
-        parts = href.split('/')
+        parts = href.rsplit('/', 2)
 
         # resource hrefs are in format:
         # ".../resource/resource_uid"
-        if parts[-2] in self.CACHE_REGIONS:  # We only care about instances.
-            return self.cache_manager.get_cache(parts[-2]) or NoCache()
+        if len(parts) > 2 and parts[-2] in self._routes:  # We only care about instances.
+            return self._routes[parts[-2]]
 
         # custom data hrefs are in format:
         # ".../resource/resource_uid/customData"
-        elif parts[-1] in self.CACHE_REGIONS and parts[-1] == 'customData':
-            return self.cache_manager.get_cache(parts[-1]) or NoCache()
+        elif parts[-1] == 'customData':
+            return self._routes.get(parts[-1], NO_CACHE)
 
         else:
-            return NoCache()
+            return NO_CACHE
 
     def _cache_get(self, href):
-        return self._get_cache(href).get(href)
+        if self.policy in (self.BYPASS, self.REFRESH):
+            return None
+
+        return self._get_cache(href).get(href, revalidate=lambda: self._fetch_resource(href))
 
-    def _cache_put(self, href, data, new=True):
+    def _cache_put(self, href, data, new=True, cost=None, policy=None):
         resource_data = {}
         for name, value in data.items():
             if isinstance(value, dict) and 'href' in value:
                 v2 = {'href': value['href']}
                 if 'items' in value:
+                    # Keep the page boundaries around so an expanded
+                    # collection can later be rebuilt from the cache.
+                    for meta in ('offset', 'limit', 'size'):
+                        if meta in value:
+                            v2[meta] = value[meta]
+
                     v2['items'] = []
 
                     for item in value['items']:
-                        self._cache_put(item['href'], item)
+                        self._cache_put(item['href'], item, policy=policy)
                         v2['items'].append({'href': item['href']})
                 else:
                     if len(value) > 1:
-                        self._cache_put(value['href'], value)
+                        self._cache_put(value['href'], value, policy=policy)
             else:
                 v2 = value
 
             resource_data[name] = v2
 
-        self._get_cache(href).put(href, resource_data, new=new)
+        cache = self._get_cache(href)
+        if policy != self.NO_ADMIT or href in cache:
+            cache.put(href, resource_data, new=new, cost=cost)
+
+        if self.index is not None:
+            self.index.add(data.get('href', href), data)
+
+    def snapshot(self, path):
+        """
+        Save the contents of all cache regions, including the timestamps of
+        every entry, to a file, so they can be loaded by :meth:`restore`.
+
+        Only regions whose cache store can list its entries (e.g.
+        :class:`stormpath.cache.memory_store.MemoryStore`) are saved; remote
+        stores outlive the process anyway.
+
+        :param str path: The file to save the snapshot to.  It's replaced
+            atomically.
+        :returns: The number of entries saved.
+        :rtype: int
+
+        Examples::
+
+            data_store.snapshot('/var/cache/stormpath.snapshot')
+        """
+        count = 0
+        tmp_path = path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            f.write(self.SNAPSHOT_HEADER)
+
+            for region, cache in self.cache_manager.caches.items():
+                for key, entry in cache.items():
+                    f.write(dumps([region, key, entry.to_dict()], separators=(',', ':')).encode('utf-8'))
+                    f.write(b'\n')
+                    count += 1
+
+        os.rename(tmp_path, path)
+
+        return count
+
+    def restore(self, path):
+        """
+        Load the cache entries saved by :meth:`snapshot` into the cache.
+
+        Entries that can't be served anymore (i.e. that have expired, or
+        expired more than their region's ``max_stale`` seconds ago), and
+        entries of regions this data store doesn't have, are skipped.
+
+        :param str path: The snapshot file.
+        :returns: The number of entries restored.
+        :rtype: int
+
+        Examples::
+
+            data_store.restore('/var/cache/stormpath.snapshot')
+        """
+        count = 0
+
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size <= len(self.SNAPSHOT_HEADER):
+                return count
+
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if data.readline() != self.SNAPSHOT_HEADER:
+                    raise ValueError('%s is not a cache snapshot.' % path)
+
+                for line in iter(data.readline, b''):
+                    region, key, entry = loads(line.decode('utf-8'))
+
+                    cache = self.cache_manager.get_cache(region)
+                    if cache is None:
+                        continue
+
+                    if cache.restore(key, CacheEntry.parse(entry)):
+                        count += 1
+            finally:
+                data.close()
+
+        return count
 
     def uncache_resource(self, href):
         """
@@ -155,6 +570,18 @@ class DataStore(object):
             href = '/'.join(parts[:-1])
 
         self._get_cache(href).delete(href)
+        self._publish(href)
+
+    def _publish(self, href):
+        if self.invalidation_bus is not None:
+            self.invalidation_bus.publish(self._subscriber_id, href)
+
+    def _invalidated(self, href):
+        """Evict `href`, invalidated by another data store, from the caches
+        of this process. Shared caches were already updated by the other data
+        store."""
+        self._get_cache(href).delete_local(href)
+        self.not_found_cache.delete_local(href)
 
     def get_resource(self, href, params=None):
         """
@@ -183,30 +610,189 @@ class DataStore(object):
         #   no)
         #   - recursively cache resources via expansions
         #   - remove expanded resources and 'clean' objects before caching
+        if params and list(params.keys()) == ['expand']:
+            return self._get_expanded_resource(href, params['expand'])
+
         data = self._cache_get(href)
         if data is None:
+            data = self._fetch_resource(href, params)
+
+        return data
+
+    def _api_call(self, method, href):
+        if self.profiler is not None:
+            self.profiler.api_call(method, href)
+
+    def _fetch_resource(self, href, params=None):
+        # Only plain resource lookups are cached as missing; queries against
+        # collections depend on their params.
+        policy = self.policy
+        cache_not_found = not params or list(params.keys()) == ['expand']
+
+        if cache_not_found and policy not in (self.BYPASS, self.REFRESH):
+            error = self.not_found_cache.get(href)
+            if error is not None:
+                raise Error(error, http_status=404)
+
+        outage_mode = self.outage_retry_after is not None
+        if outage_mode and cache_not_found and self._should_skip_api():
+            data = self._get_stale_resource(href, params)
+            if data is not None:
+                return data
+
+        self._api_call('GET', href)
+        start = time()
+        try:
             data = self.executor.get(href, params=params)
+            cost = time() - start
+        except Error as e:
+            if outage_mode and self.is_outage_error(e):
+                self._outage_started()
+
+                data = self._get_stale_resource(href, params) if cache_not_found else None
+                if data is not None:
+                    return data
+
+            if cache_not_found and e.status == 404 and \
+                    policy not in (self.BYPASS, self.READ_ONLY, self.NO_ADMIT):
+                self._get_cache(href).delete(href)
+                self.not_found_cache.put(href, {
+                    'status': e.status,
+                    'code': e.code,
+                    'developerMessage': e.developer_message,
+                    'message': e.user_message,
+                    'moreInfo': e.more_info,
+                })
+
+            raise
+
+        if outage_mode:
+            self._outage_ended()
+
+        if policy in (self.BYPASS, self.READ_ONLY):
+            return data
+
+        if data.get('items') and len(data['items']) > 0:
+            for item in data.get('items'):
+                self._cache_put(item['href'], item, policy=policy)
+
+        self._cache_put(href, data, cost=cost, policy=policy)
+
+        return data
+
+    def _get_cached_expansion(self, value, opts, get=None):
+        """Rebuild a single expanded attribute from the cache.
+
+        :param value: The (stripped) attribute value as stored in the cached
+            parent resource.
+        :param dict opts: The requested offset and limit, if any.
+        :param get: Function used to look up the resources it refers to
+            (defaults to :meth:`_cache_get`).
+        :returns: The expanded attribute, or None if any of the resources it
+            refers to are not in the cache.
+        """
+        if not isinstance(value, dict) or 'href' not in value:
+            return None
+
+        get = get or self._cache_get
+        if 'items' not in value:
+            return get(value['href'])
+
+        # We can only serve the exact page that was cached.
+        if value.get('offset') != opts.get('offset', 0):
+            return None
+        if 'limit' in opts and value.get('limit') != opts['limit']:
+            return None
+
+        items = []
+        for item in value['items']:
+            item = get(item['href'])
+            if item is None:
+                return None
+
+            items.append(item)
 
-            if data.get('items') and len(data['items']) > 0:
-                for item in data.get('items'):
-                    self._cache_put(item['href'], item)
+        expanded = dict(value)
+        expanded['items'] = items
 
-            self._cache_put(href, data)
+        return expanded
+
+    def _get_expanded_resource(self, href, expand):
+        """Retrieve a resource with expanded attributes.
+
+        The resource and every expanded attribute are looked up in the cache
+        first. Only the expansions which can't be served from the cache are
+        requested from the Stormpath API service.
+        """
+        data = self._cache_get(href)
+        if data is None:
+            return self._fetch_resource(href, {'expand': expand})
+
+        data = dict(data)
+        missing = OrderedDict()
+        expanded = {}
+
+        for name, opts in parse_expand(expand).items():
+            value = self._get_cached_expansion(data.get(name), opts)
+            if value is None:
+                missing[name] = opts
+            else:
+                expanded[name] = value
+
+        if missing:
+            data = dict(self._fetch_resource(href, {'expand': format_expand(missing)}))
+
+        data.update(expanded)
 
         return data
 
+    def _write(self, method, href, *args, **kwargs):
+        self._check_outage(href)
+        self._api_call(method.upper(), href)
+
+        try:
+            data = getattr(self.executor, method)(href, *args, **kwargs)
+        except Error as e:
+            if self.outage_retry_after is not None and self.is_outage_error(e):
+                self._outage_started()
+
+            raise
+
+        self._outage_ended()
+        return data
+
+    def _write_through(self, data, new=True):
+        """Cache the response of a write, under the href of the resource it
+        returns rather than the one written to (e.g. a new account is cached
+        under its own href, not the href of the collection it was created
+        in). Responses that aren't resources themselves, like login
+        attempts, only have their expanded resources cached."""
+        if 'href' in data:
+            self._cache_put(data['href'], data, new=new)
+            return
+
+        for value in data.values():
+            if isinstance(value, dict) and 'href' in value and len(value) > 1:
+                self._cache_put(value['href'], value)
+
     def create_resource(self, href, data, params=None):
-        data = self.executor.post(href, data, params=params)
-        self._cache_put(href, data)
+        data = self._write('post', href, data, params=params)
+        self._write_through(data)
+
+        # Whatever we've just created is no longer missing.
+        if 'href' in data:
+            self.not_found_cache.delete(data['href'])
+            self._publish(data['href'])
 
         return data
 
     def update_resource(self, href, data):
-        data = self.executor.post(href, data)
-        self._cache_put(href, data, new=False)
+        data = self._write('post', href, data)
+        self._write_through(data, new=False)
+        self._publish(href)
 
         return data
 
     def delete_resource(self, href):
-        self.executor.delete(href)
+        self._write('delete', href)
         self.uncache_resource(href)
@@ -24,7 +24,12 @@ class Error(RuntimeError):
 
     :py:attr:`more_info` - A fully qualified URL that may be accessed to
         obtain more information about the error.
+
+    :py:attr:`connection_error` - Whether the request failed before a
+        response was received, because the API couldn't be reached.
     """
+    connection_error = False
+
     def __init__(self, error, http_status=None):
         if error is None:
             error = {}
@@ -50,3 +55,20 @@ class Error(RuntimeError):
         self.user_message = error.get('message')
         self.more_info = error.get('moreInfo')
         self.message = msg
+
+
+class UnitOfWorkError(Error):
+    """Error raised when several writes of a
+    :class:`stormpath.unit_of_work.UnitOfWork` fail.
+
+    Its status is that of the first error. The error also contains the
+    following attribute:
+
+    :py:attr:`errors` - The errors raised by each failed write, in the
+        order the writes were collected.
+    """
+    def __init__(self, errors):
+        super(UnitOfWorkError, self).__init__(
+            '%d writes failed, the first with: %s' % (len(errors), errors[0]),
+            http_status=getattr(errors[0], 'status', None))
+        self.errors = errors
@@ -152,7 +152,9 @@ class HttpExecutor(object):
                 self.pause_exponentially(retry_count)
                 return self.request(method, url, data=data, params=params, headers=headers, retry_count=retry_count + 1)
             else:
-                raise Error({'developerMessage': str(e)})
+                error = Error({'developerMessage': str(e)})
+                error.connection_error = isinstance(e, RequestException)
+                raise error
 
         if r.status_code in [301, 302] and 'location' in r.headers:
             if not r.headers['location'].startswith(self.base_url):
@@ -0,0 +1,180 @@
+"""Lazy-load profiling utilities."""
+
+
+import sys
+import time
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+from os.path import abspath, dirname
+
+
+PACKAGE_DIR = dirname(abspath(__file__))
+
+
+class Profiler(object):
+    """Records lazy resource loads and the API calls they cause.
+
+    Every lazy :meth:`stormpath.resources.base.Resource._ensure_data` and
+    :meth:`stormpath.resources.base.CollectionResource._get_next_page` call is
+    recorded along with the attribute access that triggered it, a summary of
+    the calling code, its latency and whether the cache served it.
+
+    Loads of the same linked resource attribute repeated from the same place
+    in your code are reported as N+1 suspects -- this is what iterating over
+    a collection and touching e.g. ``account.directory.name`` on every item
+    looks like.
+
+    The profiler is usually used as a context manager through
+    :meth:`stormpath.client.Client.profile`::
+
+        with client.profile(max_api_calls=2) as profiler:
+            for account in application.accounts:
+                account.directory.name
+
+        print(profiler.report())
+
+    :param client: The :class:`stormpath.client.Client` to profile.
+
+    :param max_api_calls: (optional) If set, an AssertionError is raised when
+        leaving the context if more API calls were made.
+
+    :param threshold: Number of repeated loads after which a call site is
+        reported as an N+1 suspect.
+
+    :param stack_depth: Number of frames kept in each stack summary.
+    """
+    Record = namedtuple('Record', 'kind resource href attribute linked_from stack latency cached')
+
+    DEFAULT_THRESHOLD = 2
+    DEFAULT_STACK_DEPTH = 3
+
+    def __init__(self, client, max_api_calls=None, threshold=DEFAULT_THRESHOLD,
+            stack_depth=DEFAULT_STACK_DEPTH):
+        self.client = client
+        self.max_api_calls = max_api_calls
+        self.threshold = threshold
+        self.stack_depth = stack_depth
+        self.records = []
+        self.api_calls = []
+        self._previous = None
+
+    def start(self):
+        self._previous = self.client.profiler
+        self.client.profiler = self
+        self.client.data_store.profiler = self
+
+    def stop(self):
+        self.client.profiler = self._previous
+        self.client.data_store.profiler = self._previous
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+        if exc_type is None and self.max_api_calls is not None:
+            self.assert_max_api_calls(self.max_api_calls)
+
+    def assert_max_api_calls(self, max_api_calls):
+        if len(self.api_calls) > max_api_calls:
+            raise AssertionError('Expected at most %d API calls, %d were made.\n%s' % (
+                max_api_calls, len(self.api_calls), self.report()))
+
+    def api_call(self, method, href):
+        """Record an API call made by the data store."""
+        self.api_calls.append((method, href))
+
+    @staticmethod
+    def _get_trigger():
+        """Find the attribute access which triggered the current load."""
+        frame = sys._getframe(1)
+
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename.startswith(PACKAGE_DIR) and \
+                    code.co_name in ('__getattr__', '__getitem__', '__contains__'):
+                return frame.f_locals.get('name', frame.f_locals.get('key'))
+
+            frame = frame.f_back
+
+    def _get_stack(self):
+        """Summarize the code outside of the SDK which caused the load."""
+        stack = traceback.extract_stack()
+
+        for i, frame in enumerate(stack):
+            if abspath(frame[0]).startswith(PACKAGE_DIR):
+                stack = stack[:i]
+                break
+
+        return tuple('%s:%d in %s' % tuple(f[:3]) for f in stack[-self.stack_depth:])
+
+    @contextmanager
+    def track(self, kind, resource, linked_from=None):
+        calls = len(self.api_calls)
+        start = time.time()
+
+        yield
+
+        latency = time.time() - start
+        if linked_from:
+            linked_from = '%s.%s' % (linked_from[0].__name__, linked_from[1])
+
+        self.records.append(self.Record(
+            kind=kind,
+            resource=resource.__class__.__name__,
+            href=resource.href,
+            attribute=self._get_trigger(),
+            linked_from=linked_from,
+            stack=self._get_stack(),
+            latency=latency,
+            cached=len(self.api_calls) == calls,
+        ))
+
+    @property
+    def suspects(self):
+        """Return the repeated loads of linked resources, as a list of
+        ``(linked_from, stack, count)`` tuples, most frequent first."""
+        counts = {}
+
+        for r in self.records:
+            if r.linked_from:
+                key = (r.linked_from, r.stack)
+                counts[key] = counts.get(key, 0) + 1
+
+        return sorted([k + (v,) for k, v in counts.items() if v >= self.threshold],
+            key=lambda s: -s[2])
+
+    def summary(self):
+        return {
+            'api_calls': len(self.api_calls),
+            'loads': len(self.records),
+            'cached_loads': len([r for r in self.records if r.cached]),
+            'latency': sum(r.latency for r in self.records),
+            'suspects': self.suspects,
+        }
+
+    def report(self):
+        """Return a human readable report of the profiled loads."""
+        summary = self.summary()
+        lines = ['%d API calls, %d lazy loads (%d served from cache), %.3fs spent loading.' % (
+            summary['api_calls'], summary['loads'], summary['cached_loads'],
+            summary['latency'])]
+
+        for linked_from, stack, count in summary['suspects']:
+            lines.append('Possible N+1: %s loaded %d times from:' % (linked_from, count))
+            lines.extend('    ' + frame for frame in stack)
+
+        return '\n'.join(lines)
+
+
+@contextmanager
+def track(profiler, kind, resource, linked_from=None):
+    """Track a lazy load with `profiler`, if profiling is enabled."""
+    if profiler is None:
+        yield
+    else:
+        with profiler.track(kind, resource, linked_from):
+            yield
@@ -0,0 +1,312 @@
+"""Local, read-only replicas of Stormpath data."""
+
+
+import re
+import sqlite3
+from json import dumps, loads
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+from .error import Error
+from .resources.account import Account, AccountList
+from .resources.group import Group, GroupList
+
+
+class ReplicaDataStore(object):
+    """Serves resources from a :class:`Replica` instead of the Stormpath API,
+    and rejects writes."""
+    unit_of_work = None
+
+    def __init__(self, replica):
+        self.replica = replica
+
+    def get_resource(self, href, params=None):
+        data = self.replica.get(href, params)
+        if data is None:
+            raise Error({
+                'developerMessage': 'The resource %s is not in the replica.' % href,
+            }, http_status=404)
+
+        return data
+
+    def _read_only(self, href, *args, **kwargs):
+        raise Error({
+            'developerMessage': 'Replicated resources are read-only, %s was not modified.' % href,
+        }, http_status=405)
+
+    create_resource = update_resource = delete_resource = _read_only
+
+    def uncache_resource(self, href):
+        pass
+
+
+class Replica(object):
+    """A local replica of the accounts, groups and group memberships of a
+    tenant, stored in SQLite.
+
+    The first :meth:`sync` loads everything, fetching collection pages in
+    parallel. Subsequent syncs only fetch the accounts and groups modified
+    since the last one (using ``modifiedAt`` range queries), along with the
+    memberships of the modified accounts and groups. Pages are fetched
+    straight from the Stormpath API, bypassing the client's cache, so a
+    sync doesn't evict the resources the client uses the most.
+
+    Resources served by the replica are regular (but read-only) resource
+    objects, which never make HTTP calls: linked accounts, groups and
+    memberships, as well as searches by ``email``, ``username`` and ``name``,
+    are answered from the replica. Other linked resources aren't replicated,
+    accessing them raises a 404 :class:`stormpath.error.Error`.
+
+    .. note::
+        Incremental syncs can't see deletions, nor memberships added to or
+        removed from an account and a group which were both otherwise left
+        unmodified. Run a full sync every now and then
+        (``replica.sync(full=True)``) to catch up with those.
+
+    Examples::
+
+        replica = Replica(client, '/var/lib/stormpath/replica.db')
+        replica.sync()
+
+        account = replica.accounts.search({'email': 'randall@example.com'})[0]
+        groups = [g.name for g in account.groups]
+
+    :param client: The :class:`stormpath.client.Client` to replicate data
+        from.
+
+    :param path: Path of the SQLite database, in memory by default.
+
+    :param max_workers: Maximum number of pages fetched in parallel.
+
+    :param page_size: Number of resources fetched per page.
+    """
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_PAGE_SIZE = 100
+
+    ACCOUNT = 'account'
+    GROUP = 'group'
+
+    # Attributes resources can be searched by.
+    SEARCHABLE_ATTRS = ('email', 'username', 'name')
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS resources (
+            href TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            modified_at TEXT,
+            email TEXT,
+            username TEXT,
+            name TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS resources_email ON resources (type, email);
+        CREATE INDEX IF NOT EXISTS resources_username ON resources (type, username);
+        CREATE INDEX IF NOT EXISTS resources_name ON resources (type, name);
+
+        CREATE TABLE IF NOT EXISTS memberships (
+            href TEXT PRIMARY KEY,
+            account TEXT NOT NULL,
+            grp TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS memberships_account ON memberships (account);
+        CREATE INDEX IF NOT EXISTS memberships_group ON memberships (grp);
+
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    '''
+
+    def __init__(self, client, path=':memory:', max_workers=DEFAULT_MAX_WORKERS,
+            page_size=DEFAULT_PAGE_SIZE):
+        self.client = client
+        self.max_workers = max_workers
+        self.page_size = page_size
+
+        self.BASE_URL = client.BASE_URL
+        self.data_store = ReplicaDataStore(self)
+
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+
+    def _get_state(self, key):
+        row = self.db.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, value))
+
+    @property
+    def accounts(self):
+        """All replicated accounts."""
+        return AccountList(self, href=self._get_state('accounts'))
+
+    @property
+    def groups(self):
+        """All replicated groups."""
+        return GroupList(self, href=self._get_state('groups'))
+
+    def get_account(self, href):
+        return Account(self, href=href)
+
+    def get_group(self, href):
+        return Group(self, href=href)
+
+    def _get_page(self, href, params, offset):
+        params = dict(params or {}, offset=offset, limit=self.page_size)
+        return self.client.data_store.executor.get(href, params=params)
+
+    def _fetch(self, pool, hrefs, params=None):
+        """Fetch all items of the collections `hrefs`.
+
+        :returns: A list of the items of each collection.
+        """
+        def get_first_page(href):
+            return self._get_page(href, params, 0)
+
+        def get_page(args):
+            return self._get_page(args[0], params, args[1])
+
+        first_pages = pool.map(get_first_page, hrefs)
+
+        # Once we know the collection sizes, all other pages can be fetched
+        # at once.
+        rest = []
+        for href, page in zip(hrefs, first_pages):
+            step = page.get('limit') or self.page_size
+            rest.extend((href, offset) for offset in range(len(page['items']), page['size'], step))
+
+        items = dict((href, list(page['items'])) for href, page in zip(hrefs, first_pages))
+        for (href, _), page in zip(rest, pool.map(get_page, rest)):
+            items[href].extend(page['items'])
+
+        return [items[href] for href in hrefs]
+
+    def sync(self, full=False):
+        """Bring the replica up to date.
+
+        :param full: If True, everything is fetched again (and resources that
+            were deleted are removed), instead of only the resources modified
+            since the last sync. The first sync is always a full one.
+        :returns: The number of accounts, groups and memberships fetched.
+        :rtype: dict
+        """
+        tenant = self.client.tenant
+        hrefs = [tenant.accounts.href, tenant.groups.href]
+
+        with self.lock:
+            since = None if full else self._get_state('modified_at')
+
+        params = None
+        if since:
+            params = {'modifiedAt': '[%s,]' % since}
+
+        pool = ThreadPool(self.max_workers)
+        try:
+            accounts, groups = self._fetch(pool, hrefs, params)
+            memberships = self._fetch(pool, [g['accountMemberships']['href'] for g in groups])
+
+            # A full sync gets all memberships through the groups already.
+            account_memberships = []
+            if since is not None:
+                account_memberships = self._fetch(pool,
+                    [a['groupMemberships']['href'] for a in accounts])
+        finally:
+            pool.close()
+            pool.join()
+
+        with self.lock:
+            with self.db:
+                if since is None:
+                    self.db.execute('DELETE FROM resources')
+                    self.db.execute('DELETE FROM memberships')
+
+                for type, items in ((self.ACCOUNT, accounts), (self.GROUP, groups)):
+                    self.db.executemany(
+                        'INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        [(i['href'], type, i.get('modifiedAt'), i.get('email'),
+                            i.get('username'), i.get('name'), dumps(i)) for i in items])
+
+                for group, items in zip(groups, memberships):
+                    self.db.execute('DELETE FROM memberships WHERE grp = ?', (group['href'],))
+                    self.db.executemany('INSERT OR REPLACE INTO memberships VALUES (?, ?, ?, ?)',
+                        [(i['href'], i['account']['href'], group['href'], dumps(i)) for i in items])
+
+                for account, items in zip(accounts, account_memberships):
+                    self.db.execute('DELETE FROM memberships WHERE account = ?', (account['href'],))
+                    self.db.executemany('INSERT OR REPLACE INTO memberships VALUES (?, ?, ?, ?)',
+                        [(i['href'], account['href'], i['group']['href'], dumps(i)) for i in items])
+
+                modified_at = [i['modifiedAt'] for i in accounts + groups if i.get('modifiedAt')]
+                if modified_at:
+                    self._set_state('modified_at', max(modified_at + [since or '']))
+
+                self._set_state('accounts', hrefs[0])
+                self._set_state('groups', hrefs[1])
+
+        return {
+            'accounts': len(accounts),
+            'groups': len(groups),
+            'memberships': sum(len(m) for m in memberships + account_memberships),
+        }
+
+    def _query(self, href, params):
+        """Return the SQL query listing the items of the collection `href`,
+        or None if it's not replicated."""
+        parent, _, name = href.rpartition('/')
+
+        if href == self._get_state('accounts'):
+            return "SELECT data FROM resources r WHERE type = 'account'", []
+        elif href == self._get_state('groups'):
+            return "SELECT data FROM resources r WHERE type = 'group'", []
+        elif name == 'groups':
+            return 'SELECT r.data FROM memberships m JOIN resources r ON r.href = m.grp ' \
+                'WHERE m.account = ?', [parent]
+        elif name == 'accounts':
+            return 'SELECT r.data FROM memberships m JOIN resources r ON r.href = m.account ' \
+                'WHERE m.grp = ?', [parent]
+        elif name == 'groupMemberships':
+            return 'SELECT data FROM memberships r WHERE account = ?', [parent]
+        elif name == 'accountMemberships':
+            return 'SELECT data FROM memberships r WHERE grp = ?', [parent]
+
+    def get(self, href, params=None):
+        """Return the data of the resource or collection `href`, or None if
+        it's not replicated."""
+        params = dict(params or {})
+        offset = int(params.pop('offset', 0))
+        limit = int(params.pop('limit', 25))
+        params.pop('expand', None)
+
+        with self.lock:
+            if not params:
+                for table in ('resources', 'memberships'):
+                    row = self.db.execute('SELECT data FROM %s WHERE href = ?' % table, (href,)).fetchone()
+                    if row:
+                        return loads(row[0])
+
+            query = self._query(href, params)
+            if query is None:
+                return None
+
+            sql, args = query
+            for attr, value in sorted(params.items()):
+                if attr not in self.SEARCHABLE_ATTRS:
+                    raise ValueError('Replicated resources can only be searched by %s.' %
+                        ', '.join(self.SEARCHABLE_ATTRS))
+
+                # Only * is a wildcard in Stormpath searches.
+                sql += " AND r.%s LIKE ? ESCAPE '\\'" % attr
+                args.append(re.sub(r'([%_\\])', r'\\\1', value).replace('*', '%'))
+
+            items = [loads(row[0]) for row in self.db.execute(sql + ' ORDER BY r.href', args)]
+
+        return {
+            'href': href,
+            'offset': offset,
+            'limit': limit,
+            'size': len(items),
+            'items': items[offset:offset + limit],
+        }
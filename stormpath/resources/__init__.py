@@ -30,3 +30,10 @@ from .organization import Organization, OrganizationList
 from .organization_account_store_mapping import (
     OrganizationAccountStoreMapping,
     OrganizationAccountStoreMappingList)
+from .agent import Agent, AgentList
+from .api_key import ApiKey, ApiKeyList
+from .application import Application, ApplicationList
+from .account_store_mapping import AccountStoreMapping, AccountStoreMappingList
+from .id_site import IDSite, IDSiteList
+from .oauth_policy import OauthPolicy
+from .password_policy import PasswordPolicy
@@ -23,6 +23,8 @@ class Account(Resource, AutoSaveMixin, DictMixin, DeleteMixin, StatusMixin):
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#accounts
     """
+    cache_region = 'accounts'
+    cache_options = {}
     autosaves = ('custom_data',)
     writable_attrs = (
         'custom_data',
@@ -124,6 +126,21 @@ class Account(Resource, AutoSaveMixin, DictMixin, DeleteMixin, StatusMixin):
             # Otherwise, we'll assume this is a Group name, and try to query
             # it.
             else:
+                # Groups we've already seen don't need a search, as long as
+                # they still match.
+                index = self._get_index()
+                href = None
+                if index is not None:
+                    href = index.get('groups', 'name', resolvable, directory=self.directory.href)
+
+                if href is not None:
+                    try:
+                        group = self.directory.groups.get(href)
+                        if group.name == resolvable:
+                            return group
+                    except StormpathError:
+                        pass
+
                 groups = self.directory.groups.query(name=resolvable)
 
                 for g in groups:
@@ -166,9 +183,14 @@ class Account(Resource, AutoSaveMixin, DictMixin, DeleteMixin, StatusMixin):
             Passing in a :class:`stormpath.resources.group.Group` object will
             always be the quickest way to add a Group, as it doesn't require
             any additional API calls.
+
+        :returns: The new
+            :class:`stormpath.resources.group_membership.GroupMembership`, or
+            None within a :class:`stormpath.unit_of_work.UnitOfWork`, where
+            it's only created when the unit of work is flushed.
         """
         group = self._resolve_group(resolvable)
-        return self._client.group_memberships.create({
+        return self._write(self._client.group_memberships.create, {
             'account': self,
             'group': group,
         })
@@ -199,7 +221,7 @@ class Account(Resource, AutoSaveMixin, DictMixin, DeleteMixin, StatusMixin):
             any additional API calls.
         """
         for g in [self._resolve_group(group) for group in resolvables]:
-            self._client.group_memberships.create({
+            self._write(self._client.group_memberships.create, {
                 'account': self,
                 'group': g,
             })
@@ -14,6 +14,7 @@ class AccountCreationPolicy(Resource, DictMixin, SaveMixin):
     More info in documentation:
     http://docs.stormpath.com/rest/product-guide/#directory-account-creation-policy
     """
+    cache_region = 'accountCreationPolicies'
 
     EMAIL_STATUS_ENABLED = 'ENABLED'
     EMAIL_STATUS_DISABLED = 'DISABLED'
@@ -19,6 +19,8 @@ class AccountStoreMapping(Resource, DeleteMixin, DictMixin, SaveMixin):
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#account-store-mappings
     """
+    cache_region = 'accountStoreMappings'
+    cache_options = {}
     writable_attrs = (
         'account_store',
         'application',
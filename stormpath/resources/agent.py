@@ -52,6 +52,7 @@ class AgentDownload(Resource):
 class Agent(Resource, DeleteMixin, DictMixin, SaveMixin):
     """Stormpath Agent resource.
     """
+    cache_region = 'agents'
     writable_attrs = ('config', )
 
     @staticmethod
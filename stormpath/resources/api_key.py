@@ -12,6 +12,8 @@ from stormpath.error import Error
 
 
 class ApiKey(Resource, DictMixin, DeleteMixin, SaveMixin, StatusMixin):
+    cache_region = 'apiKeys'
+    cache_options = {}
     writable_attrs = (
         'status',
     )
@@ -44,13 +46,26 @@ class ApiKeyList(CollectionResource):
         try:
             key = None
 
-            # First, try to get the key from the cache using its ID.
+            # First, try to get the key from the cache using its ID. Keys of
+            # an application can be fetched directly, keys of an account are
+            # looked up in the index, which has the keys of all accounts.
+            href = None
+            owner = None
             if '/applications' in self.href:
                 href = '%s/apiKeys/%s' % (
                     self.href.split('/applications')[0], client_id)
+            else:
+                index = self._get_index()
+                if index is not None:
+                    href = index.get('apiKeys', 'id', client_id)
+                    owner = self.href.rsplit('/apiKeys', 1)[0]
+
+            if href:
                 try:
                     key = self.resource_class(self._client, href)
                     key.secret
+                    if owner is not None and key.account.href != owner:
+                        key = None
                 except Error:
                     key = None
 
@@ -50,6 +50,8 @@ class Application(Resource, DeleteMixin, DictMixin, AutoSaveMixin, SaveMixin, St
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#applications
     """
+    cache_region = 'applications'
+    cache_options = {}
 
     SSO_ENDPOINT = "https://api.stormpath.com/sso"
     SSO_LOGOUT_ENDPOINT = SSO_ENDPOINT + "/logout"
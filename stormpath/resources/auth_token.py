@@ -11,6 +11,8 @@ from .base import (
 
 class AuthToken(Resource, DictMixin, DeleteMixin):
     """Authentication token resource."""
+    cache_region = 'authTokens'
+    cache_href_segments = ('accessTokens', 'refreshTokens')
 
     @staticmethod
     def get_resource_attributes():
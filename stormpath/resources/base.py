@@ -5,6 +5,8 @@ like list access, updates, saves, deletes, attribute fetching, iterations etc.
 
 import datetime
 from copy import deepcopy
+from threading import Lock
+from weakref import WeakValueDictionary
 from dateutil.parser import parse
 from isodate import duration_isoformat, parse_duration
 from json import JSONEncoder, dumps
@@ -16,6 +18,10 @@ except NameError:
 
 from pydispatch import dispatcher
 
+from ..cache.index import ResourceIndex
+from ..profiler import Profiler, track
+from ..unit_of_work import UnitOfWork
+
 
 SIGNAL_RESOURCE_CREATED = 'resource-created'
 SIGNAL_RESOURCE_UPDATED = 'resource-updated'
@@ -82,6 +88,128 @@ class Expansion(object):
         return ','.join(ret)
 
 
+class ExpansionPlanner(object):
+    """Learns which linked resources get lazily loaded and expands them.
+
+    Iterating over a collection and accessing a linked resource on every item
+    (e.g. ``account.directory.name``) results in one API call per item. The
+    planner records these lazy loads per resource class, and once an attribute
+    has been loaded ``threshold`` times, every subsequent page fetch of a
+    collection of that class automatically expands it.
+
+    The planner is opt-in, see the ``expansion_planner`` argument of
+    :class:`stormpath.client.Client`.
+
+    :param threshold: Number of lazy loads after which an attribute gets
+        expanded automatically.
+    """
+    DEFAULT_THRESHOLD = 2
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.loads = {}
+
+    def record(self, cls, attr):
+        """Record a lazy load of the linked attribute `attr` of `cls`."""
+        loads = self.loads.setdefault(cls, {})
+        loads[attr] = loads.get(attr, 0) + 1
+
+    def learned(self, cls):
+        """Return the names of the attributes learned for `cls`."""
+        return sorted(attr for attr, count in self.loads.get(cls, {}).items()
+            if count >= self.threshold)
+
+    def get_expansion(self, cls):
+        """Return an :class:`Expansion` for `cls`, or None if nothing was
+        learned yet."""
+        attrs = self.learned(cls)
+        if attrs:
+            return Expansion(*[Resource.to_camel_case(a) for a in attrs])
+
+    def report(self):
+        """Return the learned expansions, keyed by resource class name.
+
+        Example::
+
+            {'Account': ['customData', 'directory']}
+        """
+        ret = {}
+
+        for cls in self.loads:
+            attrs = self.learned(cls)
+            if attrs:
+                ret[cls.__name__] = [Resource.to_camel_case(a) for a in attrs]
+
+        return ret
+
+    def reset(self):
+        self.loads = {}
+
+
+class IdentityMap(object):
+    """Makes sure there's a single resource object per href.
+
+    Resources that are fetched through a collection, or linked from or
+    expanded on other resources, are usually instantiated anew every time,
+    and every instance loads its data on its own. With an identity map, all
+    references to a resource share one instance and its data for as long as
+    the instance is in use -- resources are only weakly referenced.
+
+    The identity map is opt-in, usually for a block of code with
+    :meth:`stormpath.client.Client.identity_scope`, or for the whole client
+    with its ``identity_map`` argument. Collections are never shared.
+    """
+
+    def __init__(self):
+        self.resources = WeakValueDictionary()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, client, cls, href=None, properties=None):
+        """Return the resource of class `cls` with the given href or
+        properties, creating it if it isn't in the map yet.
+
+        Properties of an existing resource are updated with `properties`.
+        """
+        if href is None:
+            href = (properties or {}).get('href')
+
+        if href is None:
+            return cls(client, properties=properties)
+
+        key = (cls, href)
+
+        with self.lock:
+            resource = self.resources.get(key)
+
+        if resource is None:
+            # Instantiated outside of the lock since that in turn gets the
+            # linked resources.
+            new = cls(client, properties=properties or {'href': href})
+
+            with self.lock:
+                resource = self.resources.setdefault(key, new)
+
+            if resource is new:
+                self.misses += 1
+                return resource
+
+        self.hits += 1
+
+        if properties and len(properties) > 1:
+            resource._set_properties(properties)
+
+        return resource
+
+    def __len__(self):
+        return len(self.resources)
+
+    def clear(self):
+        with self.lock:
+            self.resources.clear()
+
+
 class Resource(object):
     """Base class for all Stormpath resource objects.
 
@@ -96,6 +224,15 @@ class Resource(object):
     resolvable_attrs = ()
     timedelta_attrs = ()
 
+    # Cache region of this resource type. Instances are routed to the region
+    # by the href segment preceding their uid, which is the region name
+    # itself plus any extra `cache_href_segments`. `cache_options` are the
+    # region's default cache options -- if None, the region is only cached
+    # when it's configured in the client's cache options.
+    cache_region = None
+    cache_href_segments = ()
+    cache_options = None
+
     def __init__(self, client, href=None, properties=None, query=None, expand=None):
         self._client = client
         self._expand = expand
@@ -140,7 +277,9 @@ class Resource(object):
     def _wrap_resource_attr(self, cls, value):
         if isinstance(value, Resource):
             return value
-        elif isinstance(value, dict) or (isinstance(value, list) and cls == ListOnResource):
+        elif isinstance(value, dict):
+            return self._get_resource(cls, properties=value)
+        elif isinstance(value, list) and cls == ListOnResource:
             return cls(self._client, properties=value)
         elif value is None:
             return None
@@ -174,13 +313,18 @@ class Resource(object):
                     continue
 
             if name in resource_attrs:
+                is_link = isinstance(value, dict) and list(value.keys()) == ['href']
                 value = self._wrap_resource_attr(resource_attrs[name], value)
                 if hasattr(resource_attrs[name], '_set_parent_and_name'):
                     value._set_parent_and_name(self, name)
+                elif is_link:
+                    # Remember where this linked resource came from, so a lazy
+                    # load of it can be reported to the expansion planner.
+                    value._linked_from = (self.__class__, name)
             elif isinstance(value, dict) and 'href' in value:
                 # No idea what kind of resource it is, but let's load it
                 # it anyways.
-                value = Resource(self._client, href=value['href'])
+                value = self._get_resource(Resource, href=value['href'])
             elif name in ['created_at', 'modified_at']:
                 value = parse(value)
             elif name in self.timedelta_attrs:
@@ -251,16 +395,79 @@ class Resource(object):
     def is_new(self):
         return self.href is None
 
+    def _get_planner(self):
+        planner = getattr(self._client, 'expansion_planner', None)
+        if isinstance(planner, ExpansionPlanner):
+            return planner
+
+    def _get_profiler(self):
+        profiler = getattr(self._client, 'profiler', None)
+        if isinstance(profiler, Profiler):
+            return profiler
+
+    def _get_unit_of_work(self):
+        unit_of_work = getattr(self._store, 'unit_of_work', None)
+        if isinstance(unit_of_work, UnitOfWork):
+            return unit_of_work
+
+    def _write(self, write, *args, **kwargs):
+        """Call `write` with the given arguments now, or when the unit of work
+        in progress is flushed.
+
+        :returns: The result of `write`, or None if it was added to a unit of
+            work.
+        """
+        unit_of_work = self._get_unit_of_work()
+        if unit_of_work is not None:
+            unit_of_work.add(write, *args, **kwargs)
+        else:
+            return write(*args, **kwargs)
+
+    def _get_index(self):
+        index = getattr(self._store, 'index', None)
+        if isinstance(index, ResourceIndex):
+            return index
+
+    def _get_identity_map(self):
+        identity_map = getattr(self._client, 'identity_map', None)
+        if isinstance(identity_map, IdentityMap):
+            return identity_map
+
+    def _get_resource(self, cls, expand=None, **kwargs):
+        """Instantiate a resource of class `cls` with the given href or
+        properties, or return the existing one if the client has an identity
+        map."""
+        identity_map = self._get_identity_map()
+
+        if identity_map is None or expand is not None or not issubclass(cls, Resource) or \
+                issubclass(cls, CollectionResource):
+            if expand is not None:
+                kwargs['expand'] = expand
+
+            return cls(self._client, **kwargs)
+
+        return identity_map.get(self._client, cls, **kwargs)
+
+    def _get_expansion(self):
+        return self._expand
+
     def _ensure_data(self, overwrite=False):
         if self.is_new():
             return
 
+        linked_from = self.__dict__.pop('_linked_from', None)
+        if linked_from:
+            planner = self._get_planner()
+            if planner:
+                planner.record(*linked_from)
+
         params = {}
         if self._query:
             params.update(self._query)
 
-        if self._expand:
-            params.update({'expand': self._expand.get_params()})
+        expand = self._get_expansion()
+        if expand:
+            params.update({'expand': expand.get_params()})
 
         if 'limit' in self.__dict__ and 'offset' in self.__dict__:
             params['limit'] = self.__dict__['limit']
@@ -269,9 +476,23 @@ class Resource(object):
         if not params:
             params = None
 
-        data = self._store.get_resource(self.href, params=params)
+        with track(self._get_profiler(), 'ensure_data', self, linked_from):
+            data = self._store.get_resource(self.href, params=params)
+
+        if 'sp_stale' not in data:
+            self.__dict__.pop('sp_stale', None)
+
         self._set_properties(data, overwrite=overwrite)
 
+    def is_stale(self):
+        """Whether this resource was served from an expired cache entry
+        because the Stormpath API was unavailable.
+
+        See :class:`stormpath.data_store.DataStore` for more info on the
+        degraded read-only mode.
+        """
+        return self.__dict__.get('sp_stale', False)
+
     def refresh(self):
         """Refreshes the local copy of a Resource or Resource List from the API
 
@@ -297,6 +518,13 @@ class SaveMixin(object):
         if self.is_new():
             raise ValueError("Can't save new resources, use create instead")
 
+        unit_of_work = self._get_unit_of_work()
+        if unit_of_work is not None:
+            unit_of_work.save(self)
+        else:
+            self._save()
+
+    def _save(self):
         properties = self._get_properties()
         data = self._store.update_resource(self.href, properties)
 
@@ -321,6 +549,13 @@ class DeleteMixin(object):
         if self.is_new():
             return
 
+        unit_of_work = self._get_unit_of_work()
+        if unit_of_work is not None:
+            unit_of_work.delete(self)
+        else:
+            self._delete()
+
+    def _delete(self):
         self._store.delete_resource(self.href)
         dispatcher.send(signal=SIGNAL_RESOURCE_DELETED, sender=self, href=self.href)
 
@@ -398,6 +633,14 @@ class CollectionResource(Resource):
         if items is not None:
             self.__dict__['items'] = [self._wrap_resource_attr(self.resource_class, item) for item in items]
 
+    def _get_expansion(self):
+        if self._expand:
+            return self._expand
+
+        planner = self._get_planner()
+        if planner:
+            return planner.get_expansion(self.resource_class)
+
     def _get_next_page(self, offset, limit):
         params = deepcopy(self._query) or {}
 
@@ -414,7 +657,13 @@ class CollectionResource(Resource):
         params['offset'] = offset
         params['limit'] = limit
 
-        data = self._store.get_resource(self.href, params=params)
+        expand = self._get_expansion()
+        if expand:
+            params['expand'] = expand.get_params()
+
+        with track(self._get_profiler(), 'next_page', self):
+            data = self._store.get_resource(self.href, params=params)
+
         items = [self._wrap_resource_attr(self.resource_class, item) for item in data.get('items', [])]
         self.__dict__['items'].extend(items)
         self.__dict__['limit'] += len(items)
@@ -472,7 +721,7 @@ class CollectionResource(Resource):
         if '/' not in href:
             href = self._get_create_path() + '/' + href
 
-        return self.resource_class(self._client, href=href, expand=expand)
+        return self._get_resource(self.resource_class, href=href, expand=expand)
 
     def search(self, query):
         if isinstance(query, dict):
@@ -518,7 +767,7 @@ class CollectionResource(Resource):
     def create(self, properties, expand=None, **params):
         data, params = self._prepare_for_create(properties, expand, **params)
 
-        created = self.resource_class(self._client, properties=self._store.create_resource(self._get_create_path(), data, params=params))
+        created = self._get_resource(self.resource_class, properties=self._store.create_resource(self._get_create_path(), data, params=params))
         dispatcher.send(signal=SIGNAL_RESOURCE_CREATED, sender=self.resource_class, data=data, params=params)
 
         return created
@@ -19,6 +19,8 @@ class CustomData(Resource, DeleteMixin, SaveMixin):
     More info in documentation:
     http://docs.stormpath.com/rest/product-guide/#custom-data
     """
+    cache_region = 'customData'
+    cache_options = {}
     data_field = '_data'
     readonly_attrs = (
         'created_at',
@@ -30,6 +32,7 @@ class CustomData(Resource, DeleteMixin, SaveMixin):
         'spmeta',
         'sp_meta',
         'sp_http_status',
+        'sp_stale',
     )
 
     exposed_readonly_timestamp_attrs = (
@@ -165,7 +168,7 @@ class CustomData(Resource, DeleteMixin, SaveMixin):
         if data:
             self.__dict__[self.data_field] = data
 
-    def save(self):
+    def _save(self):
         for href in self._deletes:
             self._store.delete_resource(href)
 
@@ -173,7 +176,7 @@ class CustomData(Resource, DeleteMixin, SaveMixin):
 
         if self.data_field in self.__dict__ and \
                 len(self._get_properties()):
-            super(CustomData, self).save()
+            super(CustomData, self)._save()
 
     def delete(self):
         super(CustomData, self).delete()
@@ -18,6 +18,8 @@ class Directory(Resource, DeleteMixin, DictMixin, AutoSaveMixin, SaveMixin, Stat
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#directories
     """
+    cache_region = 'directories'
+    cache_options = {}
     autosaves = ('provider', 'custom_data',)
     writable_attrs = (
         'custom_data',
@@ -21,6 +21,8 @@ class Group(Resource, AutoSaveMixin, DeleteMixin, DictMixin, StatusMixin):
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#groups
     """
+    cache_region = 'groups'
+    cache_options = {}
     autosaves = ('custom_data',)
     writable_attrs = (
         'custom_data',
@@ -100,7 +102,25 @@ class Group(Resource, AutoSaveMixin, DeleteMixin, DictMixin, StatusMixin):
             # Otherwise, we'll assume this is an Account username or email, and
             # try to query it.
             else:
-                for attr in ['username', 'email']:
+                attrs = ['username', 'email']
+
+                # Accounts we've already seen don't need a search, as long
+                # as they still match.
+                index = self._get_index()
+                if index is not None:
+                    for attr in attrs:
+                        href = index.get('accounts', attr, resolvable, directory=self.directory.href)
+                        if href is None:
+                            continue
+
+                        try:
+                            a = self.directory.accounts.get(href)
+                            if getattr(a, attr) == resolvable:
+                                return a
+                        except StormpathError:
+                            pass
+
+                for attr in attrs:
                     for a in self.directory.accounts.search({
                         attr: resolvable,
                     }):
@@ -144,9 +164,14 @@ class Group(Resource, AutoSaveMixin, DeleteMixin, DictMixin, StatusMixin):
             Passing in a :class:`stormpath.resources.account.Account` object
             will always be the quickest way to add an Account, as it doesn't
             require any additional API calls.
+
+        :returns: The new
+            :class:`stormpath.resources.group_membership.GroupMembership`, or
+            None within a :class:`stormpath.unit_of_work.UnitOfWork`, where
+            it's only created when the unit of work is flushed.
         """
         account = self._resolve_account(resolvable)
-        return self._client.group_memberships.create({
+        return self._write(self._client.group_memberships.create, {
             'account': account,
             'group': self,
         })
@@ -173,7 +198,7 @@ class Group(Resource, AutoSaveMixin, DeleteMixin, DictMixin, StatusMixin):
             require any additional API calls.
         """
         for a in [self._resolve_account(account) for account in resolvables]:
-            self._client.group_memberships.create({
+            self._write(self._client.group_memberships.create, {
                 'account': a,
                 'group': self,
             })
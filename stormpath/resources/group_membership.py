@@ -14,6 +14,8 @@ class GroupMembership(Resource, DeleteMixin):
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#create-a-group-membership
     """
+    cache_region = 'groupMemberships'
+    cache_options = {}
     writable_attrs = (
         'account',
         'group',
@@ -15,6 +15,7 @@ class IDSite(Resource, DictMixin, SaveMixin):
     More info in documentation:
     https://docs.stormpath.com/rest/product-guide/latest/reference.html#ref-id-site
     """
+    cache_region = 'idSites'
     writable_attrs = (
         'domain_name',
         'tls_public_cert',
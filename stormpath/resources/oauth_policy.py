@@ -14,6 +14,7 @@ class OauthPolicy(Resource, DictMixin, SaveMixin):
     More info in documentation:
     http://docs.stormpath.com/guides/token-management/
     """
+    cache_region = 'oAuthPolicies'
     writable_attrs = (
         'access_token_ttl',
         'refresh_token_ttl',
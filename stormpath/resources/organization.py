@@ -16,6 +16,8 @@ class Organization(Resource, AutoSaveMixin, DeleteMixin, DictMixin, StatusMixin)
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#organizations
     """
+    cache_region = 'organizations'
+    cache_options = {}
     autosaves = ('custom_data',)
     writable_attrs = (
         'custom_data',
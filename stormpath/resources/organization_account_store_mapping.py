@@ -20,6 +20,7 @@ class OrganizationAccountStoreMapping(Resource, DeleteMixin, DictMixin,
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#adding-an-account-store-to-an-organization
     """
+    cache_region = 'organizationAccountStoreMappings'
     writable_attrs = (
         'account_store',
         'organization',
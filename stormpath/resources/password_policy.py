@@ -14,6 +14,7 @@ class PasswordPolicy(Resource, DictMixin, SaveMixin):
     More info in documentation:
     http://docs.stormpath.com/rest/product-guide/#directory-password-policy
     """
+    cache_region = 'passwordPolicies'
 
     RESET_EMAIL_STATUS_ENABLED = 'ENABLED'
     RESET_EMAIL_STATUS_DISABLED = 'DISABLED'
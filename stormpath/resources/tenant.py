@@ -16,6 +16,8 @@ class Tenant(Resource, DeleteMixin, DictMixin, AutoSaveMixin, SaveMixin):
     More info in documentation:
     http://docs.stormpath.com/python/product-guide/#tenants
     """
+    cache_region = 'tenants'
+    cache_options = {}
     autosaves = ('custom_data',)
     writable_attrs = (
         'custom_data',
@@ -0,0 +1,145 @@
+"""Write batching utilities."""
+
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from .error import UnitOfWorkError
+
+
+class UnitOfWork(object):
+    """Collects writes and flushes them together.
+
+    While a unit of work is in progress in the current thread, resource
+    saves, deletes and group membership changes aren't sent to the Stormpath
+    API right away. They're collected, and sent when leaving the unit of
+    work instead:
+
+    - repeated saves of a resource are coalesced into a single update. If
+      several objects with the same href are saved (e.g. without an identity
+      map), only the last one saved is,
+    - a resource that's deleted (or whose parent is) isn't saved,
+    - the writes are independent of each other, so they're sent in parallel.
+      Deletes are sent after everything else, and only if all other writes
+      succeeded.
+
+    If the block raises an exception, the collected writes are discarded.
+
+    The unit of work is usually used as a context manager through
+    :meth:`stormpath.client.Client.unit_of_work`::
+
+        with client.unit_of_work():
+            account.given_name = 'Randall'
+            account.save()
+            account.custom_data['favorite_color'] = 'blue'
+            account.custom_data.save()
+            account.add_group(group)
+
+    .. note::
+        Within a unit of work, methods that create resources on behalf of
+        writes (like :meth:`stormpath.resources.account.Account.add_group`)
+        return None, since the resources don't exist yet.
+
+    :param data_store: The :class:`stormpath.data_store.DataStore` whose
+        writes are collected.
+
+    :param max_workers: Maximum number of writes sent in parallel.
+    """
+    DEFAULT_MAX_WORKERS = 4
+
+    def __init__(self, data_store, max_workers=DEFAULT_MAX_WORKERS):
+        self.data_store = data_store
+        self.max_workers = max_workers
+        self.saves = OrderedDict()
+        self.deletes = OrderedDict()
+        self.writes = []
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = self.data_store.unit_of_work
+        self.data_store.unit_of_work = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.data_store.unit_of_work = self._previous
+
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+    def save(self, resource):
+        """Save `resource` when flushing."""
+        if resource.href not in self.deletes:
+            self.saves[resource.href] = resource
+
+    def delete(self, resource):
+        """Delete `resource` when flushing."""
+        # Nested resources, like custom data, are deleted along with it.
+        for href in list(self.saves):
+            if href == resource.href or href.startswith(resource.href + '/'):
+                del self.saves[href]
+
+        self.deletes[resource.href] = resource
+
+    def add(self, write, *args, **kwargs):
+        """Call `write` with the given arguments when flushing."""
+        self.writes.append((write, args, kwargs))
+
+    def discard(self):
+        self.saves = OrderedDict()
+        self.deletes = OrderedDict()
+        self.writes = []
+
+    def __len__(self):
+        return len(self.saves) + len(self.deletes) + len(self.writes)
+
+    def flush(self):
+        """Send the collected writes.
+
+        All writes are attempted, then deletes unless a write failed. If a
+        single write fails, its error is raised once they're done; if several
+        do, a :class:`stormpath.error.UnitOfWorkError` with all their errors
+        is.
+        """
+        writes = [(r._save, (), {}) for r in self.saves.values()] + self.writes
+        deletes = [(r._delete, (), {}) for r in self.deletes.values()]
+        self.discard()
+
+        errors = self._run(writes)
+        if not errors:
+            errors = self._run(deletes)
+
+        if len(errors) == 1:
+            raise errors[0]
+        elif errors:
+            raise UnitOfWorkError(errors)
+
+    def _run(self, writes):
+        if len(writes) < 2 or self.max_workers < 2:
+            errors = []
+
+            for write, args, kwargs in writes:
+                try:
+                    write(*args, **kwargs)
+                except Exception as e:
+                    errors.append(e)
+
+            return errors
+
+        pool = ThreadPool(min(self.max_workers, len(writes)))
+
+        try:
+            results = [pool.apply_async(write, args, kwargs) for write, args, kwargs in writes]
+            errors = []
+
+            for result in results:
+                try:
+                    result.get()
+                except Exception as e:
+                    errors.append(e)
+
+            return errors
+        finally:
+            pool.close()
+            pool.join()
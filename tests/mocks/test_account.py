@@ -1,4 +1,5 @@
 from unittest import TestCase, main
+from stormpath.cache.index import ResourceIndex
 from stormpath.error import Error as StormpathError
 from stormpath.resources import GroupMembershipList, GroupMembership
 from stormpath.resources.account_store import AccountStore
@@ -121,6 +122,25 @@ class TestAccount(TestCase):
         self.assertEqual(args[0]['account'].href, self.account.href)
         self.assertEqual(args[0]['group'].href, self.g.href)
 
+    def test_add_account_to_group_by_indexed_email(self):
+        href = 'http://example.com/accounts/ACCOUNT'
+        ds = MagicMock()
+        self.acs = AccountList(MagicMock(data_store=ds), href='test/accounts')
+        self.d._set_properties({'accounts': self.acs})
+        ds.get_resource.return_value = {'href': href, 'email': 'indexed@example.com'}
+
+        self.client.data_store.index = ResourceIndex()
+        self.client.data_store.index.add(href, {
+            'email': 'indexed@example.com', 'directory': {'href': self.d.href}})
+
+        self.g._set_properties({'directory': self.d})
+        self.g.add_account('indexed@example.com')
+        args, _ = self.account._client.group_memberships.create.call_args
+        self.assertEqual(args[0]['account'].href, href)
+
+        # The account was looked up by href, without a search.
+        ds.get_resource.assert_called_once_with(href, params=None)
+
     def test_add_account_to_group_by_search_dict(self):
         ds = MagicMock()
         self.acs = AccountList(MagicMock(data_store=ds), href='test/accounts')
@@ -329,6 +349,29 @@ class TestAccountApiKey(TestAccount):
             client_id=self.id, client_secret='WRONG-SECRET')
         self.assertFalse(ak)
 
+    def test_get_indexed_api_key_of_account(self):
+        own = 'http://example.com/apiKeys/OWN'
+        other = 'http://example.com/apiKeys/OTHER'
+        resources = {
+            own: {'href': own, 'id': 'OWN', 'secret': self.secret,
+                'account': {'href': 'http://example.com/accounts/A'}},
+            other: {'href': other, 'id': 'OTHER', 'secret': self.secret,
+                'account': {'href': 'http://example.com/accounts/B'}},
+        }
+        self.ak_ds.index = ResourceIndex()
+        for href, data in resources.items():
+            self.ak_ds.index.add(href, data)
+        self.ak_ds.get_resource.side_effect = \
+            lambda href, params=None: resources.get(href, {'items': []})
+
+        aks = ApiKeyList(MagicMock(BASE_URL='http://example.com', data_store=self.ak_ds),
+            href='http://example.com/accounts/A/apiKeys')
+
+        self.assertEqual(aks.get_key('OWN').href, own)
+        self.assertFalse(aks.get_key('OTHER'))
+        self.ak_ds.get_resource.assert_called_with(
+            'http://example.com/accounts/A/apiKeys', params={'id': 'OTHER'})
+
 
 if __name__ == '__main__':
     main()
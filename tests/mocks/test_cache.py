@@ -1,3 +1,9 @@
+import zlib
+from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+from json import dumps as json_dumps, loads as json_loads
+from threading import Thread
+from time import time
 from unittest import TestCase, main
 try:
     from mock import patch, MagicMock
@@ -6,39 +12,54 @@ except ImportError:
 
 from stormpath.cache.entry import CacheEntry
 from stormpath.cache.stats import CacheStats
-from stormpath.cache.cache import Cache
+from stormpath.cache.cache import Cache, TieredCache
 from stormpath.cache.manager import CacheManager
-from stormpath.cache.memory_store import MemoryStore
+from stormpath.cache.memory_store import MemoryBudget, MemoryStore, \
+    ShardedMemoryStore
+from stormpath.cache.null_cache_store import NullCacheStore
 from stormpath.cache.redis_store import RedisStore
+from stormpath.cache.serializers import Serializer, hash_key
 from stormpath.cache.memcached_store import MemcachedStore, \
-    json_deserializer, json_serializer
+    BINARY_VALUE, JSON_VALUE, STR_VALUE, binary_deserializer, binary_serializer, \
+    json_serializer
+from stormpath.cache.index import ResourceIndex
+from stormpath.cache.sweeper import ExpirySweeper
+from stormpath.cache.invalidation import LocalInvalidationBus, \
+    RedisInvalidationBus
 
 
 class TestCacheEntry(TestCase):
 
     def setUp(self):
-        from datetime import datetime as real_datetime
-        self.hour_before = real_datetime(2013, 1, 1, 9, 30, 0, 0)
-        self.minute_before = real_datetime(2013, 1, 1, 10, 29, 0, 0)
-        self.now = real_datetime(2013, 1, 1, 10, 30, 0, 0)
+        self.hour_before = 1357032600.0  # 2013-01-01 09:30:00
+        self.minute_before = 1357036140.0  # 2013-01-01 10:29:00
+        self.now = 1357036200.0  # 2013-01-01 10:30:00
 
-    @patch('stormpath.cache.entry.datetime')
-    def test_entry_init_with_default_values(self, datetime):
+    @patch('stormpath.cache.entry.time')
+    def test_entry_init_with_default_values(self, time):
         e = CacheEntry('foo')
 
-        self.assertEqual(e.created_at, datetime.utcnow.return_value)
-        self.assertEqual(e.last_accessed_at, datetime.utcnow.return_value)
+        self.assertEqual(e.created_at, time.return_value)
+        self.assertEqual(e.last_accessed_at, time.return_value)
 
-    @patch('stormpath.cache.entry.datetime')
-    def test_entry_init_with_custom_values(self, datetime):
+    def test_entry_init_with_custom_values(self):
         e = CacheEntry('foo', created_at=self.hour_before,
             last_accessed_at=self.minute_before)
         self.assertEqual(e.created_at, self.hour_before)
         self.assertEqual(e.last_accessed_at, self.minute_before)
 
-    @patch('stormpath.cache.entry.datetime')
-    def test_touch_updates_last_accessed(self, datetime):
-        datetime.utcnow.return_value = self.now
+    def test_entry_init_with_datetimes(self):
+        e = CacheEntry('foo', created_at=datetime(2013, 1, 1, 9, 30),
+            last_accessed_at=datetime(2013, 1, 1, 10, 29))
+        self.assertEqual(e.created_at, self.hour_before)
+        self.assertEqual(e.last_accessed_at, self.minute_before)
+
+    def test_entry_has_no_dict(self):
+        self.assertRaises(AttributeError, setattr, CacheEntry('foo'), 'foo', 1)
+
+    @patch('stormpath.cache.entry.time')
+    def test_touch_updates_last_accessed(self, time):
+        time.return_value = self.now
 
         e = CacheEntry('foo', created_at=self.minute_before,
             last_accessed_at=self.minute_before)
@@ -46,9 +67,9 @@ class TestCacheEntry(TestCase):
         e.touch()
         self.assertEqual(e.last_accessed_at, self.now)
 
-    @patch('stormpath.cache.entry.datetime')
-    def test_is_expired_checks_ttl_tti(self, datetime):
-        datetime.utcnow.return_value = self.now
+    @patch('stormpath.cache.entry.time')
+    def test_is_expired_checks_ttl_tti(self, time):
+        time.return_value = self.now
 
         e = CacheEntry('foo', created_at=self.hour_before,
             last_accessed_at=self.minute_before)
@@ -60,26 +81,66 @@ class TestCacheEntry(TestCase):
         self.assertTrue(e.is_expired(24 * 3600, 60))
         self.assertFalse(e.is_expired(24 * 3600, 61))
 
+        self.assertEqual(e.stale_for(3590, 24 * 3600), 10)
+
+    @patch('stormpath.cache.entry.time')
+    def test_is_expired_uses_entry_ttl(self, time):
+        time.return_value = self.now
+
+        e = CacheEntry('foo', created_at=self.hour_before,
+            last_accessed_at=self.minute_before, ttl=3000)
+
+        self.assertTrue(e.is_expired(3601, 24 * 3600))
+
+    @patch('stormpath.cache.entry.random')
+    @patch('stormpath.cache.entry.time')
+    def test_is_expired_early(self, time, random):
+        time.return_value = self.now
+
+        e = CacheEntry('foo', created_at=self.hour_before,
+            last_accessed_at=self.minute_before, cost=10)
+
+        # Without early expiration, this entry has 60 seconds left.
+        self.assertFalse(e.is_expired(3660, 24 * 3600))
+
+        # The earlier the random draw, the earlier it expires.
+        random.return_value = 0.5
+        self.assertFalse(e.is_expired(3660, 24 * 3600, early_expiration=1))
+        random.return_value = 0.99999
+        self.assertTrue(e.is_expired(3660, 24 * 3600, early_expiration=1))
+
+        # Entries without a known cost never expire early.
+        e.cost = None
+        self.assertFalse(e.is_expired(3660, 24 * 3600, early_expiration=1))
+
     def test_parse(self):
         e = CacheEntry.parse({
             'value': 'foo',
-            'created_at': '2013-01-01 09:30:00.0',
-            'last_accessed_at': '2013-01-01 10:29:00.0'
+            'created_at': self.hour_before,
+            'last_accessed_at': self.minute_before,
         })
 
         self.assertEqual(e.value, 'foo')
         self.assertEqual(e.created_at, self.hour_before)
         self.assertEqual(e.last_accessed_at, self.minute_before)
 
-    @patch('stormpath.cache.entry.datetime')
-    def test_parse_invalid_dates(self, datetime):
-        datetime.strptime.side_effect = ValueError
+    def test_parse_formatted_dates(self):
+        e = CacheEntry.parse({
+            'value': 'foo',
+            'created_at': '2013-01-01 09:30:00.0',
+            'last_accessed_at': '2013-01-01 10:29:00.0'
+        })
 
-        e = CacheEntry.parse({'value': 'foo'})
+        self.assertEqual(e.created_at, self.hour_before)
+        self.assertEqual(e.last_accessed_at, self.minute_before)
+
+    @patch('stormpath.cache.entry.time')
+    def test_parse_invalid_dates(self, time):
+        e = CacheEntry.parse({'value': 'foo', 'created_at': 'yesterday'})
 
         self.assertEqual(e.value, 'foo')
-        self.assertEqual(e.created_at, datetime.utcnow.return_value)
-        self.assertEqual(e.last_accessed_at, datetime.utcnow.return_value)
+        self.assertEqual(e.created_at, time.return_value)
+        self.assertEqual(e.last_accessed_at, time.return_value)
 
     def test_to_dict(self):
         e = CacheEntry('foo', created_at=self.hour_before,
@@ -88,10 +149,19 @@ class TestCacheEntry(TestCase):
         data = e.to_dict()
 
         self.assertEqual(data['value'], 'foo')
-        self.assertEqual(data['created_at'],
-            '2013-01-01 09:30:00.000000')
-        self.assertEqual(data['last_accessed_at'],
-            '2013-01-01 10:29:00.000000')
+        self.assertEqual(data['created_at'], self.hour_before)
+        self.assertEqual(data['last_accessed_at'], self.minute_before)
+
+    def test_encode_decode(self):
+        for ttl, cost in ((None, None), (100, 0.5)):
+            e = CacheEntry({'foo': ['bar', 1]}, created_at=self.hour_before,
+                last_accessed_at=self.minute_before, ttl=ttl, cost=cost)
+
+            e2 = CacheEntry.decode(e.encode())
+            self.assertEqual(e2.to_dict(), e.to_dict())
+
+        self.assertRaises(ValueError, CacheEntry.decode, b'{"value": 1}')
+        self.assertRaises(ValueError, CacheEntry.decode, b'')
 
 
 class CacheStatsTest(TestCase):
@@ -220,6 +290,17 @@ class TestCache(TestCase):
         self.assertEqual(2, len(cache.store))
         self.assertEqual(list(cache.store.store.keys()), [8,9])
 
+    def test_cache_put_with_ttl_jitter(self, CacheStats):
+        cache = Cache(ttl=100, ttl_jitter=0.2)
+
+        for i in range(50):
+            cache.put(i, i, cost=0.5)
+
+        ttls = [cache.store[i].ttl for i in range(50)]
+        self.assertTrue(all(80 <= ttl <= 100 for ttl in ttls))
+        self.assertTrue(len(set(ttls)) > 1)
+        self.assertEqual(cache.store[0].cost, 0.5)
+
     def test_cache_does_not_allow_max_entries_to_fall_bellow_one(self, CacheStats):
         self.assertRaises(
                 ValueError,
@@ -228,6 +309,61 @@ class TestCache(TestCase):
                 store_opts={'max_entries': 0})
 
 
+class TestStaleWhileRevalidate(TestCase):
+
+    def setUp(self):
+        self.cache = Cache(ttl=10, tti=10, stale_while_revalidate=30)
+
+    def put(self, key, value, age):
+        created_at = datetime.utcnow() - timedelta(seconds=age)
+        self.cache.store[key] = CacheEntry(value, created_at=created_at)
+
+    def test_stale_entry_is_served_and_revalidated(self):
+        self.put('foo', 'Old Foo', age=20)
+        revalidate = MagicMock(side_effect=lambda: self.cache.put('foo', 'New Foo'))
+
+        self.assertEqual(self.cache.get('foo', revalidate=revalidate), 'Old Foo')
+        self.cache.revalidator.join()
+
+        revalidate.assert_called_once_with()
+        self.assertEqual(self.cache.get('foo', revalidate=revalidate), 'New Foo')
+        self.assertEqual(self.cache.stats.stale_hits, 1)
+        self.assertEqual(self.cache.stats.revalidations, 1)
+        self.assertEqual(self.cache.stats.hits, 1)
+
+    def test_revalidation_is_single_flight(self):
+        self.put('foo', 'Old Foo', age=20)
+        self.cache.revalidator.pending.add('foo')
+        revalidate = MagicMock()
+
+        self.assertEqual(self.cache.get('foo', revalidate=revalidate), 'Old Foo')
+        self.assertEqual(self.cache.get('foo', revalidate=revalidate), 'Old Foo')
+
+        self.assertFalse(revalidate.called)
+        self.assertEqual(self.cache.stats.stale_hits, 2)
+        self.assertEqual(self.cache.stats.revalidations, 0)
+
+    def test_entry_past_window_is_a_miss(self):
+        self.put('foo', 'Old Foo', age=50)
+
+        self.assertIsNone(self.cache.get('foo', revalidate=MagicMock()))
+        self.assertIsNone(self.cache.store['foo'])
+        self.assertEqual(self.cache.stats.expirations, 1)
+
+    def test_max_stale_limits_window(self):
+        self.cache = Cache(ttl=10, tti=10, stale_while_revalidate=30, max_stale=5)
+        self.put('foo', 'Old Foo', age=20)
+
+        self.assertIsNone(self.cache.get('foo', revalidate=MagicMock()))
+
+    def test_stale_entry_without_revalidate_is_a_miss(self):
+        self.put('foo', 'Old Foo', age=20)
+
+        self.assertIsNone(self.cache.get('foo'))
+        # Still within max stale, so it's kept around.
+        self.assertEqual(self.cache.store['foo'].value, 'Old Foo')
+
+
 @patch('stormpath.cache.manager.Cache')
 class TestCacheManager(TestCase):
 
@@ -240,6 +376,13 @@ class TestCacheManager(TestCase):
         c = m.get_cache('region')
         self.assertEqual(c, Cache.return_value)
 
+    def test_remote_stores_are_namespaced(self, Cache):
+        m = CacheManager()
+        m.create_cache('accounts', store=RedisStore, store_opts={'host': 'redis'})
+
+        Cache.assert_called_once_with(store=RedisStore,
+            store_opts={'host': 'redis', 'namespace': 'accounts'})
+
     def test_stats(self, Cache):
 
         m = CacheManager()
@@ -250,6 +393,152 @@ class TestCacheManager(TestCase):
             'bar': Cache.return_value.stats})
 
 
+class TestTieredCache(TestCase):
+
+    def setUp(self):
+        self.cache = TieredCache(l1={'ttl': 5})
+        self.l2 = self.cache.store
+
+    def test_l2_hits_are_promoted(self):
+        self.l2['foo'] = CacheEntry('Foo')
+
+        self.assertEqual(self.cache.get('foo'), 'Foo')
+        self.assertIsNotNone(self.cache.l1['foo'])
+
+        del self.l2['foo']
+        self.assertEqual(self.cache.get('foo'), 'Foo')
+        self.assertEqual((self.cache.stats.hits, self.cache.stats.l1_hits), (2, 1))
+
+    def test_writes_go_to_both_tiers(self):
+        self.cache.put('foo', 'Foo')
+        self.assertEqual(self.l2['foo'].value, 'Foo')
+        self.assertEqual(self.cache.l1['foo'][1], 'Foo')
+
+        self.cache.delete('foo')
+        self.assertIsNone(self.l2['foo'])
+        self.assertIsNone(self.cache.l1['foo'])
+        self.assertNotIn('foo', self.cache)
+
+        self.cache.put('foo', 'Foo')
+        self.cache.clear()
+        self.assertEqual((len(self.l2), len(self.cache.l1)), (0, 0))
+
+    @patch('stormpath.cache.cache.time')
+    def test_l1_ttl(self, time):
+        time.return_value = 1000
+        self.cache.put('foo', 'Foo')
+        self.l2['foo'] = CacheEntry('New Foo')
+
+        time.return_value = 1004
+        self.assertEqual(self.cache.get('foo'), 'Foo')
+
+        time.return_value = 1005
+        self.assertEqual(self.cache.get('foo'), 'New Foo')
+
+    def test_cache_manager(self):
+        m = CacheManager()
+        m.create_cache('foo', l1={'ttl': 1, 'store_opts': {'max_entries': 10}})
+        m.create_cache('bar')
+
+        self.assertIsInstance(m.get_cache('foo'), TieredCache)
+        self.assertEqual(m.get_cache('foo').l1.store.size_limit, 10)
+        self.assertNotIsInstance(m.get_cache('bar'), TieredCache)
+
+        m.get_cache('foo').put('foo', 'Foo')
+        m.get_cache('foo').get('foo')
+        self.assertEqual(m.stats['foo'].l1_hits, 1)
+
+
+class TestExpirySweeper(TestCase):
+
+    def test_due_keys(self):
+        s = ExpirySweeper()
+        s.schedule('foo', 100.5)
+        s.schedule('bar', 50)
+        s.schedule('baz', 101)
+        s.schedule('foo', 10)  # already scheduled
+
+        self.assertEqual(len(s), 3)
+        self.assertEqual(s.due(100, 10), ['bar'])
+        self.assertEqual(sorted(s.due(101, 1) + s.due(101, 1)), ['baz', 'foo'])
+        self.assertEqual(s.due(1000, 10), [])
+        self.assertEqual(len(s), 0)
+
+        s.schedule('foo', 10)
+        s.clear()
+        self.assertEqual((len(s), s.due(1000, 10)), (0, []))
+
+    def test_cache_reclaims_expired_entries(self):
+        cache = Cache(ttl=10, tti=10, stale_while_revalidate=5)
+        created_at = time() - 60
+
+        for i in range(15):
+            cache.store['old%d' % i] = CacheEntry(i, created_at=created_at)
+            cache._schedule('old%d' % i, cache.store.peek('old%d' % i))
+
+        # Scheduled early, but still fresh.
+        cache.store['live'] = CacheEntry('Live')
+        cache.sweeper.schedule('live', created_at)
+
+        # 'live' is due first, and is scheduled again.
+        cache.put('foo', 'Foo')
+        self.assertEqual(cache.stats.reclaimed, Cache.SWEEP_BATCH - 1)
+        self.assertEqual(cache.sweep(), 6)
+        self.assertEqual(cache.stats.reclaimed, 15)
+
+        self.assertEqual(sorted(key for key, _ in cache.items()), ['foo', 'live'])
+        self.assertEqual(len(cache.sweeper), 2)
+
+    def test_evicted_and_deleted_keys_are_unscheduled(self):
+        for store in (MemoryStore, ShardedMemoryStore):
+            cache = Cache(store=store, store_opts={'max_entries': 100})
+            for i in range(1000):
+                cache.put(i, i)
+
+            self.assertEqual(len(cache.sweeper), len(cache.store))
+
+            cache.delete(999)
+            self.assertEqual(len(cache.sweeper), len(cache.store))
+
+        # Entries that aren't stored at all aren't scheduled either.
+        cache = Cache(store_opts={'max_bytes': 100})
+        cache.put('foo', 'x' * 1000)
+        self.assertEqual(len(cache.sweeper), 0)
+
+    def test_peek_keeps_eviction_order(self):
+        for eviction in MemoryStore.EVICTION_POLICIES:
+            s = MemoryStore(max_entries=2, eviction=eviction)
+            s['foo'] = 'Foo'
+            s['bar'] = 'Bar'
+
+            self.assertEqual(s.peek('foo'), 'Foo')
+            self.assertIsNone(s.peek('baz'))
+
+        s = MemoryStore(max_entries=2)
+        s['foo'] = 'Foo'
+        s['bar'] = 'Bar'
+        s.peek('foo')
+        s['baz'] = 'Baz'
+        self.assertIsNone(s['foo'])
+
+    def test_contains_keeps_eviction_order(self):
+        cache = Cache(store_opts={'max_entries': 2, 'eviction': 'lru'})
+        cache.put('foo', 'Foo')
+        cache.put('bar', 'Bar')
+
+        self.assertIn('foo', cache)
+        self.assertNotIn('baz', cache)
+
+        cache.put('baz', 'Baz')
+        self.assertNotIn('foo', cache)
+        self.assertIn('bar', cache)
+
+    def test_sweeping_can_be_disabled(self):
+        self.assertIsNone(Cache(sweep=False).sweeper)
+        self.assertEqual(Cache(sweep=False).sweep(), 0)
+        self.assertIsNone(Cache(store=NullCacheStore).sweeper)
+
+
 class MemoryStoreTest(TestCase):
 
     def test_everything(self):
@@ -272,17 +561,254 @@ class MemoryStoreTest(TestCase):
         self.assertEqual(len(s), 0)
 
 
+class TestEvictionPolicies(TestCase):
+
+    def fill(self, eviction, hot, cold, max_entries=10, reads=3):
+        s = MemoryStore(max_entries=max_entries, eviction=eviction)
+
+        for key in hot:
+            s[key] = key
+        for _ in range(reads):
+            for key in hot:
+                s[key]
+        for key in cold:
+            s[key] = key
+
+        return s
+
+    def test_basics(self):
+        for eviction in MemoryStore.EVICTION_POLICIES:
+            s = MemoryStore(max_entries=2, eviction=eviction)
+
+            s['foo'] = 1
+            s['foo'] = 2
+            self.assertEqual(s['foo'], 2)
+            self.assertEqual(s.items(), [('foo', 2)])
+
+            del s['foo']
+            del s['foo']
+            self.assertIsNone(s['foo'])
+
+            for i in range(5):
+                s[i] = i
+            self.assertTrue(1 <= len(s) <= 2)
+
+            s.clear()
+            self.assertEqual(len(s), 0)
+
+            self.assertRaises(ValueError, MemoryStore, max_entries=0, eviction=eviction)
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, MemoryStore, eviction='random')
+
+    def test_lru(self):
+        s = MemoryStore(max_entries=2, eviction='lru')
+        s['a'] = 1
+        s['b'] = 2
+        s['a']
+        s['c'] = 3
+
+        self.assertEqual(sorted(s.store.keys()), ['a', 'c'])
+
+    def test_fifo(self):
+        s = MemoryStore(max_entries=2, eviction='fifo')
+        s['a'] = 1
+        s['b'] = 2
+        s['a']
+        s['c'] = 3
+
+        self.assertEqual(sorted(s.store.keys()), ['b', 'c'])
+
+    def test_lfu(self):
+        s = self.fill('lfu', hot=range(5), cold=range(100, 120))
+
+        self.assertEqual(sorted(k for k in s.store.keys() if k < 100), list(range(5)))
+        self.assertIn(119, s.store)
+
+    def test_tinylfu_resists_scans(self):
+        # Frequency estimates are approximate, so a few hot entries may still
+        # be evicted.
+        s = self.fill('tinylfu', hot=range(50), cold=range(1000, 2000), max_entries=100, reads=10)
+        self.assertGreaterEqual(len([k for k in s.store.keys() if k < 1000]), 45)
+
+        s = self.fill('lru', hot=range(50), cold=range(1000, 2000), max_entries=100, reads=10)
+        self.assertEqual([k for k in s.store.keys() if k < 1000], [])
+
+
+class TestMemoryStoreBytes(TestCase):
+
+    def entry(self, size):
+        return CacheEntry({'data': 'x' * size})
+
+    def test_bytes_are_accounted(self):
+        s = MemoryStore()
+        s['foo'] = self.entry(1000)
+        foo = s.bytes
+        self.assertTrue(1000 < foo < 2000)
+
+        s['bar'] = self.entry(1000)
+        self.assertEqual(s.bytes, 2 * foo)
+
+        s['bar'] = self.entry(3000)
+        self.assertTrue(s.bytes > foo + 3000)
+
+        del s['bar']
+        self.assertEqual(s.bytes, foo)
+
+        s.clear()
+        self.assertEqual(s.bytes, 0)
+
+    def test_count_evictions_are_accounted(self):
+        for eviction in MemoryStore.EVICTION_POLICIES:
+            s = MemoryStore(max_entries=2, eviction=eviction)
+            for i in range(5):
+                s[i] = self.entry(1000)
+
+            self.assertEqual(s.bytes, len(s) * s.sizes[next(iter(s.sizes))])
+            self.assertEqual(sorted(s.sizes), sorted(s.store.keys()))
+
+    def test_max_bytes(self):
+        s = MemoryStore(max_bytes=5000)
+        for i in range(10):
+            s[i] = self.entry(1000)
+
+        self.assertTrue(s.bytes <= 5000)
+        self.assertEqual(list(s.store.keys()), list(range(10 - len(s), 10)))
+
+        s['big'] = self.entry(10000)
+        self.assertIsNone(s['big'])
+
+    def test_budget(self):
+        budget = MemoryBudget(10000)
+        a = MemoryStore(budget=budget)
+        b = MemoryStore(budget=budget)
+
+        for i in range(6):
+            a[i] = self.entry(1000)
+        for i in range(6):
+            b[i] = self.entry(1000)
+
+        self.assertTrue(budget.bytes <= 10000)
+        self.assertTrue(abs(len(a) - len(b)) <= 1)
+
+    def test_cache_manager_reports_bytes(self):
+        manager = CacheManager()
+        manager.create_cache('accounts', store_opts={'max_bytes': 10000})
+        manager.create_cache('groups', store=NullCacheStore)
+        manager.get_cache('accounts').put('foo', {'data': 'x' * 1000})
+
+        usage = manager.memory_usage
+        self.assertEqual(list(usage), ['accounts'])
+        self.assertTrue(usage['accounts'] > 1000)
+
+
+class TestConcurrency(TestCase):
+
+    THREADS = 8
+
+    def run_threads(self, target):
+        threads = [Thread(target=target, args=(i,)) for i in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def test_stats(self):
+        s = CacheStats()
+
+        def count(i):
+            for _ in range(1000):
+                s.hit()
+                s.miss(expired=True)
+                s.put()
+
+        self.run_threads(count)
+        self.assertEqual(s.summary, (8000, 8000, 8000, 8000, 8000))
+
+    def test_stores(self):
+        for store in (MemoryStore(max_entries=100), ShardedMemoryStore(max_entries=100, shards=4)):
+            def put(i):
+                for j in range(1000):
+                    store['%d-%d' % (i, j % 300)] = CacheEntry(j)
+                    store['%d-%d' % (i, j % 50)]
+
+            self.run_threads(put)
+            self.assertTrue(len(store) <= 100)
+            self.assertEqual(len(store.items()), len(store))
+
+    def test_sharded_store(self):
+        s = ShardedMemoryStore(max_entries=8, shards=4, eviction='fifo')
+        self.assertEqual(len(s.shards), 4)
+
+        for i in range(8):
+            s[i] = CacheEntry(i)
+        self.assertEqual(s[3].value, 3)
+        self.assertTrue(s.bytes > 0)
+
+        for i in range(8, 100):
+            s[i] = CacheEntry(i)
+        self.assertEqual(len(s), 8)
+        self.assertIsNone(s[0])
+
+        del s[99]
+        self.assertIsNone(s[99])
+        self.assertTrue(s.evict())
+
+        s.clear()
+        self.assertEqual((len(s), s.bytes), (0, 0))
+        self.assertFalse(s.evict())
+
+        self.assertRaises(ValueError, ShardedMemoryStore, shards=0)
+
+    def test_cache_with_sharded_store(self):
+        cache = Cache(store=ShardedMemoryStore, store_opts={'max_entries': 32, 'shards': 4})
+        cache.put('foo', 'Foo')
+
+        self.assertEqual(cache.get('foo'), 'Foo')
+        self.assertEqual(cache.store.shards[0].store.size_limit, 8)
+
+
 class TestRedisStore(TestCase):
 
     class Redis(object):
         def __init__(self, *args, **kwargs):
             self.data = {}
+            self.ttls = {}
 
         def get(self, key):
             return self.data.get(key)
 
         def setex(self, key, data, ttl):
             self.data[key] = data
+            self.ttls[key] = ttl
+
+        def getex(self, key, ex):
+            if key in self.data:
+                self.ttls[key] = ex
+            return self.data.get(key)
+
+        def pttl(self, key):
+            return self.ttls[key] * 1000 if key in self.data else -2
+
+        def expire(self, key, ttl):
+            if key in self.data:
+                self.ttls[key] = ttl
+
+        def exists(self, key):
+            return int(key in self.data)
+
+        def pipeline(self, transaction):
+            redis = self
+            commands = []
+
+            class Pipeline(object):
+                def __getattr__(self, name):
+                    return lambda *args, **kwargs: commands.append((name, args, kwargs))
+
+                def execute(self):
+                    return [getattr(redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+            return Pipeline()
 
         def delete(self, key):
             if key in self.data:
@@ -294,6 +820,13 @@ class TestRedisStore(TestCase):
         def dbsize(self):
             return len(self.data)
 
+        def scan_iter(self, match, count):
+            return [k for k in list(self.data) if fnmatchcase(k, match)]
+
+        def unlink(self, *keys):
+            for key in keys:
+                self.delete(key)
+
     def test_redis_not_available(self):
         # make sure redis is not available
         with patch.dict('sys.modules', {'redis': object()}):
@@ -322,21 +855,137 @@ class TestRedisStore(TestCase):
         s.clear()
         self.assertEqual(len(s), 0)
 
+    def test_namespaces(self):
+        with patch.dict('sys.modules', {'redis': MagicMock(Redis=self.Redis)}):
+            a = RedisStore(namespace='accounts', key_prefix='app:')
+            b = RedisStore(namespace='groups', key_prefix='app:', hash_keys=True)
+        b.redis = a.redis
+        a.SCAN_BATCH_SIZE = 2
+
+        for i in range(5):
+            a['foo%d' % i] = CacheEntry(i)
+        b['https://api.stormpath.com/v1/groups/G'] = CacheEntry('G')
+        a.redis.data['other'] = b'...'
+
+        self.assertIn('app:accounts:foo0', a.redis.data)
+        self.assertIn('app:groups:' + hash_key('https://api.stormpath.com/v1/groups/G'), a.redis.data)
+        self.assertEqual(b['https://api.stormpath.com/v1/groups/G'].value, 'G')
+        self.assertEqual((len(a), len(b)), (5, 1))
+
+        a.clear()
+        self.assertEqual((len(a), len(b), len(a.redis.data)), (0, 1, 2))
+
+    def test_json_entries(self):
+        with patch.dict('sys.modules', {'redis': MagicMock(Redis=self.Redis)}):
+            s = RedisStore()
+
+        s.redis.data['foo'] = b'{"value": "Value Of Foo", "created_at": "2013-01-01 09:30:00.0"}'
+        self.assertEqual(s['foo'].value, 'Value Of Foo')
+        self.assertEqual(s['foo'].created_at, 1357032600)
+
+    def test_tti(self):
+        redis = MagicMock(Redis=self.Redis, ResponseError=KeyError)
+        with patch.dict('sys.modules', {'redis': redis}):
+            s = RedisStore(ttl=600, tti=960)
+
+        # Put 100 seconds ago, with a TTL shorter than the TTI.
+        s['foo'] = CacheEntry('Foo', created_at=time() - 100)
+        self.assertEqual(s.redis.ttls['foo'], 600)
+        s.redis.ttls['foo'] = 500
+        self.assertAlmostEqual(s['foo'].last_accessed_at, time() - 100, delta=1)
+
+        # Read 100 seconds ago. The expiration is reset to the TTI, but no
+        # later than the TTL.
+        s.redis.ttls['foo'] = 860
+        self.assertAlmostEqual(s['foo'].last_accessed_at, time() - 100, delta=1)
+        self.assertAlmostEqual(s.redis.ttls['foo'], 500, delta=1)
+
+        s['foo'] = CacheEntry('Foo', created_at=time() - 100)
+        s.ttl = 1200
+        s.redis.ttls['foo'] = 860
+        self.assertAlmostEqual(s['foo'].last_accessed_at, time() - 100, delta=1)
+        self.assertEqual(s.redis.ttls['foo'], 960)
+
+        # Redis servers before 6.2 don't support GETEX.
+        s.redis.getex = MagicMock(side_effect=KeyError)
+        s.redis.ttls['foo'] = 860
+        self.assertAlmostEqual(s['foo'].last_accessed_at, time() - 100, delta=1)
+        self.assertEqual(s.redis.ttls['foo'], 960)
+        self.assertFalse(s.getex)
+
+        self.assertIsNone(s['bar'])
+        self.assertNotIn('bar', s.redis.ttls)
+
+        # Checking for an entry doesn't reset its expiration.
+        s.redis.ttls['foo'] = 860
+        self.assertIn('foo', s)
+        self.assertNotIn('bar', s)
+        self.assertEqual(s.redis.ttls['foo'], 860)
+
+    def test_cache_with_remote_tti(self):
+        with patch.dict('sys.modules', {'redis': MagicMock(Redis=self.Redis)}):
+            cache = Cache(store=RedisStore, ttl=300, tti=60, max_stale=900)
+
+        # Entries are kept for max stale past their TTL and TTI.
+        self.assertEqual((cache.store.ttl, cache.store.tti), (1200, 960))
+        cache.put('foo', 'Foo')
+        self.assertEqual(cache.store.redis.ttls['foo'], 960)
+
+        # Read 30 seconds ago.
+        cache.store['foo'] = CacheEntry('Foo', created_at=time() - 120)
+        cache.store.redis.ttls['foo'] = 930
+        self.assertEqual(cache.get('foo'), 'Foo')
+
+        # Not read for longer than the TTI, so only stale.
+        cache.store.redis.ttls['foo'] = 860
+        self.assertIsNone(cache.get('foo'))
+        self.assertEqual(cache.get_stale('foo'), 'Foo')
+
+    def test_hot_entries_expire_by_ttl(self):
+        with patch.dict('sys.modules', {'redis': MagicMock(Redis=self.Redis)}):
+            cache = Cache(store=RedisStore, ttl=300, tti=60, max_stale=900)
+
+        # Reads don't keep entries past their TTL and max stale.
+        cache.store['foo'] = CacheEntry('Foo', created_at=time() - 1000)
+        cache.store.redis.ttls['foo'] = 950
+        self.assertEqual(cache.get_stale('foo'), 'Foo')
+        self.assertAlmostEqual(cache.store.redis.ttls['foo'], 200, delta=1)
+
+        # Reads keep resetting the expiration to the TTI until then.
+        cache.store['foo'] = CacheEntry('Foo', created_at=time() - 100)
+        cache.store.redis.ttls['foo'] = 950
+        self.assertEqual(cache.get('foo'), 'Foo')
+        self.assertEqual(cache.store.redis.ttls['foo'], 960)
+
 
 class TestMemcachedStore(TestCase):
 
     class Memcache(object):
         def __init__(self, *args, **kwargs):
             self.data = {}
+            self.versions = {}
+            self.updates = []
 
         def get(self, key):
+            if key not in self.data:
+                return None
+
             data, flags = self.data.get(key)
-            data = json_deserializer(key, data, flags)
+            data = binary_deserializer(key, data, flags)
             return data
 
         def set(self, key, entry, expire):
-            data, flags = json_serializer(key, entry)
+            data, flags = binary_serializer(key, entry)
             self.data[key] = (data, flags)
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+        def gets(self, key):
+            return self.get(key), self.versions.get(key)
+
+        def cas(self, key, entry, cas, expire, noreply):
+            if self.versions.get(key) == cas:
+                self.set(key, entry, expire)
+                self.updates.append((key, expire))
 
         def delete(self, key):
             if key in self.data:
@@ -348,6 +997,14 @@ class TestMemcachedStore(TestCase):
         def stats(self):
             return {'curr_items': len(self.data)}
 
+        def add(self, key, value, expire, noreply):
+            self.data.setdefault(key, binary_serializer(key, value))
+
+        def incr(self, key, value, noreply):
+            if key in self.data:
+                self.data[key] = (str(int(self.data[key][0]) + value), STR_VALUE)
+                return int(self.data[key][0])
+
     def test_pymemcache_not_available(self):
         # make sure pymemcache is not available
         with patch.dict('sys.modules', {'pymemcache': object(), 'pymemcache.client': object()}):
@@ -374,6 +1031,242 @@ class TestMemcachedStore(TestCase):
         s.clear()
         self.assertEqual(len(s), 0)
 
+    def test_namespaces(self):
+        with patch.dict('sys.modules', {'pymemcache': object(), 'pymemcache.client': MagicMock(Client=self.Memcache)}):
+            a = MemcachedStore(namespace='accounts')
+            b = MemcachedStore(namespace='groups', hash_keys=True)
+        b.memcache = a.memcache
+
+        a['foo'] = CacheEntry('Foo')
+        b['https://api.stormpath.com/v1/groups/G'] = CacheEntry('G')
+        self.assertIn('accounts:1:foo', a.memcache.data)
+        self.assertIn('groups:1:' + hash_key('https://api.stormpath.com/v1/groups/G'), a.memcache.data)
+
+        a.clear()
+        self.assertIsNone(a['foo'])
+        self.assertEqual(b['https://api.stormpath.com/v1/groups/G'].value, 'G')
+
+        a['foo'] = CacheEntry('New Foo')
+        self.assertIn('accounts:2:foo', a.memcache.data)
+
+    def test_json_entries(self):
+        with patch.dict('sys.modules', {'pymemcache': object(), 'pymemcache.client': MagicMock(Client=self.Memcache)}):
+            s = MemcachedStore()
+
+        s.memcache.data['foo'] = json_serializer('foo', CacheEntry('Value Of Foo', ttl=10))
+        self.assertEqual(s['foo'].value, 'Value Of Foo')
+        self.assertEqual(s['foo'].ttl, 10)
+
+    def test_tti(self):
+        with patch.dict('sys.modules', {'pymemcache': object(), 'pymemcache.client': MagicMock(Client=self.Memcache)}):
+            s = MemcachedStore(tti=60)
+
+        s['foo'] = CacheEntry('Foo')
+        self.assertEqual(s['foo'].value, 'Foo')
+        self.assertIsNone(s['bar'])
+        self.assertEqual(s.memcache.updates, [])
+
+        # The last access time is updated once it's 10% of the TTI old.
+        s['foo'] = CacheEntry('Foo', created_at=time() - 30)
+        self.assertAlmostEqual(s['foo'].last_accessed_at, time(), delta=1)
+        self.assertAlmostEqual(s['foo'].last_accessed_at, time(), delta=1)
+        self.assertEqual(s.memcache.updates, [('foo', 60)])
+
+        # Updates don't overwrite new values.
+        s['foo'] = CacheEntry('Foo', created_at=time() - 30)
+        s.memcache.gets = lambda key: (s.memcache.get(key), None)
+        s['foo']
+        self.assertEqual(len(s.memcache.updates), 1)
+
+        # Checking for an entry doesn't touch it.
+        s['foo'] = CacheEntry('Foo', created_at=time() - 30)
+        self.assertIn('foo', s)
+        self.assertNotIn('bar', s)
+        self.assertEqual(len(s.memcache.updates), 1)
+
+    def test_hot_entries_expire_by_ttl(self):
+        with patch.dict('sys.modules', {'pymemcache': object(), 'pymemcache.client': MagicMock(Client=self.Memcache)}):
+            s = MemcachedStore(ttl=120, tti=60)
+
+        s['foo'] = CacheEntry('Foo', created_at=time() - 100, last_accessed_at=time() - 30)
+        s['foo']
+        self.assertEqual(len(s.memcache.updates), 1)
+        self.assertAlmostEqual(s.memcache.updates[0][1], 20, delta=1)
+
+        # Past its TTL, reads don't extend it at all.
+        s['foo'] = CacheEntry('Foo', created_at=time() - 130, last_accessed_at=time() - 30)
+        s['foo']
+        self.assertEqual(len(s.memcache.updates), 1)
+
+
+class TestSerializer(TestCase):
+
+    class msgpack(object):
+        @staticmethod
+        def packb(value, use_bin_type):
+            return b'msgpack:' + json_dumps(value).encode('utf-8')
+
+        @staticmethod
+        def unpackb(data, raw):
+            return json_loads(data[len(b'msgpack:'):].decode('utf-8'))
+
+    def setUp(self):
+        self.entry = CacheEntry({'href': 'foo', 'items': ['x' * 100] * 50},
+            created_at=1357032600.0, last_accessed_at=1357036140.0, ttl=100)
+
+    def check(self, serializer, data):
+        entry = serializer.loads(data)
+        self.assertEqual(entry.to_dict(), self.entry.to_dict())
+
+    def test_default(self):
+        s = Serializer()
+        data = s.dumps(self.entry)
+
+        # Readable by earlier versions.
+        legacy = json_loads(data.decode('utf-8'))
+        self.assertEqual(legacy['value'], self.entry.value)
+        self.assertEqual(datetime.strptime(legacy['created_at'], '%Y-%m-%d %H:%M:%S.%f'),
+            datetime(2013, 1, 1, 9, 30))
+        self.assertEqual(binary_serializer('foo', self.entry)[1], JSON_VALUE)
+        self.check(s, data)
+
+    def test_binary(self):
+        s = Serializer(binary=True)
+        data = s.dumps(self.entry)
+
+        self.assertEqual(data, self.entry.encode())
+        self.assertEqual(binary_serializer('foo', self.entry, s)[1], BINARY_VALUE)
+        self.check(Serializer(), data)
+
+    def test_zlib(self):
+        s = Serializer(compression='zlib')
+        data = s.dumps(self.entry)
+
+        self.assertTrue(len(data) < len(self.entry.encode()) / 10)
+        self.check(s, data)
+        self.check(Serializer(), data)
+
+        # Small entries aren't compressed.
+        small = CacheEntry('foo')
+        self.assertTrue(s.dumps(small).endswith(b'"foo"'))
+        self.assertEqual(s.loads(s.dumps(small)).value, 'foo')
+
+    def test_msgpack_and_lz4(self):
+        lz4 = MagicMock()
+        lz4.frame.compress.side_effect = lambda data: b'lz4:' + zlib.compress(data)
+        lz4.frame.decompress.side_effect = lambda data: zlib.decompress(data[len(b'lz4:'):])
+
+        with patch.dict('sys.modules', {'msgpack': self.msgpack, 'lz4': lz4, 'lz4.frame': lz4.frame}):
+            s = Serializer(codec='msgpack', compression='lz4')
+            data = s.dumps(self.entry)
+
+            self.assertIn(b'lz4:', data)
+            self.check(Serializer(), data)
+
+    def test_not_available(self):
+        with patch.dict('sys.modules', {'msgpack': None, 'lz4': None}):
+            self.assertRaises(RuntimeError, Serializer, codec='msgpack')
+            self.assertRaises(RuntimeError, Serializer, compression='lz4')
+
+        self.assertRaises(ValueError, Serializer, codec='pickle')
+        self.assertRaises(ValueError, Serializer, compression='bz2')
+
+    def test_earlier_formats(self):
+        s = Serializer(compression='zlib')
+        self.check(s, self.entry.encode())
+        self.check(s, json_dumps(self.entry.to_dict()).encode('utf-8'))
+
+        self.assertRaises(ValueError, s.loads, b'')
+        self.assertRaises(ValueError, s.loads, b'\x07foo')
+
+    def test_redis_store(self):
+        with patch.dict('sys.modules', {'redis': MagicMock(Redis=TestRedisStore.Redis)}):
+            store = RedisStore(serializer=Serializer(compression='zlib'))
+
+        store['foo'] = self.entry
+        self.assertTrue(len(store.redis.data['foo']) < 1000)
+        self.assertEqual(store['foo'].value, self.entry.value)
+
+
+class TestInvalidationBus(TestCase):
+
+    class Redis(object):
+        channels = {}
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def pubsub(self, **kwargs):
+            return MagicMock(subscribe=self.channels.update)
+
+        def publish(self, channel, message):
+            self.channels[channel]({'data': message.encode('utf-8')})
+
+    def check(self, bus):
+        received = []
+
+        a = bus.subscribe(lambda href: received.append(('a', href)))
+        bus.subscribe(lambda href: received.append(('b', href)))
+
+        bus.publish(a, 'foo')
+        self.assertEqual(received, [('b', 'foo')])
+
+        bus.unsubscribe(a)
+        bus.publish('c', 'bar')
+        self.assertEqual(received, [('b', 'foo'), ('b', 'bar')])
+
+    def test_local(self):
+        self.check(LocalInvalidationBus())
+
+    def test_redis(self):
+        with patch.dict('sys.modules', {'redis': MagicMock(Redis=self.Redis)}):
+            bus = RedisInvalidationBus()
+
+        self.check(bus)
+        bus.close()
+        self.assertTrue(bus.thread.stop.called)
+
+    def test_redis_not_available(self):
+        with patch.dict('sys.modules', {'redis': object()}):
+            with self.assertRaises(RuntimeError):
+                RedisInvalidationBus()
+
+
+class TestResourceIndex(TestCase):
+
+    DIR = 'https://api.stormpath.com/v1/directories/D'
+
+    def test_everything(self):
+        index = ResourceIndex(max_entries=3)
+
+        index.add('https://api.stormpath.com/v1/accounts/A', {
+            'email': 'a@example.com', 'username': 'a', 'directory': {'href': self.DIR}})
+        index.add('https://api.stormpath.com/v1/apiKeys/K', {'id': 'K'})
+        index.add('https://api.stormpath.com/v1/directories/D', {'name': 'D'})
+        self.assertEqual(len(index), 3)
+
+        self.assertEqual(
+            index.get('accounts', 'email', 'a@example.com', directory=self.DIR),
+            'https://api.stormpath.com/v1/accounts/A')
+        self.assertEqual(index.get('accounts', 'username', 'a', directory=self.DIR),
+            'https://api.stormpath.com/v1/accounts/A')
+        self.assertIsNone(index.get('accounts', 'username', 'a', directory='other'))
+        self.assertEqual(index.get('apiKeys', 'id', 'K'),
+            'https://api.stormpath.com/v1/apiKeys/K')
+        self.assertEqual((index.hits, index.misses), (3, 1))
+
+        # Accounts without a known directory can't be indexed.
+        index.add('https://api.stormpath.com/v1/accounts/B', {'email': 'b@example.com'})
+        self.assertEqual(len(index), 3)
+
+        index.add('https://api.stormpath.com/v1/groups/G', {
+            'name': 'G', 'directory': {'href': self.DIR}})
+        self.assertEqual(len(index), 3)
+        self.assertIsNone(index.get('accounts', 'email', 'a@example.com', directory=self.DIR))
+
+        index.clear()
+        self.assertEqual(len(index), 0)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,582 @@
+"""Unit tests of DataStore functionality."""
+
+
+from datetime import datetime, timedelta
+from os import remove
+from tempfile import mkstemp
+from time import time
+from unittest import TestCase, main
+try:
+    from mock import MagicMock
+except ImportError:
+    from unittest.mock import MagicMock
+
+from stormpath.cache.entry import CacheEntry
+from stormpath.cache.invalidation import LocalInvalidationBus
+from stormpath.data_store import NO_CACHE, DataStore, format_expand, parse_expand
+from stormpath.error import Error
+
+
+class TestExpandParams(TestCase):
+
+    def test_parse_expand(self):
+        e = parse_expand('directory,customData,groups(offset:0,limit:25)')
+
+        self.assertEqual(list(e.keys()), ['directory', 'customData', 'groups'])
+        self.assertEqual(e['directory'], {})
+        self.assertEqual(e['groups'], {'offset': 0, 'limit': 25})
+
+    def test_format_expand(self):
+        e = parse_expand('directory,groups(limit:25,offset:0)')
+
+        self.assertEqual(format_expand(e), 'directory,groups(limit:25,offset:0)')
+
+
+class TestDataStoreRegions(TestCase):
+
+    def test_default_regions(self):
+        ds = DataStore(MagicMock())
+
+        self.assertIs(ds._get_cache('http://example.com/accounts/FOO'), ds.cache_manager.get_cache('accounts'))
+        self.assertIs(ds._get_cache('http://example.com/accounts/FOO/customData'),
+            ds.cache_manager.get_cache('customData'))
+        self.assertIs(ds._get_cache('http://example.com/accounts'), NO_CACHE)
+        self.assertIs(ds._get_cache('http://example.com/accessTokens/FOO'), NO_CACHE)
+        self.assertIs(ds._get_cache('FOO'), NO_CACHE)
+
+    def test_declared_region_is_cached_when_configured(self):
+        ds = DataStore(MagicMock(), {'regions': {'authTokens': {'ttl': 5}}})
+
+        cache = ds.cache_manager.get_cache('authTokens')
+        self.assertEqual(cache.ttl, 5)
+        self.assertIs(ds._get_cache('http://example.com/accessTokens/FOO'), cache)
+        self.assertIs(ds._get_cache('http://example.com/refreshTokens/FOO'), cache)
+
+    def test_region_from_configuration_alone(self):
+        ex = MagicMock()
+        ex.get.return_value = {'href': 'http://example.com/widgets/FOO', 'name': 'Foo'}
+        ds = DataStore(ex, {'regions': {'widgets': {}}})
+
+        ds.get_resource('http://example.com/widgets/FOO')
+        ds.get_resource('http://example.com/widgets/FOO')
+
+        self.assertEqual(ex.get.call_count, 1)
+
+    def test_href_routes_are_memoised(self):
+        ds = DataStore(MagicMock())
+        ds.MAX_HREF_CACHE = 2
+
+        ds._get_cache('http://example.com/accounts/FOO')
+        self.assertIn('http://example.com/accounts/FOO', ds._href_cache)
+
+        ds._get_cache('http://example.com/accounts/BAR')
+        ds._get_cache('http://example.com/accounts/BAZ')
+        self.assertEqual(list(ds._href_cache), ['http://example.com/accounts/BAZ'])
+
+
+class TestDataStoreSnapshot(TestCase):
+
+    HREF = 'http://example.com/accounts/FOO'
+
+    def setUp(self):
+        _, self.path = mkstemp()
+        self.ds = DataStore(MagicMock(), {'ttl': 60, 'tti': 60})
+
+    def tearDown(self):
+        remove(self.path)
+
+    def test_snapshot_and_restore(self):
+        created_at = time() - 30
+        self.ds.cache_manager.get_cache('accounts').store[self.HREF] = CacheEntry(
+            {'href': self.HREF, 'name': 'Foo'}, created_at=created_at)
+        self.ds.cache_manager.get_cache('groups').store['http://example.com/groups/OLD'] = CacheEntry(
+            {'href': 'http://example.com/groups/OLD'}, created_at=time() - 120)
+
+        self.assertEqual(self.ds.snapshot(self.path), 2)
+
+        ds = DataStore(MagicMock(), {'ttl': 60, 'tti': 60})
+        self.assertEqual(ds.restore(self.path), 1)
+
+        cache = ds.cache_manager.get_cache('accounts')
+        entry = cache.store[self.HREF]
+        self.assertEqual(entry.value, {'href': self.HREF, 'name': 'Foo'})
+        self.assertEqual(entry.created_at, created_at)
+        self.assertEqual((cache.stats.size, len(cache.sweeper)), (1, 1))
+        self.assertEqual(ds.get_resource(self.HREF)['name'], 'Foo')
+        self.assertFalse(ds.executor.get.called)
+
+    def test_restore_empty_snapshot(self):
+        self.ds.snapshot(self.path)
+
+        self.assertEqual(DataStore(MagicMock()).restore(self.path), 0)
+
+    def test_restore_invalid_file(self):
+        with open(self.path, 'w') as f:
+            f.write('{"foo": "bar"}\n{"foo": "bar"}\n')
+
+        with self.assertRaises(ValueError):
+            self.ds.restore(self.path)
+
+
+class TestDataStoreExpansions(TestCase):
+
+    ACC = 'http://example.com/accounts/FOO'
+    DIR = 'http://example.com/directories/DIR'
+    GROUP = 'http://example.com/groups/G1'
+
+    def setUp(self):
+        self.ex = MagicMock()
+        self.ds = DataStore(self.ex)
+        self.ex.get.return_value = {
+            'href': self.ACC,
+            'name': 'Foo',
+            'directory': {'href': self.DIR, 'name': 'Dir'},
+            'customData': {'href': self.ACC + '/customData', 'color': 'red'},
+            'groups': {
+                'href': self.ACC + '/groups',
+                'offset': 0,
+                'limit': 25,
+                'size': 1,
+                'items': [{'href': self.GROUP, 'name': 'Admins'}],
+            },
+        }
+
+    def test_expanded_resource_is_rebuilt_from_cache(self):
+        params = {'expand': 'directory,customData,groups(offset:0,limit:25)'}
+
+        self.ds.get_resource(self.ACC, params=params)
+        data = self.ds.get_resource(self.ACC, params=params)
+
+        self.assertEqual(self.ex.get.call_count, 1)
+        self.assertEqual(data['directory']['name'], 'Dir')
+        self.assertEqual(data['customData']['color'], 'red')
+        self.assertEqual(data['groups']['size'], 1)
+        self.assertEqual(data['groups']['items'][0]['name'], 'Admins')
+
+    def test_only_missing_expansions_are_fetched(self):
+        self.ds.get_resource(self.ACC, params={'expand': 'directory,customData'})
+        self.ds.uncache_resource(self.ACC + '/customData')
+
+        data = self.ds.get_resource(self.ACC, params={'expand': 'directory,customData'})
+
+        self.assertEqual(self.ex.get.call_count, 2)
+        self.ex.get.assert_called_with(self.ACC, params={'expand': 'customData'})
+        self.assertEqual(data['directory']['name'], 'Dir')
+        self.assertEqual(data['customData']['color'], 'red')
+
+    def test_different_collection_page_is_fetched(self):
+        self.ds.get_resource(self.ACC, params={'expand': 'groups(offset:0,limit:25)'})
+        self.ds.get_resource(self.ACC, params={'expand': 'groups(offset:25,limit:25)'})
+
+        self.assertEqual(self.ex.get.call_count, 2)
+        self.ex.get.assert_called_with(self.ACC, params={'expand': 'groups(limit:25,offset:25)'})
+
+    def test_uncached_parent_is_fetched_with_all_expansions(self):
+        self.ds.get_resource(self.ACC, params={'expand': 'directory'})
+
+        self.ex.get.assert_called_once_with(self.ACC, params={'expand': 'directory'})
+
+
+class TestDataStoreStaleWhileRevalidate(TestCase):
+
+    def test_stale_resource_is_refreshed_in_background(self):
+        ex = MagicMock()
+        ex.get.return_value = {'href': 'http://example.com/accounts/FOO', 'name': 'New'}
+        ds = DataStore(ex, {'ttl': 10, 'tti': 10, 'stale_while_revalidate': 60})
+
+        cache = ds.cache_manager.get_cache('accounts')
+        cache.store['http://example.com/accounts/FOO'] = CacheEntry(
+            {'href': 'http://example.com/accounts/FOO', 'name': 'Old'},
+            created_at=datetime.utcnow() - timedelta(seconds=30))
+
+        data = ds.get_resource('http://example.com/accounts/FOO')
+        self.assertEqual(data['name'], 'Old')
+
+        cache.revalidator.join()
+        ex.get.assert_called_once_with('http://example.com/accounts/FOO', params=None)
+        self.assertEqual(ds.get_resource('http://example.com/accounts/FOO')['name'], 'New')
+
+
+class TestDataStoreNotFoundCache(TestCase):
+
+    HREF = 'http://example.com/applications/APP/accounts/MISSING'
+
+    def setUp(self):
+        self.ex = MagicMock()
+        self.ex.get.side_effect = Error({
+            'status': 404,
+            'code': 404,
+            'developerMessage': 'The requested resource does not exist.',
+        }, http_status=404)
+        self.ds = DataStore(self.ex)
+
+    def get(self):
+        with self.assertRaises(Error) as ctx:
+            self.ds.get_resource(self.HREF)
+
+        return ctx.exception
+
+    def test_not_found_is_cached(self):
+        self.get()
+        error = self.get()
+
+        self.ex.get.assert_called_once_with(self.HREF, params=None)
+        self.assertEqual(error.status, 404)
+        self.assertEqual(error.developer_message, 'The requested resource does not exist.')
+
+    def test_not_found_uses_its_own_ttl(self):
+        self.assertEqual(self.ds.not_found_cache.ttl, DataStore.NOT_FOUND_TTL)
+
+        ds = DataStore(self.ex, {'ttl': 600, 'regions': {'notFound': {'ttl': 5}}})
+        self.assertEqual(ds.not_found_cache.ttl, 5)
+        self.assertEqual(ds.cache_manager.get_cache('accounts').ttl, 600)
+
+    def test_other_errors_are_not_cached(self):
+        self.ex.get.side_effect = Error({'status': 500}, http_status=500)
+
+        self.get()
+        self.get()
+
+        self.assertEqual(self.ex.get.call_count, 2)
+
+    def test_collection_queries_are_not_cached(self):
+        for i in range(2):
+            with self.assertRaises(Error):
+                self.ds.get_resource(self.HREF, params={'q': 'foo'})
+
+        self.assertEqual(self.ex.get.call_count, 2)
+
+    def test_create_invalidates_not_found(self):
+        self.get()
+        self.ex.post.return_value = {'href': self.HREF, 'name': 'Found'}
+
+        self.ds.create_resource('http://example.com/applications/APP/accounts', {})
+        self.ex.get.side_effect = None
+        self.ex.get.return_value = {'href': self.HREF, 'name': 'Found'}
+        self.ds.uncache_resource(self.HREF)
+
+        self.assertEqual(self.ds.get_resource(self.HREF)['name'], 'Found')
+
+
+class TestDataStoreOutageMode(TestCase):
+
+    HREF = 'http://example.com/accounts/FOO'
+
+    def setUp(self):
+        self.ex = MagicMock()
+        self.ds = DataStore(self.ex, {'ttl': 10, 'tti': 10, 'max_stale': 60, 'outage_retry_after': 30})
+
+        cache = self.ds.cache_manager.get_cache('accounts')
+        cache.store[self.HREF] = CacheEntry(
+            {'href': self.HREF, 'name': 'Foo'},
+            created_at=datetime.utcnow() - timedelta(seconds=30))
+
+        error = Error({'developerMessage': 'Connection refused.'})
+        error.connection_error = True
+        self.ex.get.side_effect = error
+
+    def test_expired_entry_is_served(self):
+        data = self.ds.get_resource(self.HREF)
+
+        self.assertEqual(data['name'], 'Foo')
+        self.assertTrue(data['sp_stale'])
+        self.assertTrue(self.ds.in_outage)
+
+        # Until it's time to retry, the API isn't called again.
+        self.ds.get_resource(self.HREF)
+        self.assertEqual(self.ex.get.call_count, 1)
+
+    def test_server_errors_start_an_outage(self):
+        self.ex.get.side_effect = Error({'status': 503}, http_status=503)
+
+        self.assertTrue(self.ds.get_resource(self.HREF)['sp_stale'])
+
+    def test_client_errors_dont_start_an_outage(self):
+        self.ex.get.side_effect = Error({'status': 403}, http_status=403)
+
+        with self.assertRaises(Error):
+            self.ds.get_resource(self.HREF)
+
+        self.assertFalse(self.ds.in_outage)
+
+    def test_other_errors_without_status_dont_start_an_outage(self):
+        self.ex.get.side_effect = Error({'developerMessage': 'Trying to redirect outside of API base url.'})
+
+        with self.assertRaises(Error):
+            self.ds.get_resource(self.HREF)
+
+        self.assertFalse(self.ds.in_outage)
+
+    def test_expanded_entries_are_served(self):
+        dir_href = 'http://example.com/directories/DIR'
+        self.ds.cache_manager.get_cache('accounts').store[self.HREF] = CacheEntry(
+            {'href': self.HREF, 'name': 'Foo', 'directory': {'href': dir_href}},
+            created_at=datetime.utcnow() - timedelta(seconds=30))
+        self.ds.cache_manager.get_cache('directories').store[dir_href] = CacheEntry(
+            {'href': dir_href, 'name': 'Dir'},
+            created_at=datetime.utcnow() - timedelta(seconds=30))
+
+        data = self.ds.get_resource(self.HREF, {'expand': 'directory'})
+
+        self.assertEqual(data['directory']['name'], 'Dir')
+        self.assertTrue(data['sp_stale'])
+        self.assertTrue(self.ds.in_outage)
+
+        # Until it's time to retry, the API isn't called again.
+        self.ds.get_resource(self.HREF, {'expand': 'directory'})
+        self.assertEqual(self.ex.get.call_count, 1)
+
+    def test_entries_past_max_stale_are_not_served(self):
+        self.ds.cache_manager.get_cache('accounts').store[self.HREF] = CacheEntry(
+            {'href': self.HREF, 'name': 'Foo'},
+            created_at=datetime.utcnow() - timedelta(seconds=120))
+
+        with self.assertRaises(Error):
+            self.ds.get_resource(self.HREF)
+
+    def test_writes_are_rejected(self):
+        self.ds.get_resource(self.HREF)
+
+        with self.assertRaises(Error) as ctx:
+            self.ds.update_resource(self.HREF, {'name': 'Bar'})
+
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertFalse(self.ex.post.called)
+
+    def test_outage_ends(self):
+        self.ds.get_resource(self.HREF)
+        self.ds._outage_checked_at -= 30
+        self.ex.get.side_effect = None
+        self.ex.get.return_value = {'href': self.HREF, 'name': 'Bar'}
+
+        data = self.ds.get_resource(self.HREF)
+
+        self.assertEqual(data, {'href': self.HREF, 'name': 'Bar'})
+        self.assertFalse(self.ds.in_outage)
+
+    def test_disabled_by_default(self):
+        ds = DataStore(self.ex, {'ttl': 10, 'tti': 10, 'max_stale': 60})
+        ds.cache_manager.get_cache('accounts').store[self.HREF] = CacheEntry(
+            {'href': self.HREF, 'name': 'Foo'},
+            created_at=datetime.utcnow() - timedelta(seconds=30))
+
+        with self.assertRaises(Error):
+            ds.get_resource(self.HREF)
+
+
+class TestDataStoreInvalidationBus(TestCase):
+
+    HREF = 'http://example.com/accounts/FOO'
+
+    def setUp(self):
+        bus = LocalInvalidationBus()
+        self.ex = MagicMock()
+        self.ex.get.return_value = {'href': self.HREF, 'name': 'Foo'}
+        self.ex.post.return_value = {'href': self.HREF, 'name': 'Bar'}
+        self.ds1 = DataStore(self.ex, {'invalidation_bus': bus})
+        self.ds2 = DataStore(self.ex, {'invalidation_bus': bus})
+
+        self.ds1.get_resource(self.HREF)
+        self.ds2.get_resource(self.HREF)
+
+    def cached(self, ds):
+        return self.HREF in ds._get_cache(self.HREF)
+
+    def test_updates_are_evicted_elsewhere(self):
+        self.ds1.update_resource(self.HREF, {'name': 'Bar'})
+
+        self.assertTrue(self.cached(self.ds1))
+        self.assertFalse(self.cached(self.ds2))
+
+    def test_deletes_are_evicted_elsewhere(self):
+        self.ds2.delete_resource(self.HREF)
+
+        self.assertFalse(self.cached(self.ds1))
+        self.assertFalse(self.cached(self.ds2))
+
+    def test_creates_evict_not_found_elsewhere(self):
+        self.ds2.not_found_cache.put(self.HREF, {'status': 404})
+        self.ds1.create_resource('http://example.com/accounts', {'name': 'Bar'})
+
+        self.assertNotIn(self.HREF, self.ds2.not_found_cache)
+
+    def test_shared_stores_are_not_evicted(self):
+        class SharedStore(object):
+            data = {}
+
+            def __getitem__(self, key):
+                return self.data.get(key)
+
+            def __setitem__(self, key, entry):
+                self.data[key] = entry
+
+            def __delitem__(self, key):
+                self.data.pop(key, None)
+
+        bus = LocalInvalidationBus()
+        regions = {'accounts': {'store': SharedStore, 'l1': {'ttl': 60}}}
+        ds1 = DataStore(self.ex, {'invalidation_bus': bus, 'regions': regions})
+        ds2 = DataStore(self.ex, {'invalidation_bus': bus, 'regions': regions})
+        ds2.get_resource(self.HREF)
+
+        ds1.update_resource(self.HREF, {'name': 'Bar'})
+
+        self.assertIsNone(ds2._get_cache(self.HREF).l1[self.HREF])
+        self.assertEqual(SharedStore.data[self.HREF].value['name'], 'Bar')
+
+
+class TestDataStoreWriteThrough(TestCase):
+
+    HREF = 'http://example.com/accounts/FOO'
+
+    def setUp(self):
+        self.ex = MagicMock()
+        self.ds = DataStore(self.ex, {'regions': {'directories': {}}})
+
+    def test_created_resource_is_cached_under_its_href(self):
+        self.ex.post.return_value = {
+            'href': self.HREF, 'name': 'Foo',
+            'directory': {'href': 'http://example.com/directories/D', 'name': 'D'},
+        }
+        self.ds.create_resource('http://example.com/directories/D/accounts', {'name': 'Foo'})
+
+        self.assertEqual(self.ds.get_resource(self.HREF)['name'], 'Foo')
+        self.assertEqual(self.ds.get_resource('http://example.com/directories/D')['name'], 'D')
+        self.assertFalse(self.ex.get.called)
+
+    def test_only_expansions_of_other_responses_are_cached(self):
+        self.ex.post.return_value = {
+            'account': {'href': self.HREF, 'name': 'Foo'},
+        }
+        self.ds.create_resource('http://example.com/applications/APP/loginAttempts', {})
+
+        self.assertEqual(self.ds.get_resource(self.HREF)['name'], 'Foo')
+        self.assertFalse(self.ex.get.called)
+
+    def test_updated_resource_is_cached_under_its_href(self):
+        self.ex.post.return_value = {'href': self.HREF, 'name': 'Bar'}
+        self.ds.update_resource(self.HREF, {'name': 'Bar'})
+
+        self.assertEqual(self.ds.get_resource(self.HREF)['name'], 'Bar')
+        self.assertFalse(self.ex.get.called)
+
+
+class TestDataStoreMemoryBudget(TestCase):
+
+    def test_regions_share_max_bytes(self):
+        ex = MagicMock()
+        ex.get.side_effect = lambda href, params=None: {'href': href, 'data': 'x' * 1000}
+        ds = DataStore(ex, {'max_bytes': 20000, 'regions': {'groups': {}}})
+
+        for i in range(20):
+            ds.get_resource('http://example.com/accounts/A%d' % i)
+            ds.get_resource('http://example.com/groups/G%d' % i)
+
+        usage = ds.cache_manager.memory_usage
+        self.assertTrue(0 < usage['accounts'] + usage['groups'] <= 20000)
+        self.assertTrue(0 < usage['groups'])
+
+
+class TestDataStoreIndex(TestCase):
+
+    HREF = 'http://example.com/accounts/FOO'
+    DIR = 'http://example.com/directories/D'
+
+    def test_cached_resources_are_indexed(self):
+        ex = MagicMock()
+        ex.get.return_value = {
+            'href': 'http://example.com/directories/D/accounts',
+            'items': [{
+                'href': self.HREF, 'email': 'foo@example.com',
+                'directory': {'href': self.DIR},
+            }],
+        }
+        ds = DataStore(ex, {'index': True})
+
+        ds.get_resource('http://example.com/directories/D/accounts')
+        self.assertEqual(
+            ds.index.get('accounts', 'email', 'foo@example.com', directory=self.DIR),
+            self.HREF)
+
+    def test_no_index_by_default(self):
+        self.assertIsNone(DataStore(MagicMock()).index)
+
+
+class TestDataStoreCachePolicy(TestCase):
+
+    HREF = 'http://example.com/accounts/FOO'
+
+    def setUp(self):
+        self.ex = MagicMock()
+        self.ex.get.return_value = {
+            'href': self.HREF,
+            'name': 'Foo',
+            'directory': {'href': 'http://example.com/directories/DIR', 'name': 'Dir'},
+        }
+        self.ds = DataStore(self.ex)
+
+    def cached(self, href=HREF):
+        return self.ds._get_cache(href).store[href] is not None
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            with self.ds.cache_policy('foo'):
+                pass
+
+    def test_bypass(self):
+        self.ds.get_resource(self.HREF)
+
+        with self.ds.cache_policy('bypass'):
+            self.ds.get_resource(self.HREF)
+            self.ds.get_resource('http://example.com/accounts/BAR')
+
+        self.assertEqual(self.ex.get.call_count, 3)
+        self.assertFalse(self.cached('http://example.com/accounts/BAR'))
+        self.assertIsNone(self.ds.policy)
+
+    def test_read_only(self):
+        with self.ds.cache_policy('read_only'):
+            self.ds.get_resource(self.HREF)
+
+        self.assertFalse(self.cached())
+        self.assertFalse(self.cached('http://example.com/directories/DIR'))
+
+        self.ds.get_resource(self.HREF)
+        with self.ds.cache_policy('read_only'):
+            self.ds.get_resource(self.HREF)
+
+        self.assertEqual(self.ex.get.call_count, 2)
+
+    def test_refresh(self):
+        self.ds.get_resource(self.HREF)
+        self.ex.get.return_value = {'href': self.HREF, 'name': 'New Foo'}
+
+        with self.ds.cache_policy('refresh'):
+            self.assertEqual(self.ds.get_resource(self.HREF)['name'], 'New Foo')
+
+        self.assertEqual(self.ds.get_resource(self.HREF)['name'], 'New Foo')
+        self.assertEqual(self.ex.get.call_count, 2)
+
+    def test_no_admit(self):
+        self.ds.get_resource('http://example.com/directories/DIR')
+        self.ex.get.reset_mock()
+
+        with self.ds.cache_policy('no_admit'):
+            self.ds.get_resource(self.HREF)
+            self.ds.get_resource(self.HREF)
+
+        self.assertEqual(self.ex.get.call_count, 2)
+        self.assertFalse(self.cached())
+        self.assertTrue(self.cached('http://example.com/directories/DIR'))
+
+    def test_writes_update_the_cache(self):
+        self.ex.post.return_value = {'href': self.HREF, 'name': 'Foo'}
+
+        with self.ds.cache_policy('bypass'):
+            self.ds.update_resource(self.HREF, {'name': 'Foo'})
+
+        self.assertTrue(self.cached())
+
+
+if __name__ == '__main__':
+    main()
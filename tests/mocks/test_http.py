@@ -153,9 +153,11 @@ class HttpTest(TestCase):
         ShouldRetry.side_effect = try_four_times
 
         with patch('stormpath.http.HttpExecutor.should_retry', ShouldRetry):
-            with self.assertRaises(Error):
+            with self.assertRaises(Error) as ctx:
                 ex.get('/test')
 
+        self.assertTrue(ctx.exception.connection_error)
+
         should_retry_calls = [
             call(0, request_exception), call(1, request_exception),
             call(2, request_exception), call(3, request_exception),
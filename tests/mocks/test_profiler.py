@@ -0,0 +1,80 @@
+from unittest import TestCase, main
+try:
+    from mock import MagicMock
+except ImportError:
+    from unittest.mock import MagicMock
+
+from stormpath.client import Client
+from stormpath.resources.base import CollectionResource, Resource
+
+
+class Res(Resource):
+    @staticmethod
+    def get_resource_attributes():
+        return {'linked_res': Resource}
+
+
+class ResList(CollectionResource):
+    resource_class = Res
+
+
+class TestProfiler(TestCase):
+
+    def setUp(self):
+        self.client = Client(api_key={'id': 'MyId', 'secret': 'Shush!'})
+        self.ex = MagicMock()
+        self.client.data_store.executor = self.ex
+
+        def get(href, params=None):
+            if href == '/res':
+                return {
+                    'href': '/res', 'offset': 0, 'limit': 25, 'size': 3,
+                    'items': [{'href': '/res/%d' % i, 'linkedRes': {'href': '/linked/%d' % i}} for i in range(3)],
+                }
+
+            return {'href': href, 'name': 'Name of ' + href}
+
+        self.ex.get.side_effect = get
+
+    def test_records_lazy_loads(self):
+        with self.client.profile() as profiler:
+            for r in ResList(self.client, href='/res'):
+                r.linked_res.name
+
+        self.assertEqual(len(profiler.api_calls), 4)
+        self.assertEqual(len(profiler.records), 4)
+
+        record = profiler.records[1]
+        self.assertEqual(record.kind, 'ensure_data')
+        self.assertEqual(record.resource, 'Resource')
+        self.assertEqual(record.href, '/linked/0')
+        self.assertEqual(record.attribute, 'name')
+        self.assertEqual(record.linked_from, 'Res.linked_res')
+        self.assertFalse(record.cached)
+        self.assertTrue(record.stack[-1].endswith('in test_records_lazy_loads'))
+
+        suspects = profiler.suspects
+        self.assertEqual(len(suspects), 1)
+        self.assertEqual(suspects[0][0], 'Res.linked_res')
+        self.assertEqual(suspects[0][2], 3)
+        self.assertIn('Possible N+1: Res.linked_res loaded 3 times', profiler.report())
+
+        self.assertIsNone(self.client.profiler)
+
+    def test_cached_loads(self):
+        Resource(self.client, href='/accounts/A').name
+
+        with self.client.profile(max_api_calls=0) as profiler:
+            Resource(self.client, href='/accounts/A').name
+
+        self.assertTrue(profiler.records[0].cached)
+
+    def test_max_api_calls(self):
+        with self.assertRaises(AssertionError):
+            with self.client.profile(max_api_calls=1):
+                Resource(self.client, href='/linked/0').name
+                Resource(self.client, href='/linked/1').name
+
+
+if __name__ == '__main__':
+    main()
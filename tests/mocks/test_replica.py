@@ -0,0 +1,170 @@
+from unittest import TestCase, main
+try:
+    from mock import MagicMock
+except ImportError:
+    from unittest.mock import MagicMock
+
+from stormpath.client import Client
+from stormpath.error import Error
+from stormpath.replica import Replica
+
+
+BASE = 'https://api.stormpath.com/v1'
+
+
+def account(i, modified_at):
+    href = '%s/accounts/A%d' % (BASE, i)
+    return {
+        'href': href,
+        'email': 'user%d@example.com' % i,
+        'username': 'user%d' % i,
+        'modifiedAt': modified_at,
+        'directory': {'href': BASE + '/directories/D'},
+        'groups': {'href': href + '/groups'},
+        'groupMemberships': {'href': href + '/groupMemberships'},
+    }
+
+
+def group(i, modified_at):
+    href = '%s/groups/G%d' % (BASE, i)
+    return {
+        'href': href,
+        'name': 'group%d' % i,
+        'modifiedAt': modified_at,
+        'accounts': {'href': href + '/accounts'},
+        'accountMemberships': {'href': href + '/accountMemberships'},
+    }
+
+
+def membership(a, g):
+    return {
+        'href': '%s/groupMemberships/M%d%d' % (BASE, a, g),
+        'account': {'href': '%s/accounts/A%d' % (BASE, a)},
+        'group': {'href': '%s/groups/G%d' % (BASE, g)},
+    }
+
+
+class TestReplica(TestCase):
+
+    def setUp(self):
+        self.client = Client(api_key={'id': 'MyId', 'secret': 'Shush!'})
+        self.ex = MagicMock()
+        self.client.data_store.executor = self.ex
+
+        self.collections = {
+            BASE + '/tenants/T/accounts': [account(i, '2015-12-%02dT00:00:00.000Z' % (i + 1)) for i in range(5)],
+            BASE + '/tenants/T/groups': [group(i, '2015-11-01T00:00:00.000Z') for i in range(2)],
+            BASE + '/groups/G0/accountMemberships': [membership(0, 0), membership(1, 0)],
+            BASE + '/groups/G1/accountMemberships': [membership(1, 1)],
+        }
+
+        def get(href, params=None):
+            if href == '/tenants/current':
+                return {
+                    'href': BASE + '/tenants/T',
+                    'accounts': {'href': BASE + '/tenants/T/accounts'},
+                    'groups': {'href': BASE + '/tenants/T/groups'},
+                }
+
+            if href.endswith('/groupMemberships'):
+                account = href.rsplit('/', 1)[0]
+                items = [m for key, ms in sorted(self.collections.items())
+                    if key.endswith('/accountMemberships') for m in ms
+                    if m['account']['href'] == account]
+            else:
+                items = self.collections[href]
+
+            if 'modifiedAt' in params:
+                since = params['modifiedAt'][1:-2]
+                items = [i for i in items if i['modifiedAt'] >= since]
+
+            offset, limit = params['offset'], params['limit']
+            return {
+                'href': href, 'offset': offset, 'limit': limit, 'size': len(items),
+                'items': items[offset:offset + limit],
+            }
+
+        self.ex.get.side_effect = get
+        self.replica = Replica(self.client, page_size=2)
+
+    def test_full_sync(self):
+        self.assertEqual(self.replica.sync(), {'accounts': 5, 'groups': 2, 'memberships': 3})
+
+        self.assertEqual(len(self.replica.accounts), 5)
+        self.assertEqual(len(self.replica.groups), 2)
+
+    def test_resources_are_served_locally(self):
+        self.replica.sync()
+        self.ex.get.reset_mock()
+
+        accounts = self.replica.accounts.search({'email': 'user1@example.com'})
+        self.assertEqual(len(accounts), 1)
+
+        acc = accounts[0]
+        self.assertEqual(acc.username, 'user1')
+        self.assertEqual(sorted(g.name for g in acc.groups), ['group0', 'group1'])
+        self.assertEqual(
+            sorted(a.email for a in self.replica.get_group(BASE + '/groups/G0').accounts),
+            ['user0@example.com', 'user1@example.com'])
+        self.assertEqual(len(acc.group_memberships), 2)
+        self.assertEqual(len(self.replica.accounts.search({'username': 'user*'})), 5)
+
+        self.assertFalse(self.ex.get.called)
+
+    def test_resources_are_read_only(self):
+        self.replica.sync()
+        acc = self.replica.get_account(BASE + '/accounts/A0')
+
+        with self.assertRaises(Error):
+            acc.delete()
+
+        with self.assertRaises(Error):
+            acc.directory.name
+
+    def test_incremental_sync(self):
+        self.replica.sync()
+
+        self.collections[BASE + '/tenants/T/accounts'][0]['email'] = 'new@example.com'
+        self.collections[BASE + '/tenants/T/accounts'][0]['modifiedAt'] = '2016-02-01T00:00:00.000Z'
+        self.collections[BASE + '/groups/G1/accountMemberships'].append(membership(2, 1))
+        self.collections[BASE + '/tenants/T/groups'][1]['modifiedAt'] = '2016-02-01T00:00:00.000Z'
+
+        # The range is inclusive, so the last modified account is fetched
+        # again. Memberships of the modified accounts and groups are fetched.
+        self.assertEqual(self.replica.sync(), {'accounts': 2, 'groups': 1, 'memberships': 3})
+        self.ex.get.assert_any_call(BASE + '/tenants/T/accounts', params={
+            'modifiedAt': '[2015-12-05T00:00:00.000Z,]', 'offset': 0, 'limit': 2})
+
+        self.assertEqual(self.replica.get_account(BASE + '/accounts/A0').email, 'new@example.com')
+        self.assertEqual(len(self.replica.accounts), 5)
+        self.assertEqual(len(self.replica.get_group(BASE + '/groups/G1').accounts), 2)
+
+    def test_incremental_sync_of_account_memberships(self):
+        self.replica.sync()
+
+        self.collections[BASE + '/groups/G0/accountMemberships'].append(membership(3, 0))
+        self.collections[BASE + '/tenants/T/accounts'][3]['modifiedAt'] = '2016-02-01T00:00:00.000Z'
+        self.replica.sync()
+
+        self.assertEqual(
+            [g.name for g in self.replica.get_account(BASE + '/accounts/A3').groups], ['group0'])
+
+    def test_syncs_bypass_the_cache(self):
+        self.replica.sync()
+
+        self.assertEqual(self.client.data_store.cache_manager.stats['accounts'].size, 0)
+
+    def test_search_wildcards(self):
+        self.collections[BASE + '/tenants/T/accounts'].append(dict(
+            account(5, '2015-12-01T00:00:00.000Z'), email='user_5%@example.com'))
+        self.replica.sync()
+
+        search = lambda email: [a.email for a in self.replica.accounts.search({'email': email})]
+        self.assertEqual(search('user_5%@example.com'), ['user_5%@example.com'])
+        self.assertEqual(search('user_@example.com'), [])
+        self.assertEqual(search('user%@example.com'), [])
+        self.assertEqual(len(search('user*')), 6)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import json
+from threading import Thread
 from unittest import TestCase, main
 from datetime import datetime
 from dateutil.tz import tzutc, tzoffset
@@ -11,7 +12,8 @@ except ImportError:
 from stormpath.resources.agent import AgentConfig
 from stormpath.resources.base import (
     AutoSaveMixin, CollectionResource, DeleteMixin, DictMixin, Expansion,
-    FixedAttrsDict, ListOnResource, Resource, SaveMixin
+    ExpansionPlanner, FixedAttrsDict, IdentityMap, ListOnResource, Resource,
+    SaveMixin
 )
 from stormpath.client import Client
 from stormpath.resources.attribute_statement_mapping_rule import (
@@ -42,6 +44,160 @@ class TestExpansion(TestCase):
             p == 'quux(offset:10,limit:5)')
 
 
+class TestExpansionPlanner(TestCase):
+
+    class Res(Resource):
+        @staticmethod
+        def get_resource_attributes():
+            return {'linked_res': Resource}
+
+    class ResList(CollectionResource):
+        pass
+
+    def setUp(self):
+        self.ResList.resource_class = self.Res
+        self.ds = MagicMock()
+        self.planner = ExpansionPlanner(threshold=2)
+        self.client = MagicMock(data_store=self.ds,
+            expansion_planner=self.planner)
+
+    def page(self, offset, expanded=False):
+        items = []
+        for i in range(offset, offset + 2):
+            linked = {'href': 'linked/%d' % i}
+            if expanded:
+                linked['name'] = 'Linked %d' % i
+
+            items.append({'href': 'res/%d' % i, 'linkedRes': linked})
+
+        return {'href': '/', 'offset': offset, 'limit': 2, 'size': 4,
+            'items': items}
+
+    def test_lazy_loads_are_recorded_and_expanded(self):
+        self.ds.get_resource.side_effect = [
+            self.page(0),
+            {'href': 'linked/0', 'name': 'Linked 0'},
+            {'href': 'linked/1', 'name': 'Linked 1'},
+            self.page(2, expanded=True),
+        ]
+
+        names = [r.linked_res.name for r in self.ResList(self.client, href='/')]
+
+        self.assertEqual(names, ['Linked 0', 'Linked 1', 'Linked 2', 'Linked 3'])
+        self.assertEqual(self.ds.get_resource.call_count, 4)
+        self.ds.get_resource.assert_called_with('/', params={
+            'offset': 2, 'limit': 2, 'expand': 'linkedRes'})
+        self.assertEqual(self.planner.report(), {'Res': ['linkedRes']})
+
+    def test_nothing_is_learned_below_threshold(self):
+        self.planner.record(self.Res, 'linked_res')
+
+        self.assertIsNone(self.planner.get_expansion(self.Res))
+        self.assertEqual(self.planner.report(), {})
+
+        self.planner.record(self.Res, 'linked_res')
+        self.assertEqual(self.planner.get_expansion(self.Res).get_params(),
+            'linkedRes')
+
+    def test_planner_is_not_used_when_disabled(self):
+        self.client.expansion_planner = None
+        self.ds.get_resource.return_value = self.page(0)
+
+        rl = self.ResList(self.client, href='/')
+        len(rl)
+
+        self.ds.get_resource.assert_called_once_with('/', params=None)
+
+
+class TestIdentityMap(TestCase):
+
+    class Res(Resource):
+        @staticmethod
+        def get_resource_attributes():
+            return {'linked_res': Resource}
+
+    class ResList(CollectionResource):
+        pass
+
+    def setUp(self):
+        self.ResList.resource_class = self.Res
+        self.ds = MagicMock()
+        self.ds.get_resource.return_value = {
+            'href': '/', 'offset': 0, 'limit': 25, 'size': 2,
+            'items': [
+                {'href': 'res/0', 'linkedRes': {'href': 'linked'}},
+                {'href': 'res/1', 'linkedRes': {'href': 'linked'}},
+            ],
+        }
+        self.identity_map = IdentityMap()
+        self.client = MagicMock(data_store=self.ds,
+            identity_map=self.identity_map)
+
+    def test_resources_are_shared(self):
+        rl = self.ResList(self.client, href='/')
+        items = list(rl)
+
+        self.assertIs(items[0], rl.get('res/0'))
+        self.assertIs(items[0].linked_res, items[1].linked_res)
+        self.assertIsNot(items[0], items[1])
+        self.assertEqual(len(self.identity_map), 3)
+
+    def test_existing_resources_are_updated(self):
+        r = self.ResList(self.client, href='/').get('res/0')
+        self.ResList(self.client, href='/')._set_properties({
+            'items': [{'href': 'res/0', 'name': 'Res 0'}],
+        })
+
+        self.assertEqual(r.__dict__['name'], 'Res 0')
+
+    def test_resources_are_weakly_referenced(self):
+        self.ResList(self.client, href='/').get('res/0')
+
+        self.assertEqual(len(self.identity_map), 0)
+
+    def test_expanded_resources_are_not_shared(self):
+        rl = self.ResList(self.client, href='/')
+
+        self.assertIsNot(rl.get('res/0'), rl.get('res/0', expand=Expansion('linkedRes')))
+
+    def test_identity_map_is_not_used_when_disabled(self):
+        self.client.identity_map = None
+        rl = self.ResList(self.client, href='/')
+
+        self.assertIsNot(rl.get('res/0'), rl.get('res/0'))
+
+    def test_client_identity_map(self):
+        self.assertIsInstance(Client(id='x', secret='y', identity_map=True).identity_map, IdentityMap)
+        self.assertIs(Client(id='x', secret='y', identity_map=self.identity_map).identity_map, self.identity_map)
+        self.assertIsNone(Client(id='x', secret='y').identity_map)
+
+    def test_identity_scope(self):
+        client = Client(id='x', secret='y')
+        client.data_store = self.ds
+        rl = self.ResList(client, href='/')
+
+        with client.identity_scope() as identity_map:
+            r = rl.get('res/0')
+            self.assertIs(client.identity_map, identity_map)
+            self.assertIs(rl.get('res/0'), r)
+
+            with client.identity_scope():
+                self.assertIsNot(rl.get('res/0'), r)
+
+            self.assertIs(rl.get('res/0'), r)
+
+        self.assertIsNone(client.identity_map)
+        self.assertIsNot(rl.get('res/0'), r)
+
+        # Scopes are per thread.
+        seen = []
+        with client.identity_scope():
+            thread = Thread(target=lambda: seen.append(client.identity_map))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [None])
+
+
 class TestCamelCaseConversions(TestCase):
 
     def test_to_camel_case(self):
@@ -250,6 +406,24 @@ class TestBaseResource(TestCase):
         ds.get_resource.assert_called_once_with('test/resource', params=None)
         self.assertEqual(name, 'Test Resource')
 
+    def test_stale_resource(self):
+        ds = MagicMock()
+        ds.get_resource.return_value = {
+            'href': 'test/resource',
+            'name': 'Test Resource',
+            'sp_stale': True,
+        }
+
+        r = Resource(MagicMock(data_store=ds), href='test/resource')
+        self.assertFalse(r.is_stale())
+
+        r.name
+        self.assertTrue(r.is_stale())
+
+        ds.get_resource.return_value = {'href': 'test/resource', 'name': 'Test Resource'}
+        r._ensure_data(overwrite=True)
+        self.assertFalse(r.is_stale())
+
     def test_writable_attributes(self):
 
         class Res(Resource):
@@ -0,0 +1,130 @@
+from threading import current_thread
+from unittest import TestCase, main
+try:
+    from mock import MagicMock
+except ImportError:
+    from unittest.mock import MagicMock
+
+from stormpath.client import Client
+from stormpath.error import Error, UnitOfWorkError
+from stormpath.resources.account import Account
+from stormpath.resources.group import Group
+
+
+class TestUnitOfWork(TestCase):
+
+    ACC = 'https://api.stormpath.com/v1/accounts/ACC'
+    GROUP = 'https://api.stormpath.com/v1/groups/GROUP'
+
+    def setUp(self):
+        self.client = Client(api_key={'id': 'MyId', 'secret': 'Shush!'})
+        self.ex = MagicMock()
+        self.client.data_store.executor = self.ex
+        self.threads = set()
+
+        def post(href, data, params=None):
+            self.threads.add(current_thread().name)
+            return dict(data, href=href)
+
+        self.ex.post.side_effect = post
+
+        self.account = Account(self.client, properties={
+            'href': self.ACC,
+            'givenName': 'Foo',
+            'customData': {'href': self.ACC + '/customData', 'color': 'red'},
+        })
+
+    def posted(self):
+        return sorted(c[0][0] for c in self.ex.post.call_args_list)
+
+    def test_writes_are_collected(self):
+        with self.client.unit_of_work() as uow:
+            self.account.given_name = 'Bar'
+            self.account.save()
+            self.account.custom_data['color'] = 'blue'
+            self.account.save()
+            self.account.add_group(Group(self.client, href=self.GROUP))
+
+            self.assertEqual(len(uow), 3)
+            self.assertFalse(self.ex.post.called)
+
+        self.assertEqual(self.posted(), [
+            self.ACC,
+            self.ACC + '/customData',
+            'https://api.stormpath.com/v1/groupMemberships',
+        ])
+        self.ex.post.assert_any_call(self.ACC + '/customData', {'color': 'blue'})
+        self.assertNotIn(current_thread().name, self.threads)
+
+    def test_saves_are_coalesced_by_href(self):
+        other = Account(self.client, properties={'href': self.ACC, 'givenName': 'Foo'})
+
+        with self.client.unit_of_work() as uow:
+            self.account.given_name = 'Bar'
+            self.account.save()
+            other.given_name = 'Baz'
+            other.save()
+
+            # The account and its custom data.
+            self.assertEqual(len(uow), 2)
+
+        self.assertEqual(self.posted(), [self.ACC, self.ACC + '/customData'])
+        self.ex.post.assert_any_call(self.ACC, {'givenName': 'Baz'})
+
+    def test_deleted_resources_are_not_saved(self):
+        with self.client.unit_of_work():
+            self.account.save()
+            self.account.delete()
+
+        self.assertFalse(self.ex.post.called)
+        self.ex.delete.assert_called_once_with(self.ACC)
+
+    def test_writes_are_discarded_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.client.unit_of_work():
+                self.account.save()
+                raise ValueError()
+
+        self.assertFalse(self.ex.post.called)
+        self.assertIsNone(self.client.data_store.unit_of_work)
+
+    def test_errors_are_raised_together(self):
+        self.ex.post.side_effect = Error({'developerMessage': 'Nope.'}, http_status=400)
+
+        with self.assertRaises(UnitOfWorkError) as ctx:
+            with self.client.unit_of_work():
+                self.account.save()
+                self.account.custom_data.save()
+
+        self.assertEqual(self.ex.post.call_count, 2)
+        self.assertEqual(len(ctx.exception.errors), 2)
+        self.assertEqual(ctx.exception.status, 400)
+
+    def test_single_error_is_raised(self):
+        error = Error({'developerMessage': 'Nope.'}, http_status=400)
+        self.ex.post.side_effect = error
+
+        with self.assertRaises(Error) as ctx:
+            with self.client.unit_of_work():
+                self.account.add_group(Group(self.client, href=self.GROUP))
+
+        self.assertIs(ctx.exception, error)
+
+    def test_deletes_are_skipped_if_a_write_fails(self):
+        self.ex.post.side_effect = Error({'developerMessage': 'Nope.'}, http_status=400)
+        group = Group(self.client, properties={'href': self.GROUP, 'name': 'Foo'})
+
+        with self.assertRaises(Error):
+            with self.client.unit_of_work():
+                self.account.add_group(Group(self.client, href=self.GROUP))
+                group.delete()
+
+        self.assertFalse(self.ex.delete.called)
+
+    def test_add_group_returns_none(self):
+        with self.client.unit_of_work():
+            self.assertIsNone(self.account.add_group(Group(self.client, href=self.GROUP)))
+
+
+if __name__ == '__main__':
+    main()